@@ -1,407 +1,212 @@
+import logging
 import os
-import torch
-from flask import Flask, request, jsonify, render_template, session
+from flask import Flask, Response, request, jsonify, render_template, session
 from flask_socketio import SocketIO, emit
 import eventlet
-import random
+from eventlet import tpool
+from eventlet.semaphore import Semaphore
 import secrets
-import traceback
+import sys
+import time
 from werkzeug.middleware.proxy_fix import ProxyFix
+from backpressure import OWNER, QUEUED, InflightLimit, MessageCoalescer, RateLimiter
+from deadlines import Deadline
+from log_format import configure_logging
+from metrics import REGISTRY, process_rss_bytes
+from rick_config import CONFIG
+from rick_engine import FALLBACKS, RickEngine
+from rick_processor import rickify_response
+from socketio_queue import socketio_queue_options
+
+# Per-request logging is at DEBUG level, so it costs almost nothing unless enabled
+configure_logging(os.environ.get("RICK_LOG_LEVEL", CONFIG["logging"]["level"]),
+                  os.environ.get("RICK_LOG_FORMAT", CONFIG["logging"]["format"]))
+logger = logging.getLogger("rick")
 
-# Create the necessary directory structure
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-MODEL_DIR = os.path.join(BASE_DIR, "model")
-os.makedirs(MODEL_DIR, exist_ok=True)
 
 app = Flask(__name__, template_folder="templates", static_folder="static")
 app.config['SECRET_KEY'] = secrets.token_hex(16)  # Secure secret key
 app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1)  # For proper IP handling behind proxies
 
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet')
+# cluster.py runs several copies of this app behind a sticky router. They share session
+# history through SQLite and send Socket.IO emits through a message queue.
+WORKER_ID = os.environ.get("RICK_WORKER_ID")
+engine_config = CONFIG
+if WORKER_ID is not None:
+    engine_config = dict(CONFIG, sessions=dict(CONFIG["sessions"], backend="sqlite", shared=True))
 
-# Set device
-device = "cuda" if torch.cuda.is_available() else "cpu"
-print(f"Using device: {device}")
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet',
+                    **socketio_queue_options(os.environ.get("RICK_MESSAGE_QUEUE"), BASE_DIR,
+                                             CONFIG["cluster"]["queue_poll_ms"] / 1000.0))
 
-# Global variables for model and tokenizer
-model = None
-tokenizer = None
+# The model, sessions and generation pipeline; this module only adapts it to HTTP and Socket.IO.
+# Nothing is loaded until engine.start_loading() runs in __main__.
+if os.environ.get("RICK_STUB_MODEL") == "1":
+    # Deterministic offline stand-in for load tests and CI
+    from stub_model import StubEngine
 
-# Import rick modules (these will be created in separate files)
-try:
-    print("Attempting to import Rick modules...")
-    from rick_processor import rickify_response
-
-    print("Successfully imported rick_processor")
-
-    from rick_config import CONFIG, RICK_CHARACTER_CONTEXT, FALLBACK_RESPONSES
-
-    print("Successfully imported rick_config")
-
-    print("Rick modules loaded successfully!")
-    RICK_MODULES_LOADED = True
-except ImportError as e:
-    print(f"Error importing Rick modules: {e}")
-    print(f"Current directory: {os.getcwd()}")
-    print(f"Files in directory: {os.listdir('.')}")
-    print("Using basic rickification.")
-    RICK_MODULES_LOADED = False
-
-
-    # Basic fallback rickify function if modules aren't available
-    def rickify_response(text):
-        burps = ["*burp*", "*BURP*", "BURRP", "*hic*"]
-        prefixes = ["Listen, ", "Look, ", "Morty, ", ""]
-
-        if random.random() < 0.3:
-            text = f"{random.choice(burps)} {text}"
-        if random.random() < 0.4:
-            text = f"{random.choice(prefixes)}{text}"
-        if random.random() < 0.2:
-            text = text.replace("I ", "I-I-I ")
-
-        return text
-
-
-def download_model():
+    engine = StubEngine(engine_config, base_dir=BASE_DIR)
+else:
+    engine = RickEngine(engine_config, base_dir=BASE_DIR)
+
+# Web-layer metrics; the engine records the per-stage ones
+REQUEST_SECONDS = REGISTRY.histogram("rick_request_seconds", "End-to-end response time by endpoint")
+TIME_TO_FIRST_CHUNK = REGISTRY.histogram("rick_time_to_first_chunk_seconds",
+                                         "Time from receiving a socket message to sending the first reply text")
+INFLIGHT = REGISTRY.gauge("rick_inflight_generations", "Generations currently running or waiting for a slot")
+REJECTED = REGISTRY.counter("rick_rejected_messages_total", "Messages answered with busy instead of a reply, by reason")
+COALESCED = REGISTRY.counter("rick_coalesced_messages_total",
+                             "Messages answered together with other messages from the same session")
+REGISTRY.callback("rick_process_resident_memory_bytes", "Resident memory of the server process", process_rss_bytes)
+
+# Limit how many generations run at once; each one occupies a native worker thread
+USE_WORKER_THREADS = CONFIG["inference"]["use_worker_threads"]
+MAX_CONCURRENT_GENERATIONS = CONFIG["inference"]["max_concurrent_generations"]
+generation_slots = Semaphore(MAX_CONCURRENT_GENERATIONS)
+if USE_WORKER_THREADS:
+    tpool.set_num_threads(MAX_CONCURRENT_GENERATIONS)
+
+# Messages waiting for a slot count towards the backlog that switches the engine into degraded mode
+if engine.degraded_mode is not None:
+    engine.degraded_mode.watch(lambda: max(0, int(INFLIGHT.value()) - MAX_CONCURRENT_GENERATIONS))
+
+REQUEST_TIMEOUT = CONFIG["deadlines"]["request_timeout"]
+
+# Flood protection: per-session and per-IP message rates, merging of a session's rapid-fire
+# messages, and a bound on generations running or waiting for a slot
+BACKPRESSURE = CONFIG["backpressure"]
+session_limiter = RateLimiter(BACKPRESSURE["session_rate"], BACKPRESSURE["session_burst"],
+                              max_keys=BACKPRESSURE["max_tracked_clients"])
+ip_limiter = RateLimiter(BACKPRESSURE["ip_rate"], BACKPRESSURE["ip_burst"],
+                         max_keys=BACKPRESSURE["max_tracked_clients"])
+coalescer = MessageCoalescer(window=BACKPRESSURE["coalesce_window_ms"] / 1000.0,
+                             max_messages=BACKPRESSURE["max_coalesced_messages"], sleep=eventlet.sleep)
+inflight_limit = InflightLimit(BACKPRESSURE["max_inflight"])
+REGISTRY.callback("rick_coalesced_pending", "Messages waiting to be answered with their session's next generation",
+                  coalescer.pending)
+
+# Deadlines of the messages each Socket.IO client is waiting on, cancelled if it disconnects
+socket_deadlines = {}
+
+
+def request_deadline(data):
     """
-    Download a better model for offline chat.
-    Options:
-    - "facebook/blenderbot-400M-distill" (good balance of quality and size)
-    - "facebook/blenderbot-1B-distill" (better but larger)
-    - "microsoft/DialoGPT-medium" (if you want to stay with DialoGPT family)
-    - "meta-llama/Llama-2-7b-chat-hf" (with Hugging Face access token)
+    Deadline for a chat message: the configured timeout, or less if the client asks
+    for it with "timeout_ms". None if deadlines are disabled.
     """
-    from transformers import AutoModelForSeq2SeqLM, AutoTokenizer, BlenderbotTokenizer
+    timeout = REQUEST_TIMEOUT
+    requested = data.get("timeout_ms") if isinstance(data, dict) else None
+    if isinstance(requested, (int, float)) and requested > 0:
+        timeout = min(timeout, requested / 1000.0) if timeout else requested / 1000.0
+    return Deadline(timeout) if timeout else None
 
-    global model, tokenizer
 
-    # Get model name from config if available, otherwise use default
-    if RICK_MODULES_LOADED:
-        MODEL_NAME = CONFIG["model"]["name"]
-    else:
-        MODEL_NAME = "facebook/blenderbot-1B-distill"
-
-    print(f"Downloading model {MODEL_NAME} to {MODEL_DIR}...")
-
-    # Download and save tokenizer
-    tokenizer = BlenderbotTokenizer.from_pretrained(MODEL_NAME)
-    tokenizer.save_pretrained(MODEL_DIR)
-    print("Tokenizer saved successfully!")
+def busy(reason, retry_after=None, count=1):
+    """The reply for messages turned away by a limit"""
+    REJECTED.inc(count, reason=reason)
+    payload = {"type": "busy", "reason": reason}
+    if retry_after:
+        payload["retry_after"] = round(retry_after, 2)
+    return payload
 
-    # Download and save model
-    model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_NAME)
-    model.save_pretrained(MODEL_DIR)
-    print("Model saved successfully!")
 
-
-def load_local_model():
+def client_session(session_id):
     """
-    Load the model from local directory.
+    Key for a session's rate limit and coalescing: the session id scoped to the client IP,
+    since clients that don't send one all share "default"
     """
-    from transformers import AutoModelForSeq2SeqLM, BlenderbotTokenizer
+    # ProxyFix has already replaced remote_addr with the client address from X-Forwarded-For
+    return f"{request.remote_addr} {session_id}"
 
-    global model, tokenizer
 
-    print(f"Loading model from {MODEL_DIR}...")
+def rate_limited(session_id):
+    """A busy reply if the client's IP or session is sending too fast, else None"""
+    wait = ip_limiter.allow(request.remote_addr)
+    if wait:
+        return busy("ip_rate", wait)
+    wait = session_limiter.allow(client_session(session_id))
+    if wait:
+        return busy("session_rate", wait)
+    return None
 
-    # Load tokenizer and model matching the model type
-    tokenizer = BlenderbotTokenizer.from_pretrained(MODEL_DIR)
-    model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_DIR)
-    model.to(device)
 
-    print("Model loaded successfully!")
+def acquire_slot(deadline):
+    """Wait for a generation slot, but no longer than the deadline; returns whether one was acquired"""
+    return generation_slots.acquire(timeout=None if deadline is None else deadline.remaining())
 
 
-# Check if model exists, download if not
-if not os.path.exists(os.path.join(MODEL_DIR, "pytorch_model.bin")):
-    try:
-        download_model()
-    except Exception as e:
-        print(f"Error downloading model: {e}")
-        print("Please ensure you have internet connection for the first run or download the model manually.")
-        import sys
-
-        sys.exit(1)
-else:
-    load_local_model()
-
-# Store conversation history as a dict of sessions
-conversation_history = {}
+def off_hub(fn, *args):
+    """Call a blocking engine function in a native worker thread so the eventlet hub keeps serving"""
+    if USE_WORKER_THREADS:
+        return tpool.execute(fn, *args)
+    return fn(*args)
 
 
-# Function to create improved responses with context awareness
-def get_adaptive_parameters(user_input):
+def run_inference(user_input, session_id="default", deadline=None):
     """
-    Adjust generation parameters based on question type for better responses
+    Run engine.generate off the eventlet hub.
+    model.generate is CPU-bound native code, so it runs in a native worker thread while
+    the hub keeps serving other sockets and routes. Waits for a free slot if too many
+    generations are already running; if the deadline passes first, the reply is a themed
+    one from the response tables. In degraded mode the reply comes straight from the
+    response tables too, without waiting for a slot.
     """
-    if not RICK_MODULES_LOADED:
-        # Default parameters if rick_config is not available
-        return {
-            "max_length": 150,
-            "min_length": 20,
-            "temperature": 0.85,
-            "top_p": 0.92,
-            "num_beams": 4,
-            "repetition_penalty": 1.2,
-            "no_repeat_ngram_size": 2
-        }
-
-    user_input = user_input.lower()
-
-    # Detect question types
-    is_scientific = any(word in user_input for word in
-                        ['science', 'physics', 'dimension', 'universe', 'theory', 'quantum',
-                         'technology', 'portal', 'invention', 'experiment'])
-
-    is_personal = any(word in user_input for word in
-                      ['you', 'your', 'feel', 'think', 'opinion', 'morty', 'family',
-                       'beth', 'jerry', 'summer', 'citadel', 'council', 'enemy'])
-
-    is_philosophical = any(word in user_input for word in
-                           ['meaning', 'life', 'purpose', 'existence', 'universe', 'god',
-                            'reality', 'consciousness', 'soul', 'morality'])
-
-    # Get base parameters
-    params = CONFIG["model"]["default_params"].copy()
-
-    # Adjust parameters based on question type
-    if is_scientific:
-        # More coherent and detailed for scientific topics
-        params.update({
-            "max_length": 200,
-            "min_length": 50,
-            "temperature": 0.7,
-            "top_p": 0.92,
-            "num_beams": 5,
-            "repetition_penalty": 1.2,
-            "length_penalty": 1.0
-        })
-    elif is_personal:
-        # More creative and erratic for personal questions
-        params.update({
-            "max_length": 150,
-            "min_length": 30,
-            "temperature": 0.9,
-            "top_p": 0.95,
-            "num_beams": 3,
-            "repetition_penalty": 1.3,
-            "length_penalty": 0.8
-        })
-    elif is_philosophical:
-        # More nihilistic and weird for philosophical questions
-        params.update({
-            "max_length": 175,
-            "min_length": 40,
-            "temperature": 0.85,
-            "top_p": 0.97,
-            "num_beams": 3,
-            "repetition_penalty": 1.1,
-            "length_penalty": 1.2
-        })
-
-    return params
-
-
-def improve_response_quality(response, user_input):
-    """Apply additional preprocessing to improve response quality"""
-
-    # Skip processing if response is too short
-    if not response or len(response) < 5:
-        return "Look, I'm too busy for this. Ask something that requires my genius brain."
-
-    # Remove generic/templated phrases that don't sound like Rick
-    generic_phrases = [
-        "I'm here to help",
-        "I'd be happy to",
-        "As an AI",
-        "I don't have personal",
-        "I cannot",
-        "I don't have the ability",
-        "As a language model"
-    ]
-
-    for phrase in generic_phrases:
-        if phrase in response:
-            response = response.replace(phrase, "")
-
-    # Add science references for science questions
-    if any(word in user_input.lower() for word in ['how', 'why', 'what', 'explain']):
-        if not any(term in response.lower() for term in ['dimension', 'science', 'quantum', 'portal']):
-            science_terms = [
-                "interdimensional",
-                "quantum",
-                "multiverse",
-                "temporal",
-                "subatomic",
-                "molecular",
-                "neural",
-                "galactic"
-            ]
-            if len(response) > 0:
-                term = random.choice(science_terms)
-                sentence_end = response.find('.')
-                if sentence_end > 0:
-                    response = response[:sentence_end] + f". It's basic {term} physics, really." + response[
-                                                                                                   sentence_end + 1:]
-
-    # Clean up response
-    response = response.strip()
-
-    # Ensure we have something to return
-    if not response or len(response.split()) < 3:
-        return "Look, I'm too busy for this. Ask something that requires my genius brain."
-
-    return response
-
-
-# The main AI response generation function
-# Update this part of the get_ai_response function to handle the context length properly:
-
-def get_ai_response(user_input, session_id="default"):
-    """Generate an AI response that sounds like Rick from Rick and Morty"""
-
-    # Debug info
-    print(f"Processing input: '{user_input}' for session '{session_id}'")
-
-    # Initialize conversation history for this session if it doesn't exist
-    if session_id not in conversation_history:
-        conversation_history[session_id] = []
-        print(f"Created new conversation history for session '{session_id}'")
-
-    # Get max_turns from config if available, otherwise use default
-    max_turns = CONFIG["conversation"]["max_turns"] if RICK_MODULES_LOADED else 5
-
-    # Add the new user input to the history
-    if len(conversation_history[session_id]) >= max_turns:
-        conversation_history[session_id].pop(0)
-    conversation_history[session_id].append(user_input)
-
-    # Use direct rickification for very short inputs to avoid model issues
-    if len(user_input.split()) <= 3 and not any(word in user_input.lower() for word in
-                                                ['why', 'how', 'what', 'when', 'where', 'explain']):
-        simple_responses = [
-            "Yeah, whatever.",
-            "Is that all you've got to say?",
-            "Fascinating conversation skills you got there.",
-            "Oh great, another genius with vocabulary issues.",
-            "Keep it coming, Einstein.",
-            "That's your brilliant contribution?",
-            "Wow, profound stuff right there.",
-            "I'm blown away by your eloquence.",
-        ]
-        response = random.choice(simple_responses)
-        return rickify_response(response)
-
+    if engine.degraded():
+        return engine.degraded_reply(session_id, user_input)
+    INFLIGHT.inc()
+    acquired = False
     try:
-        # First try with minimal context to avoid embedding size issues
-        try:
-            # Just use a simple prompt with the question
-            simple_context = f"As Rick Sanchez from Rick and Morty, respond to: {user_input}"
-
-            print(f"Trying simple context approach: {simple_context}")
-
-            # Format input for model
-            inputs = tokenizer(simple_context,
-                               return_tensors="pt",
-                               max_length=128,  # Limit context length
-                               truncation=True).to(device)
-
-            # Simple default parameters
-            params = {
-                "max_length": 100,
-                "min_length": 20,
-                "do_sample": True,  # Enable sampling
-                "temperature": 0.9,
-                "top_p": 0.92,
-                "num_beams": 4,
-                "repetition_penalty": 1.2,
-                "no_repeat_ngram_size": 2,
-            }
-
-            # Generate response
-            print("Generating response with simple context...")
-            with torch.no_grad():
-                outputs = model.generate(
-                    **inputs,
-                    **params
-                )
-
-            # Decode the generated response
-            response = tokenizer.decode(outputs[0], skip_special_tokens=True)
-            print(f"Generated response: {response[:100]}...")
-
-        except Exception as e:
-            print(f"Simple context approach failed: {str(e)}")
-
-            # Fall back to predetermined responses for different question types
-            print("Falling back to themed responses...")
-
-            # Categorize the question
-            question_lower = user_input.lower()
-
-            if any(word in question_lower for word in ['universe', 'dimension', 'portal', 'space', 'time']):
-                themed_responses = [
-                    "The multiverse is infinitely complex. Your human brain couldn't comprehend it.",
-                    "Dimensions are like TV channels, except every channel has a different version of you that's slightly less pathetic.",
-                    "Time and space are just constructs. I've been to places where time runs backwards and pizza eats people.",
-                    "My portal gun lets me travel anywhere in the multiverse. It's powered by crystallized quantum energy, something you'll never understand.",
-                ]
-                response = random.choice(themed_responses)
-
-            elif any(word in question_lower for word in ['science', 'physics', 'chemistry', 'biology', 'math']):
-                themed_responses = [
-                    "Science isn't about asking stupid questions, it's about questioning stupid answers.",
-                    "Your understanding of physics is like a toddler trying to understand calculus.",
-                    "I've synthesized chemicals that would make your brain explode just by looking at them.",
-                    "Math is the universal language. Too bad you're speaking baby talk.",
-                ]
-                response = random.choice(themed_responses)
-
-            elif any(word in question_lower for word in ['morty', 'family', 'beth', 'summer', 'jerry']):
-                themed_responses = [
-                    "Morty's a good kid, but sometimes his stupidity makes me want to move to another dimension.",
-                    "My family? They're the reason I drink. Well, one of the reasons.",
-                    "Beth's my daughter. She's almost as smart as me, but wasted her potential cutting up horses.",
-                    "Jerry is the human equivalent of a participation trophy.",
-                    "Summer's alright. At least she doesn't follow me around like a lost puppy like Morty.",
-                ]
-                response = random.choice(themed_responses)
-
-            else:
-                themed_responses = [
-                    "I've seen things that would make your brain melt.",
-                    "That's the kind of question that gets people killed in dimension C-137.",
-                    "I could explain it to you, but you'd need at least 15 more IQ points to understand.",
-                    "I don't have time for this. I've got experiments running in the garage.",
-                    "In an infinite multiverse, there's a version of me that cares about this question. I'm not that version.",
-                ]
-                response = random.choice(themed_responses)
-
-        # Improve the response quality
-        response = improve_response_quality(response, user_input)
-
-        # Rickify the response
-        print("Rickifying response...")
-        response = rickify_response(response)
-        print(f"Final response: {response[:100]}...")
-
-        # Clear CUDA cache if using GPU
-        if device == "cuda":
-            torch.cuda.empty_cache()
+        acquired = acquire_slot(deadline)
+        if not acquired:
+            return engine.table_reply(session_id, user_input, deadline.reason)
+        return off_hub(engine.generate, session_id, user_input, deadline)
+    finally:
+        if acquired:
+            generation_slots.release()
+        INFLIGHT.dec()
+
 
+def stream_inference(user_input, session_id, send_chunk, deadline=None):
+    """
+    Pass each sentence from engine.stream to `send_chunk` as soon as it's ready.
+    Every step of the stream runs in the worker pool, so the hub never blocks on the model.
+    Stops early if the deadline is cancelled. Returns the full response.
+    """
+    if engine.degraded():
+        response = engine.degraded_reply(session_id, user_input)
+        send_chunk(response)
         return response
-    except Exception as e:
-        print(f"Error in model inference: {str(e)}")
-        print(traceback.format_exc())  # Print full stack trace
-        if RICK_MODULES_LOADED:
-            fallback = random.choice(FALLBACK_RESPONSES)
-            print(f"Using fallback response: {fallback}")
-            return rickify_response(fallback)
-        else:
-            fallback = "I'm having trouble processing that. Could we try a different conversation?"
-            print(f"Using basic fallback response: {fallback}")
-            return rickify_response(fallback)
+    parts = []
+    chunks = None
+    INFLIGHT.inc()
+    acquired = False
+    try:
+        acquired = acquire_slot(deadline)
+        if not acquired:
+            response = engine.table_reply(session_id, user_input, deadline.reason)
+            send_chunk(response)
+            return response
+        chunks = engine.stream(session_id, user_input, deadline)
+        while deadline is None or not deadline.cancelled:
+            chunk = off_hub(next, chunks, None)
+            if chunk is None:
+                break
+            parts.append(chunk)
+            send_chunk(chunk)
+    finally:
+        if chunks is not None:
+            chunks.close()
+        if acquired:
+            generation_slots.release()
+        INFLIGHT.dec()
+    return " ".join(parts)
+
+
+def record_time_to_first_chunk(elapsed, session_id):
+    """Record how long the client waited for the first piece of a reply"""
+    TIME_TO_FIRST_CHUNK.observe(elapsed)
+    logger.debug("First chunk sent", extra={"session": session_id, "first_chunk_ms": round(elapsed * 1000, 1)})
 
 
 @app.route("/")
@@ -409,6 +214,25 @@ def index():
     return render_template("chat.html")
 
 
+@app.route("/healthz")
+def healthz():
+    """Liveness: the server is up; includes model loading progress"""
+    return jsonify({"status": "ok", "worker": WORKER_ID, "model": engine.status})
+
+
+@app.route("/readyz")
+def readyz():
+    """Readiness: 200 once the model can serve requests, 503 while it's still loading"""
+    status_code = 200 if engine.ready() else 503
+    return jsonify({"ready": engine.ready(), "model": engine.status}), status_code
+
+
+@app.route("/metrics")
+def metrics():
+    """Prometheus text exposition of latency, token, session, fallback and cache metrics"""
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/chat", methods=["POST"])
 def chat():
     user_input = request.json.get("message")
@@ -417,7 +241,17 @@ def chat():
     if not user_input:
         return jsonify({"error": "No message provided"}), 400
 
-    ai_response = get_ai_response(user_input, session_id)
+    limited = rate_limited(session_id)
+    if limited is None and not inflight_limit.acquire():
+        limited = busy("overloaded")
+    if limited is not None:
+        status_code = 503 if limited["reason"] == "overloaded" else 429
+        return jsonify(limited), status_code, {"Retry-After": str(max(1, round(limited.get("retry_after", 1))))}
+    try:
+        with REQUEST_SECONDS.time(endpoint="chat"):
+            ai_response = run_inference(user_input, session_id, request_deadline(request.json))
+    finally:
+        inflight_limit.release()
     return jsonify({"response": ai_response})
 
 
@@ -431,34 +265,117 @@ def handle_message(data):
         message = data.get("message", "")
         session_id = data.get("session_id", "default")
 
-    print(f"Received socket message: '{message}' for session '{session_id}'")
+    logger.debug("Received socket message: %r", message, extra={"session": session_id})
+    received_at = time.monotonic()
+
+    limited = rate_limited(session_id)
+    if limited is not None:
+        emit("response", limited)
+        return
+
+    # One handler at a time answers a session; messages arriving meanwhile join its next round
+    key = client_session(session_id)
+    joined = coalescer.add(key, message)
+    if joined != OWNER:
+        if joined == QUEUED:
+            COALESCED.inc()
+            emit("response", {"type": "queued"})
+        else:
+            emit("response", busy("session_backlog"))
+        return
 
+    try:
+        while True:
+            messages = coalescer.take(key)
+            if messages is None:
+                break
+            if not inflight_limit.acquire():
+                # Turn away this round and everything queued behind it
+                messages += coalescer.release(key)
+                emit("response", busy("overloaded", count=len(messages)))
+                break
+            try:
+                delivered = answer_message(" ".join(messages), session_id, data, received_at)
+            finally:
+                inflight_limit.release()
+            if not delivered:
+                break
+            received_at = time.monotonic()
+    finally:
+        # Anything still queued here was for a client that has gone
+        dropped = coalescer.release(key)
+        if dropped:
+            logger.debug("Dropping queued messages", extra={"session": session_id, "messages": len(dropped)})
+
+
+def answer_message(message, session_id, data, received_at):
+    """Generate and emit the reply to one (possibly coalesced) message; False if the client has gone"""
+    deadline = request_deadline(data)
+    sid = request.sid
+    if deadline is not None:
+        socket_deadlines.setdefault(sid, set()).add(deadline)
     emit("response", {"type": "typing"}, broadcast=False)
 
-    # Add a random delay to make it seem more natural
-    typing_delay = len(message) * 0.03  # ~30ms per character
-    typing_delay = min(max(typing_delay, 0.5), 2.5)  # Between 0.5 and 2.5 seconds
-    print(f"Waiting {typing_delay} seconds for typing effect...")
-    eventlet.sleep(typing_delay)
+    if not engine.streaming_enabled:
+        # Add a random delay to make it seem more natural
+        typing_delay = len(message) * 0.03  # ~30ms per character
+        typing_delay = min(max(typing_delay, 0.5), 2.5)  # Between 0.5 and 2.5 seconds
+        logger.debug("Waiting %.2f seconds for typing effect...", typing_delay)
+        eventlet.sleep(typing_delay)
+
+    streamed = []
+
+    def send_chunk(text):
+        if not streamed:
+            record_time_to_first_chunk(time.monotonic() - received_at, session_id)
+        streamed.append(text)
+        emit("response", {"type": "chunk", "text": text})
 
     # Generate response
     try:
-        ai_response = get_ai_response(message, session_id)
-        print(f"Sending response: '{ai_response[:100]}...'")
+        if engine.streaming_enabled:
+            ai_response = stream_inference(message, session_id, send_chunk, deadline)
+        else:
+            ai_response = run_inference(message, session_id, deadline)
+            record_time_to_first_chunk(time.monotonic() - received_at, session_id)
+        logger.debug("Sending response: %.100s...", ai_response)
     except Exception as e:
-        print(f"Error generating response: {str(e)}")
-        print(traceback.format_exc())
+        logger.exception("Error generating response: %s", e, extra={"session": session_id})
+        FALLBACKS.inc(reason="inference_error")
         ai_response = rickify_response("I'm having trouble processing that right now. Could you try again?")
-
-    emit("response", {"type": "message", "text": ai_response})
+    finally:
+        if deadline is not None:
+            pending = socket_deadlines.get(sid)
+            if pending is not None:
+                pending.discard(deadline)
+                if not pending:
+                    del socket_deadlines[sid]
+
+    if deadline is not None and deadline.cancelled:
+        logger.debug("Client disconnected, dropping the reply", extra={"session": session_id, "sid": sid})
+        return False
+
+    # The final message carries the complete text so clients can replace the streamed chunks
+    emit("response", {"type": "message", "text": ai_response, "streamed": bool(streamed)})
+    elapsed = time.monotonic() - received_at
+    REQUEST_SECONDS.observe(elapsed, endpoint="socket")
+    logger.debug("Reply sent", extra={"session": session_id, "request_ms": round(elapsed * 1000, 1),
+                                      "chunks": len(streamed)})
+    return True
+
+
+@socketio.on("disconnect")
+def handle_disconnect():
+    # Stop generating for a client that's gone
+    for deadline in socket_deadlines.pop(request.sid, ()):
+        deadline.cancel()
 
 
 @app.route("/clear_history", methods=["POST"])
 def clear_history():
     session_id = request.json.get("session_id", "default")
-    print(f"Clearing history for session '{session_id}'")
-    if session_id in conversation_history:
-        conversation_history[session_id] = []
+    logger.debug("Clearing history", extra={"session": session_id})
+    engine.clear(session_id)
     return jsonify({"status": "success"})
 
 
@@ -473,5 +390,15 @@ def server_error(e):
 
 
 if __name__ == "__main__":
-    print(f"Starting server with Rick modules {'loaded' if RICK_MODULES_LOADED else 'not loaded'}")
-    socketio.run(app, debug=True, host="0.0.0.0", port=5000)
\ No newline at end of file
+    logger.info("Starting server")
+
+    # "background" binds the port right away; "blocking" loads the model before serving
+    loading_mode = os.environ.get("RICK_MODEL_LOADING", CONFIG["startup"]["model_loading"])
+    debug = os.environ.get("RICK_DEBUG", "1") != "0"
+
+    # With the debug reloader only the child process serves requests, so only it loads the model
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        if not engine.start_loading(background=loading_mode != "blocking"):
+            sys.exit(1)
+
+    socketio.run(app, debug=debug, host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
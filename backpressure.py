@@ -0,0 +1,136 @@
+"""
+Flood protection for chat messages.
+
+- RateLimiter: a token bucket per key (session id or client IP). Each
+  message takes a token; tokens refill at `rate` per second up to `burst`.
+  Buckets are kept for the most recently seen keys only.
+- MessageCoalescer: messages a session sends while its previous reply is
+  still being generated (or within a short window) are merged into one
+  generation instead of each queueing their own.
+- InflightLimit: a bound on generations running or waiting for a slot, so
+  the backlog can't grow without limit.
+
+Everything here is bookkeeping under a lock, no I/O, so it's cheap enough
+to run on the eventlet hub for every message. Limits are per process; in
+cluster mode the sticky router keeps a session on one worker, but a client
+IP's budget is per worker.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+# MessageCoalescer.add() results
+OWNER = "owner"
+QUEUED = "queued"
+FULL = "full"
+
+
+class RateLimiter:
+    """Token buckets keyed by session id or client IP; the least recently seen keys are forgotten first"""
+
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        # key -> [tokens, updated_at]
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def allow(self, key, now=None):
+        """Take a token for `key`; returns 0.0 if allowed, else seconds until a token is available"""
+        if not self.rate:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(self.burst), now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(float(self.burst), bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1.0:
+                bucket[0] -= 1.0
+                return 0.0
+            return (1.0 - bucket[0]) / self.rate
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class MessageCoalescer:
+    """
+    Merges rapid-fire messages from one session into one generation.
+
+    The first message from an idle session makes its handler the session's owner.
+    Messages arriving while the owner waits out `window` or generates a reply are
+    queued, and the owner answers them all together in its next round. Up to
+    `max_messages` are queued at a time; add() returns FULL beyond that.
+    """
+
+    def __init__(self, window=0.0, max_messages=5, sleep=time.sleep):
+        self.window = window
+        self.max_messages = max_messages
+        self.sleep = sleep
+        # Sessions with an owner -> messages waiting for its next round
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def add(self, key, message):
+        """OWNER if the caller should answer `key`'s messages (call take() until it returns None), else QUEUED/FULL"""
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is None:
+                self._pending[key] = [message]
+                return OWNER
+            if len(pending) >= self.max_messages:
+                return FULL
+            pending.append(message)
+            return QUEUED
+
+    def take(self, key):
+        """
+        The owner's next round: the session's waiting messages, after `window` for more to
+        arrive. Returns None, and gives up ownership, once there are none left.
+        """
+        if self.window:
+            self.sleep(self.window)
+        with self._lock:
+            messages = self._pending.get(key)
+            if not messages:
+                self._pending.pop(key, None)
+                return None
+            self._pending[key] = []
+            return messages
+
+    def release(self, key):
+        """Give up ownership and drop whatever is still waiting; returns the dropped messages"""
+        with self._lock:
+            return self._pending.pop(key, None) or []
+
+    def pending(self):
+        """Messages waiting across all sessions"""
+        with self._lock:
+            return sum(len(messages) for messages in self._pending.values())
+
+
+class InflightLimit:
+    """Count of generations running or waiting for a slot, refusing new ones past `limit` (0 = unbounded)"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self.limit and self.count >= self.limit:
+                return False
+            self.count += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.count -= 1
@@ -0,0 +1,164 @@
+"""
+Batch rickification for corpora, outside the web app.
+
+Streams text through improve_response_quality + rickify_response on a
+process pool. Input is read lazily in chunks, at most a few chunks per
+worker are in flight, and results are written in input order as soon as
+the oldest chunk is done, so memory stays flat however large the input is.
+
+Each chunk gets its own RickPersonality seeded from the run seed and the
+chunk's position, so a seeded run gives the same output whatever the number
+of workers.
+
+Input formats:
+- text: one response per line (empty lines pass through unchanged)
+- jsonl: one object per line; the response is read from --field, the
+  optional user message (for the science asides) from --input-field, and
+  the result is written to --output-field
+
+Library use:
+    from batch_rickify import rickify_corpus
+    for line in rickify_corpus(open("replies.txt"), workers=8, seed=0):
+        ...
+
+Usage:
+    python batch_rickify.py replies.txt -o rick.txt [--workers 8] [--seed 0]
+    python batch_rickify.py data.jsonl --format jsonl --field reply -o out.jsonl
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from rick_processor import RickPersonality, improve_response_quality, rickify_response
+
+
+def rickify_text(response, user_input="", personality=None, improve=True):
+    """The chat's post-processing for one raw response: clean it up, then rickify it"""
+    if personality is None:
+        personality = RickPersonality()
+    if improve:
+        response = improve_response_quality(response, user_input, personality.rng)
+    return rickify_response(response, personality)
+
+
+def _rickify_chunk(task):
+    """Process-pool worker: rickify one chunk of (response, user_input) pairs"""
+    chunk, seed, improve = task
+    personality = RickPersonality(seed=seed)
+    return [rickify_text(response, user_input, personality, improve) if response.strip() else response
+            for response, user_input in chunk]
+
+
+def _chunks(items, size):
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def rickify_pairs(pairs, workers=None, chunk_size=256, seed=None, improve=True, max_pending=None):
+    """
+    Rickify an iterable of (response, user_input) pairs on a process pool, yielding the
+    results in input order. With a seed, chunk i uses RickPersonality(seed=f"{seed}:{i}").
+    At most `max_pending` chunks (default 2 per worker) are queued at once.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * workers
+    tasks = ((chunk, None if seed is None else f"{seed}:{index}", improve)
+             for index, chunk in enumerate(_chunks(pairs, chunk_size)))
+
+    if workers == 1:
+        # No pool to pay for; same chunking and seeds, so output matches a pooled run
+        for task in tasks:
+            yield from _rickify_chunk(task)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.submit(_rickify_chunk, task))
+            if len(pending) >= max_pending:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def rickify_corpus(lines, **options):
+    """Rickify an iterable of text lines (one response per line); yields one result per line"""
+    return rickify_pairs(((line.rstrip("\r\n"), "") for line in lines), **options)
+
+
+def _read_jsonl(lines, field, input_field, records):
+    """(response, user_input) pairs from JSONL lines; the parsed objects are queued in `records`"""
+    for line in lines:
+        record = json.loads(line)
+        records.append(record)
+        yield str(record.get(field) or ""), str(record.get(input_field) or "") if input_field else ""
+
+
+def run(input_file, output_file, input_format="text", field="text", input_field=None, output_field="rick",
+        progress_every=10.0, **options):
+    """Rickify a file into another, reporting progress to stderr; returns (lines, seconds)"""
+    started = time.perf_counter()
+    last_report = started
+    count = 0
+
+    if input_format == "jsonl":
+        # Records wait here until their result comes back, bounded by the in-flight chunks
+        records = deque()
+        lines = (line for line in input_file if line.strip())
+        results = rickify_pairs(_read_jsonl(lines, field, input_field, records), **options)
+        output = (json.dumps(dict(records.popleft(), **{output_field: result}), ensure_ascii=False)
+                  for result in results)
+    else:
+        output = rickify_corpus(input_file, **options)
+
+    for text in output:
+        output_file.write(text + "\n")
+        count += 1
+        now = time.perf_counter()
+        if progress_every and now - last_report >= progress_every:
+            last_report = now
+            print(f"{count:,} lines, {count / (now - started):,.0f} lines/s", file=sys.stderr)
+
+    return count, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="Input file, or - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="Output file, or - for stdout")
+    parser.add_argument("--format", choices=["text", "jsonl"], default="text")
+    parser.add_argument("--field", default="text", help="JSONL field holding the response")
+    parser.add_argument("--input-field", help="JSONL field holding the user message, if any")
+    parser.add_argument("--output-field", default="rick", help="JSONL field to write the result to")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--seed", help="Seed for reproducible output")
+    parser.add_argument("--no-improve", action="store_true", help="Only rickify; skip improve_response_quality")
+    args = parser.parse_args()
+
+    input_file = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    output_file = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        count, elapsed = run(input_file, output_file, args.format, args.field, args.input_field, args.output_field,
+                             workers=args.workers, chunk_size=args.chunk_size, seed=args.seed,
+                             improve=not args.no_improve)
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+    print(f"Rickified {count:,} lines in {elapsed:.1f} s ({count / elapsed if elapsed else 0:,.0f} lines/s, "
+          f"{args.workers} workers)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Micro-batching scheduler for model inference.
+
+Prompts from concurrent sessions are queued, and a single worker thread
+collects them for a short window (up to a maximum batch size) before running
+them through the model together in one batched generate call. A prompt can
+come with a streamer (transformers' put/end interface) that gets its row's
+tokens as the batch decodes; RowStreamers splits the batch's tokens by row.
+"""
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from deadlines import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+
+class BatchRequest:
+    """A single queued prompt waiting for a batch slot"""
+
+    def __init__(self, prompt, key=None, deadline=None, streamer=None):
+        self.prompt = prompt
+        self.key = key
+        self.deadline = deadline
+        self.streamer = streamer
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+    def fail(self, error):
+        """Fail the request, and end its stream so a reader isn't left waiting"""
+        if self.future.done():
+            return
+        self.future.set_exception(error)
+        if self.streamer is not None:
+            self.streamer.end()
+
+
+class RowStreamers:
+    """
+    One streamer for a batched generate call that hands each row's tokens to that row's
+    own streamer (None for rows nobody streams). Takes the (batch,) or (batch, length)
+    token arrays model.generate passes to put().
+    """
+
+    def __init__(self, streamers):
+        self.streamers = streamers
+
+    def put(self, value):
+        rows = len(value.shape) > 1
+        for row, streamer in enumerate(self.streamers):
+            if streamer is not None:
+                streamer.put(value[row] if rows else value[row:row + 1])
+
+    def end(self):
+        for streamer in self.streamers:
+            if streamer is not None:
+                streamer.end()
+
+
+class BatchScheduler:
+    """
+    Collect queued prompts into batches and hand them to `process_batch`.
+
+    `process_batch(prompts, key, deadlines, streamers)` receives a list of
+    prompts that share the same `key` (e.g. identical generation parameters),
+    plus each prompt's Deadline and streamer (or None), and must return a list
+    of results in the same order. Requests whose deadline has passed by the time their batch starts
+    fail with DeadlineExceeded instead of taking a slot.
+    `on_batch(batch_size, queue_waits)`, if given, is called as each batch
+    starts, e.g. to feed metrics.
+    """
+
+    def __init__(self, process_batch, max_batch_size=8, batch_window=0.01, on_batch=None):
+        self.process_batch = process_batch
+        self.on_batch = on_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.batch_window = max(0.0, float(batch_window))
+
+        self._queue = queue.Queue()
+        # Requests pulled off the queue that didn't match the current batch key
+        self._carryover = deque()
+        self._worker = None
+        self._running = False
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "batches": 0,
+            "requests": 0,
+            "last_batch_size": 0,
+            "max_batch_size_seen": 0,
+            "total_queue_wait": 0.0,
+            "max_queue_wait": 0.0,
+            "last_queue_wait": 0.0,
+        }
+
+    def start(self):
+        """Start the background batching worker"""
+        if self._worker is not None and self._worker.is_alive():
+            return self
+        self._running = True
+        self._worker = threading.Thread(target=self._run, name="rick-batcher", daemon=True)
+        self._worker.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Stop the worker once the queue has been drained"""
+        self._running = False
+        self._queue.put(None)
+        if self._worker is not None:
+            self._worker.join(timeout)
+            self._worker = None
+
+    def submit(self, prompt, key=None, deadline=None, streamer=None):
+        """Queue a prompt and return a Future that resolves to its result; `streamer` gets its tokens as they decode"""
+        request = BatchRequest(prompt, key, deadline, streamer)
+        self._queue.put(request)
+        return request.future
+
+    def queue_depth(self):
+        """Number of prompts waiting for a batch"""
+        return self._queue.qsize() + len(self._carryover)
+
+    def stats(self):
+        """Return a snapshot of the batching statistics"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["avg_batch_size"] = stats["requests"] / stats["batches"] if stats["batches"] else 0.0
+        stats["avg_queue_wait"] = stats["total_queue_wait"] / stats["requests"] if stats["requests"] else 0.0
+        stats["queue_depth"] = self.queue_depth()
+        return stats
+
+    def _next_request(self, timeout=None):
+        if self._carryover:
+            return self._carryover.popleft()
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _collect_batch(self):
+        first = self._next_request()
+        if first is None:
+            return []
+
+        batch = [first]
+        skipped = []
+        deadline = time.monotonic() + self.batch_window
+
+        # Keep pulling requests with the same key until the window closes
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            request = self._next_request(timeout=remaining)
+            if request is None:
+                # Sentinel from stop(), or the window ran out
+                if not self._running:
+                    break
+                continue
+            if request.key == first.key:
+                batch.append(request)
+            else:
+                skipped.append(request)
+
+        # Requests for other keys go first in line for the next batch
+        self._carryover.extendleft(reversed(skipped))
+        return batch
+
+    def _record_batch(self, batch, started_at):
+        waits = [started_at - request.enqueued_at for request in batch]
+        with self._stats_lock:
+            self._stats["batches"] += 1
+            self._stats["requests"] += len(batch)
+            self._stats["last_batch_size"] = len(batch)
+            self._stats["max_batch_size_seen"] = max(self._stats["max_batch_size_seen"], len(batch))
+            self._stats["total_queue_wait"] += sum(waits)
+            self._stats["max_queue_wait"] = max(self._stats["max_queue_wait"], max(waits))
+            self._stats["last_queue_wait"] = max(waits)
+        if self.on_batch is not None:
+            self.on_batch(len(batch), waits)
+        logger.debug("Batch of %d prompt(s), max queue wait %.1f ms", len(batch), max(waits) * 1000)
+
+    def _run(self):
+        while self._running or not self._queue.empty() or self._carryover:
+            batch = self._collect_batch()
+            if not batch:
+                if not self._running:
+                    break
+                continue
+
+            # Nobody is waiting for these any more
+            live = []
+            for request in batch:
+                if request.deadline is not None and request.deadline.expired():
+                    request.fail(DeadlineExceeded(request.deadline.reason))
+                else:
+                    live.append(request)
+            batch = live
+            if not batch:
+                continue
+
+            started_at = time.monotonic()
+            self._record_batch(batch, started_at)
+
+            try:
+                results = self.process_batch([request.prompt for request in batch], batch[0].key,
+                                             [request.deadline for request in batch],
+                                             [request.streamer for request in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"Batch returned {len(results)} results for {len(batch)} prompts")
+            except Exception as e:
+                for request in batch:
+                    request.fail(e)
+                continue
+
+            for request, result in zip(batch, results):
+                request.future.set_result(result)
@@ -0,0 +1,129 @@
+"""
+Inference backend benchmark and parity check: eager vs. torch.compile vs. ONNX Runtime.
+
+Runs the same fixed prompt set through every backend with the "fast" tier's
+greedy parameters (one prompt at a time, then as one padded batch) and
+reports generated tokens per second. Each backend's outputs are compared to
+eager PyTorch token by token: "identical" counts prompts whose tokens match
+exactly, "similarity" is the mean text similarity (1.0 = identical). Greedy
+decoding should match exactly; float differences between runtimes can
+occasionally flip a near-tie.
+
+The ONNX export is written to MODEL_DIR/onnx on the first run (slow) and
+reused afterwards. The compile backend is run last, since it wraps the
+model's encoder and decoder in place.
+
+Usage:
+    python benchmarks/bench_backends.py [--backends eager onnx compile] [--repeats 3] [--strict]
+"""
+import argparse
+import difflib
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from inference_backends import create_backend  # noqa: E402
+from rick_config import CONFIG  # noqa: E402
+
+MODEL_DIR = os.path.join(ROOT, "model")
+
+PROMPTS = [
+    "How does the portal gun work?",
+    "What do you think about Jerry? He seems nice enough to me.",
+    "What is the meaning of life?",
+    "Explain quantum physics to me like I'm Morty.",
+    "Why do you drink so much?",
+    "Tell me about the Citadel of Ricks.",
+    "Can you build me a robot that passes butter?",
+    "Where did you go last weekend?",
+]
+
+
+def run(backend, tokenizer, params, batch):
+    """Token ids for every prompt, one generate call per prompt or one for the whole batch"""
+    import torch
+
+    with torch.no_grad():
+        if batch:
+            inputs = tokenizer(PROMPTS, return_tensors="pt", padding=True)
+            return [row.tolist() for row in backend.generate(dict(inputs), params)]
+        return [backend.generate(dict(tokenizer(prompt, return_tensors="pt")), params)[0].tolist()
+                for prompt in PROMPTS]
+
+
+def strip(tokens, pad_token_id):
+    return [token for token in tokens if token != pad_token_id]
+
+
+def timed_run(backend, tokenizer, params, batch, repeats):
+    """(median seconds, outputs) over `repeats` runs, after one warm-up"""
+    outputs = run(backend, tokenizer, params, batch)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run(backend, tokenizer, params, batch)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["eager", "onnx", "compile"])
+    parser.add_argument("--tier", default="fast", help="Generation tier whose parameters to use (greedy)")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--strict", action="store_true", help="Exit with status 1 if any output differs from eager")
+    args = parser.parse_args()
+
+    from transformers import AutoModelForSeq2SeqLM, BlenderbotTokenizer
+
+    tokenizer = BlenderbotTokenizer.from_pretrained(MODEL_DIR)
+    model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_DIR, low_cpu_mem_usage=True).eval()
+    params = dict(CONFIG["generation"]["tiers"][args.tier]["params"])
+    profile = CONFIG["model"]["inference_profile"]
+    pad = tokenizer.pad_token_id
+
+    # compile changes the model in place, so it goes last
+    names = sorted(args.backends, key=lambda name: name == "compile")
+    if "eager" not in names:
+        names.insert(0, "eager")
+    print(f"{len(PROMPTS)} prompts, {args.tier} tier parameters: {params}\n")
+    print(f"{'backend':>8} {'mode':>7} {'median s':>9} {'tokens/s':>9} {'speedup':>8} {'identical':>10} {'similarity':>11}")
+
+    reference = {}
+    eager_seconds = {}
+    mismatches = 0
+    for name in names:
+        start = time.perf_counter()
+        backend = create_backend(name, model, MODEL_DIR, dict(profile, precision="fp32"))
+        setup_s = time.perf_counter() - start
+        for batch in (False, True):
+            mode = "batch" if batch else "single"
+            seconds, outputs = timed_run(backend, tokenizer, params, batch, args.repeats)
+            outputs = [strip(tokens, pad) for tokens in outputs]
+            tokens = sum(len(tokens) - 1 for tokens in outputs)
+            if name == "eager":
+                reference[mode] = outputs
+                eager_seconds[mode] = seconds
+            identical = sum(a == b for a, b in zip(outputs, reference[mode]))
+            mismatches += len(outputs) - identical
+            similarity = statistics.mean(
+                difflib.SequenceMatcher(None, tokenizer.decode(a, skip_special_tokens=True),
+                                        tokenizer.decode(b, skip_special_tokens=True)).ratio()
+                for a, b in zip(outputs, reference[mode]))
+            print(f"{name:>8} {mode:>7} {seconds:>9.2f} {tokens / seconds:>9.1f} "
+                  f"{eager_seconds[mode] / seconds:>7.2f}x {identical:>4}/{len(outputs):<5} {similarity:>11.3f}")
+        print(f"{'':>8} (setup {setup_s:.1f} s)")
+
+    print("\nSample replies (eager, single):")
+    for prompt, tokens in list(zip(PROMPTS, reference["single"]))[:3]:
+        print(f"  {prompt!r} -> {tokenizer.decode(tokens, skip_special_tokens=True)!r}")
+    if args.strict and mismatches:
+        sys.exit(f"{mismatches} output(s) differ from eager")
+
+
+if __name__ == "__main__":
+    main()
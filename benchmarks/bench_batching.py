@@ -0,0 +1,99 @@
+"""
+Throughput benchmark: micro-batched generation vs. the per-request path.
+
+Runs N concurrent simulated clients against both paths and reports requests
+per second, latency and the batch sizes the scheduler actually formed.
+
+Usage:
+    python benchmarks/bench_batching.py [--clients 1 8 32] [--requests-per-client 2]
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rick_engine import RickEngine  # noqa: E402
+from batching import BatchScheduler  # noqa: E402
+
+PROMPTS = [
+    "As Rick Sanchez from Rick and Morty, respond to: How does the portal gun work?",
+    "As Rick Sanchez from Rick and Morty, respond to: What do you think about Jerry?",
+    "As Rick Sanchez from Rick and Morty, respond to: What is the meaning of life?",
+    "As Rick Sanchez from Rick and Morty, respond to: Explain quantum physics to me.",
+]
+
+
+def run_clients(call, clients, requests_per_client):
+    """Run `clients` threads that each issue `requests_per_client` calls"""
+    latencies = []
+    lock = threading.Lock()
+
+    def client(index):
+        for i in range(requests_per_client):
+            prompt = PROMPTS[(index + i) % len(PROMPTS)]
+            start = time.perf_counter()
+            call(prompt)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    return {
+        "requests": len(latencies),
+        "wall_s": wall,
+        "throughput_rps": len(latencies) / wall,
+        "p50_latency_s": statistics.median(latencies),
+        "max_latency_s": max(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests-per-client", type=int, default=2)
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--batch-window-ms", type=float, default=15)
+    args = parser.parse_args()
+
+    # Batching is measured explicitly below, so the engine itself doesn't batch
+    engine = RickEngine()
+    engine.batch_scheduler = None
+    if not engine.load():
+        sys.exit("Model failed to load")
+
+    # The current path runs one generate at a time (the eventlet hub serializes requests)
+    serial_lock = threading.Lock()
+
+    def per_request(prompt):
+        with serial_lock:
+            return engine.generate_batch([prompt])[0]
+
+    print(f"{'clients':>8} {'path':>12} {'req/s':>8} {'p50 s':>8} {'max s':>8} {'avg batch':>10}")
+    for clients in args.clients:
+        result = run_clients(per_request, clients, args.requests_per_client)
+        print(f"{clients:>8} {'per-request':>12} {result['throughput_rps']:>8.2f} "
+              f"{result['p50_latency_s']:>8.2f} {result['max_latency_s']:>8.2f} {1.0:>10.1f}")
+
+        scheduler = BatchScheduler(engine.generate_batch,
+                                   max_batch_size=args.max_batch_size,
+                                   batch_window=args.batch_window_ms / 1000.0).start()
+        result = run_clients(lambda prompt: scheduler.submit(prompt).result(), clients, args.requests_per_client)
+        stats = scheduler.stats()
+        scheduler.stop()
+        print(f"{clients:>8} {'batched':>12} {result['throughput_rps']:>8.2f} "
+              f"{result['p50_latency_s']:>8.2f} {result['max_latency_s']:>8.2f} {stats['avg_batch_size']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
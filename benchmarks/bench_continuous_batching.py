@@ -0,0 +1,157 @@
+"""
+Continuous batching vs. static batches of model.generate calls.
+
+Concurrent simulated clients send a mix of short greedy requests and long
+sampled ones (two parameter sets, like two generation tiers). The static
+path is BatchScheduler: one model.generate per batch of requests with the
+same parameters, so a batch lasts as long as its longest reply and new
+requests wait for it. The continuous path is ContinuousBatcher: requests
+join and leave the running batch at every token, whatever their parameters.
+
+Reported per path: generated tokens per second, requests per second, p50/p95
+latency for each request class, and latency fairness: Jain's index over each
+request's latency per generated token (1.0 = every request waited the same
+per token it got; lower = some requests paid for others' length).
+
+Before timing, every prompt is decoded greedily by both paths, all at once,
+and the token ids are compared: the continuous loop's padding and per-row
+positions must not change what the model generates.
+
+Usage:
+    python benchmarks/bench_continuous_batching.py [--clients 4 16] [--requests-per-client 4]
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batching import BatchScheduler  # noqa: E402
+from continuous_batching import ContinuousBatcher  # noqa: E402
+from rick_engine import RickEngine  # noqa: E402
+
+PROMPTS = [
+    "How does the portal gun work?",
+    "What do you think about Jerry? He seems nice enough to me.",
+    "What is the meaning of life?",
+    "Explain quantum physics to me like I'm Morty.",
+    "Why do you drink so much?",
+    "Tell me about the Citadel of Ricks.",
+]
+
+REQUEST_CLASSES = {
+    "short": {"num_beams": 1, "do_sample": False, "max_new_tokens": 16, "no_repeat_ngram_size": 3},
+    "long": {"num_beams": 1, "do_sample": True, "temperature": 0.8, "top_p": 0.9, "max_new_tokens": 64,
+             "min_new_tokens": 32, "repetition_penalty": 1.2, "no_repeat_ngram_size": 3},
+}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def jain_index(values):
+    """Jain's fairness index: 1.0 when all values are equal, 1/n at worst"""
+    return sum(values) ** 2 / (len(values) * sum(value * value for value in values)) if values else 0.0
+
+
+def run_clients(call, clients, requests_per_client):
+    """Run `clients` threads that alternate request classes; returns (wall seconds, results)"""
+    results = []
+    lock = threading.Lock()
+    classes = list(REQUEST_CLASSES)
+
+    def client(index):
+        for i in range(requests_per_client):
+            name = classes[(index + i) % len(classes)]
+            start = time.perf_counter()
+            tokens = call(PROMPTS[(index + i) % len(PROMPTS)], name)
+            elapsed = time.perf_counter() - start
+            with lock:
+                results.append((name, elapsed, max(1, tokens)))
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, results
+
+
+def report(path, clients, wall, results):
+    tokens = sum(count for _, _, count in results)
+    line = f"{clients:>8} {path:>11} {tokens / wall:>9.1f} {len(results) / wall:>7.2f}"
+    for name in REQUEST_CLASSES:
+        latencies = [elapsed for request_class, elapsed, _ in results if request_class == name]
+        line += f" {statistics.median(latencies):>9.2f} {percentile(latencies, 0.95):>9.2f}"
+    line += f" {jain_index([elapsed / count for _, elapsed, count in results]):>9.3f}"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, nargs="+", default=[4, 16])
+    parser.add_argument("--requests-per-client", type=int, default=4)
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--batch-window-ms", type=float, default=15)
+    args = parser.parse_args()
+
+    import torch
+
+    # Both paths are set up explicitly below, so the engine itself doesn't batch
+    engine = RickEngine()
+    engine.batch_scheduler = None
+    if not engine.load():
+        sys.exit("Model failed to load")
+    pad = engine.tokenizer.pad_token_id
+
+    def static_batch(prompts, key, deadlines, streamers):
+        inputs = engine.generation_inputs(engine.tokenize(prompts))
+        with torch.no_grad():
+            outputs = engine.model.generate(**inputs, **REQUEST_CLASSES[key])
+        return [int((row != pad).sum()) - 1 for row in outputs]
+
+    # Greedy parity: all prompts in one continuous batch vs. model.generate one at a time
+    params = REQUEST_CLASSES["short"]
+    batcher = ContinuousBatcher(engine.model, engine.encode_prompts, list,
+                                max_batch_size=len(PROMPTS)).start()
+    futures = [batcher.submit(prompt, params) for prompt in PROMPTS]
+    continuous = [future.result() for future in futures]
+    batcher.stop()
+    identical = 0
+    for prompt, tokens in zip(PROMPTS, continuous):
+        with torch.no_grad():
+            expected = engine.model.generate(**engine.generation_inputs(engine.tokenize([prompt])), **params)[0]
+        identical += tokens == [token for token in expected.tolist() if token != pad]
+    print(f"Greedy parity with model.generate: {identical}/{len(PROMPTS)} identical\n")
+    if identical < len(PROMPTS):
+        print("WARNING: continuous batching changed some outputs\n")
+
+    header = "".join(f" {name + ' p50 s':>9} {name + ' p95 s':>9}" for name in REQUEST_CLASSES)
+    print(f"{'clients':>8} {'path':>11} {'tokens/s':>9} {'req/s':>7}{header} {'fairness':>9}")
+    for clients in args.clients:
+        scheduler = BatchScheduler(static_batch, max_batch_size=args.max_batch_size,
+                                   batch_window=args.batch_window_ms / 1000.0).start()
+        wall, results = run_clients(lambda prompt, name: scheduler.submit(prompt, key=name).result(),
+                                    clients, args.requests_per_client)
+        scheduler.stop()
+        report("static", clients, wall, results)
+
+        batcher = ContinuousBatcher(engine.model, engine.encode_prompts, lambda tokens: len(tokens) - 1,
+                                    max_batch_size=args.max_batch_size).start()
+        wall, results = run_clients(lambda prompt, name: batcher.submit(prompt, REQUEST_CLASSES[name]).result(),
+                                    clients, args.requests_per_client)
+        stats = batcher.stats()
+        batcher.stop()
+        report("continuous", clients, wall, results)
+        print(f"{'':>8} {'':>11} (continuous: {stats['steps']} steps, {stats['avg_running']:.1f} sequences "
+              f"per step, max {stats['max_running_seen']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Generation tier benchmark: each tier vs. the fixed beam search.
+
+Runs every prompt of a personal/philosophical/scientific mix through
+each generation tier and through the "quality" tier, which has the 4-beam
+sampling parameters every message used before tiers existed. For each tier
+it reports p50/p95 latency, generated tokens, the share of generations
+within the tier's SLO and the speedup over the fixed beam search. With
+--assistant it also loads the draft model and repeats the greedy tiers with
+assisted decoding.
+
+The last table shows which tier the policy actually routes each prompt
+category to.
+
+Usage:
+    python benchmarks/bench_generation_tiers.py [--repeats 3] [--assistant]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intent import classify  # noqa: E402
+from rick_config import CONFIG  # noqa: E402
+from rick_engine import RickEngine  # noqa: E402
+
+PROMPTS = {
+    "personal": [
+        "What do you really think about Jerry?",
+        "Do you love your family, Rick?",
+        "How do you feel about Morty tagging along?",
+    ],
+    "philosophical": [
+        "What is the meaning of life?",
+        "Is there a god, or just a smarter Rick?",
+        "What is consciousness, really?",
+    ],
+    "scientific": [
+        "How does the portal gun actually work?",
+        "Explain quantum entanglement to me like I'm Morty.",
+        "How would you build a microverse battery?",
+    ],
+}
+
+BASELINE_TIER = "quality"
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def build_inputs(engine):
+    """Token ids for each prompt, built the way the engine builds them for a new session"""
+    inputs = []
+    for category, prompts in PROMPTS.items():
+        for i, prompt in enumerate(prompts):
+            session_id = f"bench-{category}-{i}"
+            engine.remember_turn(session_id, prompt)
+            inputs.append((category, engine.build_context(session_id)[1]))
+    return inputs
+
+
+def run_tier(engine, tier, inputs, repeats):
+    latencies = []
+    tokens = []
+    tokenizer = engine.tokenizer
+    for _ in range(repeats):
+        for _, input_ids in inputs:
+            start = time.perf_counter()
+            reply = engine.generate_batch([input_ids], tier)[0]
+            latencies.append(time.perf_counter() - start)
+            tokens.append(len(tokenizer.encode(reply, add_special_tokens=False)))
+    slo = engine.policy.slo(tier)
+    return {
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "tokens": statistics.mean(tokens),
+        "within_slo": sum(latency <= slo for latency in latencies) / len(latencies),
+    }
+
+
+def print_results(results):
+    baseline = results[BASELINE_TIER]["p50"]
+    print(f"{'tier':>18} {'p50 s':>8} {'p95 s':>8} {'tokens':>7} {'in SLO':>7} {'speedup':>8}")
+    for name, result in results.items():
+        print(f"{name:>18} {result['p50']:>8.3f} {result['p95']:>8.3f} {result['tokens']:>7.1f} "
+              f"{result['within_slo']:>7.0%} {baseline / result['p50']:>7.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--assistant", action="store_true", help="Also run greedy tiers with the draft model")
+    args = parser.parse_args()
+
+    config = dict(CONFIG, cache=dict(CONFIG["cache"], enabled=False),
+                  batching=dict(CONFIG["batching"], enabled=False))
+    if args.assistant:
+        config["generation"] = dict(config["generation"],
+                                    assistant=dict(config["generation"]["assistant"], enabled=True))
+    engine = RickEngine(config)
+    if not engine.load():
+        sys.exit("Model failed to load")
+
+    inputs = build_inputs(engine)
+    # Warm-up so one-time allocations don't land in the first tier
+    engine.generate_batch([inputs[0][1]], "fast")
+
+    assistant = engine.assistant_model
+    engine.assistant_model = None
+    results = {}
+    for tier in engine.policy.tiers:
+        results[tier] = run_tier(engine, tier, inputs, args.repeats)
+    if assistant is not None:
+        engine.assistant_model = assistant
+        for tier in engine.policy.tiers:
+            if engine.policy.assisted(tier):
+                results[f"{tier}+assisted"] = run_tier(engine, tier, inputs, args.repeats)
+    elif args.assistant:
+        print("Draft model did not load; skipping assisted runs")
+
+    print(f"{len(inputs)} prompts x {args.repeats} repeats, baseline is the fixed beam search "
+          f"({BASELINE_TIER!r} tier)\n")
+    print_results(results)
+
+    print("\nTier chosen by the policy:")
+    for category, prompts in PROMPTS.items():
+        tiers = sorted({engine.policy.select(classify(prompt)) for prompt in prompts})
+        print(f"{category:>14}: {', '.join(tiers)}")
+    engine.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Hub responsiveness check: /clear_history latency while generations are running.
+
+Start the server first (python app.py), then run:
+    python benchmarks/bench_hub_latency.py [--url http://localhost:5000]
+
+The script measures idle /clear_history latency, then keeps one or more long
+/chat generations in flight and samples /clear_history again. With inference
+running on the worker pool both numbers should stay flat; if generation blocks
+the eventlet hub the "busy" latency jumps to the full generation time.
+"""
+import argparse
+import json
+import statistics
+import sys
+import threading
+import time
+import urllib.request
+
+LONG_PROMPT = "Explain in detail how the portal gun bends interdimensional space and why quantum physics makes it work?"
+
+
+def post(url, payload, timeout=300):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read().decode("utf-8"))
+
+
+def sample_latency(url, samples, interval):
+    latencies = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        post(f"{url}/clear_history", {"session_id": "latency-probe"})
+        latencies.append(time.perf_counter() - start)
+        time.sleep(interval)
+    return latencies
+
+
+def summarize(name, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{name:>6}: p50 {statistics.median(latencies) * 1000:8.1f} ms   "
+          f"p95 {p95 * 1000:8.1f} ms   max {latencies[-1] * 1000:8.1f} ms")
+    return statistics.median(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--samples", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.1)
+    parser.add_argument("--generations", type=int, default=2, help="Concurrent long generations to run")
+    parser.add_argument("--max-ratio", type=float, default=5.0,
+                        help="Fail if busy p50 exceeds idle p50 by more than this factor")
+    args = parser.parse_args()
+
+    idle = summarize("idle", sample_latency(args.url, args.samples, args.interval))
+
+    def generate(index):
+        while not done.is_set():
+            post(f"{args.url}/chat", {"message": LONG_PROMPT, "session_id": f"latency-load-{index}"})
+
+    done = threading.Event()
+    workers = [threading.Thread(target=generate, args=(i,), daemon=True) for i in range(args.generations)]
+    for worker in workers:
+        worker.start()
+    # Give the generations time to reach model.generate
+    time.sleep(1.0)
+
+    busy = summarize("busy", sample_latency(args.url, args.samples, args.interval))
+    done.set()
+
+    # Generous floor so sub-millisecond idle numbers don't make the ratio noisy
+    if busy > max(idle, 0.005) * args.max_ratio:
+        print("FAIL: /clear_history latency grew while inference was running")
+        sys.exit(1)
+    print("OK: /clear_history latency stayed flat during inference")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Intent classifier benchmark: the keyword index vs. the old substring scans.
+
+Builds a synthetic corpus (100k messages by default) and times:
+  - substring: the per-call-site `any(word in text.lower() ...)` scans the app used to run
+  - index: intent.classify() per message
+  - batch: intent.classify_batch() over the whole corpus
+It also reports how often the two approaches disagree, per feature.
+Classification itself is checked by tests/test_intent.py.
+
+Usage:
+    python benchmarks/bench_intent.py [--messages 100000] [--seed 0]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intent import FEATURE_KEYWORDS, IntentIndex  # noqa: E402
+
+WORDS = ("the a you your young good god my is are was it that this so very really just not "
+         "portal gun dimension universe space time science physics math morty beth jerry summer family "
+         "drink drinking beer flask drunk basic simple obvious amazing invented discovery human feelings "
+         "normal regular why how what when where explain come everyone knows please tell me about "
+         "sometimes timeline spaceship scientific mathematics whatever goodness godlike").split()
+
+
+def legacy_features(text):
+    """The substring scans the call sites used to run, one feature at a time"""
+    features = set()
+    for name, keywords in FEATURE_KEYWORDS.items():
+        lowered = text.lower()
+        if any(keyword.rstrip("*") in lowered for keyword in keywords):
+            features.add(name)
+    return features
+
+
+def build_corpus(count, seed):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        words = rng.choices(WORDS, k=rng.randint(1, 18))
+        text = " ".join(words).capitalize()
+        corpus.append(text + rng.choice(["?", ".", "!", ""]))
+    return corpus
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.messages, args.seed)
+    print(f"Corpus: {len(corpus)} messages, {len(set(corpus))} distinct")
+
+    legacy_s, legacy = timed(lambda: [legacy_features(text) for text in corpus])
+    # Fresh index for each run so the word memo starts empty
+    single_index = IntentIndex(FEATURE_KEYWORDS)
+    single_s, single = timed(lambda: [single_index.classify(text) for text in corpus])
+    batch_index = IntentIndex(FEATURE_KEYWORDS)
+    batch_s, _ = timed(lambda: batch_index.classify_batch(corpus))
+
+    for name, elapsed in (("substring", legacy_s), ("index", single_s), ("batch", batch_s)):
+        print(f"{name:>10}: {elapsed:.3f} s  ({len(corpus) / elapsed:,.0f} msg/s, "
+              f"{elapsed / len(corpus) * 1e6:.2f} us/msg)")
+
+    print("\nMessages where the substring scan and the index disagree:")
+    for name in FEATURE_KEYWORDS:
+        differ = sum((name in old) != (name in new) for old, new in zip(legacy, single))
+        print(f"{name:>18}: {differ / len(corpus):6.1%}")
+
+
+if __name__ == "__main__":
+    main()
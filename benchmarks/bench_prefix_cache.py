@@ -0,0 +1,115 @@
+"""
+Prefill benchmark: cached persona encoder states vs. encoding the full prompt.
+
+For batch sizes 1 and 8 this times the encoder pass ("prefill") over
+preamble + conversation, against encoding only the conversation and
+prepending the cached preamble states. It also times a short greedy
+generate both ways and reports how similar the outputs are (1.0 = identical).
+
+Usage:
+    python benchmarks/bench_prefix_cache.py [--batch-sizes 1 8] [--repeats 20] [--preamble "..."]
+"""
+import argparse
+import difflib
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from prefix_cache import EncoderPrefixCache  # noqa: E402
+from rick_config import CONFIG, RICK_CHARACTER_CONTEXT  # noqa: E402
+
+MODEL_DIR = os.path.join(ROOT, "model")
+
+CONVERSATIONS = [
+    "How does the portal gun work?",
+    "What do you think about Jerry? He seems nice enough to me.",
+    "What is the meaning of life?",
+    "Explain quantum physics to me like I'm Morty.",
+    "Why do you drink so much?",
+    "Tell me about the Citadel of Ricks.",
+    "Can you build me a robot that passes butter?",
+    "Where did you go last weekend?",
+]
+
+GENERATION_PARAMS = {"max_new_tokens": 24, "num_beams": 1, "do_sample": False}
+
+
+def timed(fn, repeats):
+    """Median wall time of `fn` over `repeats` runs, after one warm-up"""
+    fn()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--preamble", default=None,
+                        help="Persona text (default: the full RICK_CHARACTER_CONTEXT)")
+    args = parser.parse_args()
+
+    import torch
+    from transformers import AutoModelForSeq2SeqLM, BlenderbotTokenizer
+
+    tokenizer = BlenderbotTokenizer.from_pretrained(MODEL_DIR)
+    model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_DIR, low_cpu_mem_usage=True).eval()
+    encoder = model.get_encoder()
+    max_positions = model.config.max_position_embeddings
+    preamble = args.preamble or RICK_CHARACTER_CONTEXT
+    cache = EncoderPrefixCache()
+
+    start = time.perf_counter()
+    prefix_states = cache.prefix_states(model, tokenizer, preamble)
+    build_s = time.perf_counter() - start
+    print(f"Preamble: {prefix_states.shape[1]} tokens, encoded once in {build_s * 1000:.1f} ms")
+    print(f"Model max positions: {max_positions} (conversation budget {CONFIG['conversation']['max_context_tokens']})")
+    print()
+
+    print(f"{'batch':>6} {'full prefill ms':>16} {'cached prefill ms':>18} {'saving':>8} "
+          f"{'full gen ms':>12} {'cached gen ms':>14} {'similarity':>11}")
+    for batch_size in args.batch_sizes:
+        conversations = [CONVERSATIONS[i % len(CONVERSATIONS)] for i in range(batch_size)]
+        full = tokenizer([f"{preamble} {text}" for text in conversations], return_tensors="pt",
+                         padding=True, truncation=True, max_length=max_positions)
+        suffix = tokenizer(conversations, return_tensors="pt", padding=True, truncation=True,
+                           max_length=max_positions)
+
+        with torch.no_grad():
+            full_prefill = timed(lambda: encoder(**full), args.repeats)
+            cached_prefill = timed(lambda: cache.encode(model, tokenizer, preamble, suffix["input_ids"],
+                                                        suffix["attention_mask"]), args.repeats)
+
+            def generate_full():
+                return model.generate(**full, **GENERATION_PARAMS)
+
+            def generate_cached():
+                encoder_outputs, attention_mask = cache.encode(model, tokenizer, preamble, suffix["input_ids"],
+                                                               suffix["attention_mask"])
+                return model.generate(encoder_outputs=encoder_outputs, attention_mask=attention_mask,
+                                      **GENERATION_PARAMS)
+
+            full_gen = timed(generate_full, max(1, args.repeats // 4))
+            cached_gen = timed(generate_cached, max(1, args.repeats // 4))
+            full_text = tokenizer.batch_decode(generate_full(), skip_special_tokens=True)
+            cached_text = tokenizer.batch_decode(generate_cached(), skip_special_tokens=True)
+
+        similarity = statistics.mean(difflib.SequenceMatcher(None, a, b).ratio()
+                                     for a, b in zip(full_text, cached_text))
+        saving = 1 - cached_prefill / full_prefill if full_prefill else 0.0
+        print(f"{batch_size:>6} {full_prefill * 1000:>16.1f} {cached_prefill * 1000:>18.1f} {saving:>7.0%} "
+              f"{full_gen * 1000:>12.1f} {cached_gen * 1000:>14.1f} {similarity:>11.2f}")
+
+    print(f"\nPrefix encoded {cache.builds} time(s) across all runs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Inference profile benchmark: latency, peak RSS and response similarity.
+
+Each profile is loaded in its own child process (so peak RSS is per profile),
+runs greedy decoding over a fixed prompt set and reports per-prompt latency.
+Outputs of every profile are compared against fp32 with a text similarity
+ratio (1.0 = identical).
+
+Usage:
+    python benchmarks/bench_quantization.py [--profiles fp32 int8 bf16] [--threads 4]
+"""
+import argparse
+import difflib
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODEL_DIR = os.path.join(ROOT, "model")
+
+PROMPTS = [
+    "As Rick Sanchez from Rick and Morty, respond to: How does the portal gun work?",
+    "As Rick Sanchez from Rick and Morty, respond to: What do you think about Jerry?",
+    "As Rick Sanchez from Rick and Morty, respond to: What is the meaning of life?",
+    "As Rick Sanchez from Rick and Morty, respond to: Explain quantum physics to me.",
+    "As Rick Sanchez from Rick and Morty, respond to: Why do you drink so much?",
+    "As Rick Sanchez from Rick and Morty, respond to: Tell me about the Citadel of Ricks.",
+]
+
+# Greedy decoding so outputs are deterministic and comparable across profiles
+GENERATION_PARAMS = {"max_length": 60, "min_length": 10, "num_beams": 1, "do_sample": False}
+
+
+def run_child(precision, threads):
+    """Load one profile, generate for every prompt and print a JSON result"""
+    import torch
+    from transformers import AutoModelForSeq2SeqLM, BlenderbotTokenizer
+    from inference_profile import apply_thread_settings, load_model_with_profile
+
+    profile = {"precision": precision, "num_threads": threads, "cache_quantized": True}
+    apply_thread_settings(profile)
+
+    start = time.perf_counter()
+    tokenizer = BlenderbotTokenizer.from_pretrained(MODEL_DIR)
+    model = load_model_with_profile(AutoModelForSeq2SeqLM, MODEL_DIR, profile)
+    load_s = time.perf_counter() - start
+
+    latencies = []
+    outputs = []
+    with torch.no_grad():
+        # Warm up once so first-call overhead doesn't skew the numbers
+        model.generate(**tokenizer(PROMPTS[0], return_tensors="pt"), **GENERATION_PARAMS)
+        for prompt in PROMPTS:
+            inputs = tokenizer(prompt, return_tensors="pt", max_length=128, truncation=True)
+            start = time.perf_counter()
+            generated = model.generate(**inputs, **GENERATION_PARAMS)
+            latencies.append(time.perf_counter() - start)
+            outputs.append(tokenizer.decode(generated[0], skip_special_tokens=True))
+
+    print(json.dumps({
+        "precision": precision,
+        "load_s": load_s,
+        "latencies_s": latencies,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "outputs": outputs,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", nargs="+", default=["fp32", "int8", "bf16"])
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.threads)
+        return
+
+    results = {}
+    for precision in args.profiles:
+        command = [sys.executable, os.path.abspath(__file__), "--child", precision]
+        if args.threads:
+            command += ["--threads", str(args.threads)]
+        completed = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(f"{precision}: failed\n{completed.stderr[-2000:]}")
+            continue
+        results[precision] = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    baseline = results.get("fp32")
+    print(f"{'profile':>8} {'load s':>8} {'p50 s':>8} {'mean s':>8} {'peak RSS MB':>12} {'similarity':>11}")
+    for precision, result in results.items():
+        similarity = float("nan")
+        if baseline:
+            similarity = statistics.mean(
+                difflib.SequenceMatcher(None, a, b).ratio()
+                for a, b in zip(baseline["outputs"], result["outputs"])
+            )
+            result["similarity_to_fp32"] = similarity
+        print(f"{precision:>8} {result['load_s']:>8.2f} {statistics.median(result['latencies_s']):>8.3f} "
+              f"{statistics.mean(result['latencies_s']):>8.3f} {result['peak_rss_mb']:>12.0f} {similarity:>11.3f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Response table benchmark: reply selection latency.
+
+Reports per-call latency in microseconds (p50 / p99 / max) for:
+  - a weighted pick from each compiled table (category routing plus alias draw)
+  - the old approach, which rebuilt the themed list and called rng.choice
+  - a full degraded-mode reply (classification, table pick, rickification)
+Weights, categories and the degraded-mode switch are checked by
+tests/test_response_tables.py and tests/test_degraded_mode.py.
+
+Usage:
+    python benchmarks/bench_response_tables.py [--calls 100000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intent import classify  # noqa: E402
+from rick_config import CONFIG  # noqa: E402
+from rick_engine import RickEngine  # noqa: E402
+from rick_processor import REPLY_TABLES  # noqa: E402
+
+MESSAGES = [
+    "How do portals work across dimensions?",
+    "Explain the physics behind that",
+    "What do you think about Jerry and the family?",
+    "Why do you drink so much?",
+    "Tell me something interesting about your garage",
+]
+
+
+def listed_themed_response(user_input, rng, intents):
+    """The previous implementation: build the category's list on every call"""
+    if "topic_multiverse" in intents:
+        responses = [str(i) for i in range(4)]
+    elif "topic_science" in intents:
+        responses = [str(i) for i in range(4)]
+    elif "topic_family" in intents:
+        responses = [str(i) for i in range(5)]
+    else:
+        responses = [str(i) for i in range(5)]
+    return rng.choice(responses)
+
+
+def timings(fn, calls):
+    """Sorted per-call times in microseconds"""
+    times = []
+    perf_counter = time.perf_counter
+    for i in range(calls):
+        start = perf_counter()
+        fn(i)
+        times.append((perf_counter() - start) * 1e6)
+    times.sort()
+    return times
+
+
+def report(label, times):
+    print(f"{label:>28} {times[len(times) // 2]:>8.2f} {times[int(0.99 * len(times))]:>8.2f} {times[-1]:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    intents = [classify(message) for message in MESSAGES]
+    count = len(MESSAGES)
+    themed = REPLY_TABLES["themed"]
+
+    print(f"{'per call, microseconds':>28} {'p50':>8} {'p99':>8} {'max':>9}")
+    report("themed (classified)", timings(lambda i: themed.pick(MESSAGES[i % count], rng, intents[i % count]),
+                                           args.calls))
+    report("themed (from text)", timings(lambda i: themed.pick(MESSAGES[i % count], rng), args.calls))
+    report("simple", timings(lambda i: REPLY_TABLES["simple"].pick(rng=rng), args.calls))
+    report("fallback", timings(lambda i: REPLY_TABLES["fallback"].pick(rng=rng), args.calls))
+    report("previous themed (lists)", timings(lambda i: listed_themed_response(MESSAGES[i % count], rng,
+                                                                              intents[i % count]), args.calls))
+
+    # Nothing here needs the model: degraded replies only touch the session store and the tables
+    config = dict(CONFIG, batching=dict(CONFIG["batching"], enabled=False),
+                  sessions=dict(CONFIG["sessions"], backend="memory"))
+    engine = RickEngine(config)
+    calls = max(1, args.calls // 10)
+    report("degraded reply (rickified)", timings(lambda i: engine.degraded_reply(f"s{i % 64}", MESSAGES[i % count]),
+                                                 calls))
+
+
+if __name__ == "__main__":
+    main()
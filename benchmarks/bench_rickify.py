@@ -0,0 +1,67 @@
+"""
+Microbenchmark for rick_processor on 100, 1k and 10k word inputs.
+
+Reports per-call cost of the phrase replacement stage (compiled single-pass
+engine vs. the old one-re.sub-per-phrase loop) and of the full
+rickify_response. tests/test_rickify.py imports the legacy loop from here to
+check both replacement paths, and seeded rickify_response, give the same output.
+
+Usage:
+    python benchmarks/bench_rickify.py [--repeat 5]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rick_processor import RICK_REPLACEMENTS, RickPersonality, replace_phrases, rickify_response  # noqa: E402
+
+VOCABULARY = (
+    "I think the portal is broken maybe it could be the battery . I don't know exactly but "
+    "certainly yes no hello hi goodbye that is impressive surprising and interesting ! "
+    "Morty we need to go back to the garage and fix the quantum flux capacitor ?"
+).split()
+
+
+def legacy_replace_phrases(text):
+    """The original implementation: one freshly built pattern and re.sub per phrase"""
+    for normal, rick in RICK_REPLACEMENTS.items():
+        text = re.sub(r'\b' + normal + r'\b', rick, text, flags=re.IGNORECASE)
+    return text
+
+
+def make_text(words, seed=0):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words))
+
+
+def per_call_us(func, text, repeat):
+    number = max(1, 2000 // max(1, len(text) // 100))
+    best = min(timeit.repeat(lambda: func(text), number=number, repeat=repeat))
+    return best / number * 1e6
+
+
+def rickify_seeded(text):
+    return rickify_response(text, RickPersonality(seed=42))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'words':>7} {'legacy replace':>16} {'compiled replace':>18} {'speedup':>8} {'rickify_response':>18}")
+    for words in (100, 1000, 10000):
+        text = make_text(words)
+        legacy = per_call_us(legacy_replace_phrases, text, args.repeat)
+        compiled = per_call_us(replace_phrases, text, args.repeat)
+        full = per_call_us(rickify_seeded, text, args.repeat)
+        print(f"{words:>7} {legacy:>13.1f} us {compiled:>15.1f} us {legacy / compiled:>7.1f}x {full:>15.1f} us")
+
+
+if __name__ == "__main__":
+    main()
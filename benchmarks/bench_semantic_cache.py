@@ -0,0 +1,115 @@
+"""
+Semantic cache benchmark: hit rate on paraphrases, false hits, and lookup overhead.
+
+Each group below is one question worded several ways. The first wording is
+cached, then every other wording is looked up:
+  - paraphrase hit rate: other wordings of a cached question that hit
+  - false hits: lookups that returned another group's reply (should be 0)
+Then the bucket is filled with synthetic messages and the lookup time
+(embedding plus search) is measured at several sizes, against the exact
+response cache's dictionary lookup. Exits non-zero if any lookup returned
+another question's reply.
+
+Usage:
+    python benchmarks/bench_semantic_cache.py [--encoder hashed] [--threshold 0.85] [--sizes 100 1000 4000]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from response_cache import ResponseCache  # noqa: E402
+from semantic_cache import SemanticCache, create_embedder  # noqa: E402
+
+MODEL_DIR = os.path.join(ROOT, "model")
+
+PARAPHRASES = [
+    ["What is the meaning of life?", "whats the meaning of life", "what is life's meaning?",
+     "Rick, what's the meaning of life"],
+    ["How does the portal gun work?", "how does your portal gun work", "How do portal guns work?",
+     "hey rick how does the portal gun work"],
+    ["Why do you drink so much?", "why do you drink so much", "Why do you drink that much?"],
+    ["Tell me about the Citadel of Ricks", "what's the citadel of ricks?", "Tell me about the citadel of Ricks."],
+    ["What do you think about Jerry?", "what do you think of jerry", "What do you think about Jerry??"],
+    ["Can you build me a robot?", "could you build me a robot", "can u build a robot for me"],
+    ["Where is Morty?", "wheres morty", "where's Morty?"],
+    ["Do you love your family?", "do you love ur family", "Do you love your family at all?"],
+]
+
+WORDS = ("portal gun dimension morty jerry beth summer science citadel council ricks multiverse schwifty "
+         "pickle squanch plumbus meeseeks birdperson unity vindicators microverse battery spaceship "
+         "garage flask drink family adventure galactic federation cromulon evil crystal").split()
+
+
+def synthetic_messages(count, seed):
+    rng = random.Random(seed)
+    return [f"{rng.choice(['what', 'why', 'how', 'where', 'who'])} " + " ".join(rng.sample(WORDS, 4))
+            for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--encoder", default="hashed", help='"hashed" or a sentence encoder model name')
+    parser.add_argument("--threshold", type=float, default=0.85)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 4000])
+    parser.add_argument("--lookups", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    embedder = create_embedder(args.encoder, model_dir=os.path.join(MODEL_DIR, "embedder"))
+    cache = SemanticCache(embedder, threshold=args.threshold, max_entries_per_bucket=max(args.sizes) + 64)
+    for index, group in enumerate(PARAPHRASES):
+        cache.put(group[0], "standard", f"reply {index}")
+
+    hits = misses = false_hits = 0
+    for index, group in enumerate(PARAPHRASES):
+        for text in group[1:]:
+            reply = cache.get(text, "standard")
+            if reply is None:
+                misses += 1
+                print(f"  miss:      {text!r}")
+            elif reply != f"reply {index}":
+                false_hits += 1
+                print(f"  FALSE HIT: {text!r} -> {reply!r}")
+            else:
+                hits += 1
+    lookups = hits + misses + false_hits
+    print(f"Encoder {embedder.name}, threshold {args.threshold}")
+    print(f"Paraphrase hit rate: {hits}/{lookups} ({hits / lookups:.0%}), false hits: {false_hits}\n")
+
+    exact = ResponseCache(max_entries=max(args.sizes) + 64)
+    rng = random.Random(args.seed)
+    print(f"{'entries':>8} {'semantic ms':>12} {'p95 ms':>8} {'exact ms':>9}")
+    filled = len(PARAPHRASES)
+    for size in sorted(args.sizes):
+        for text in synthetic_messages(size - filled, args.seed + size):
+            cache.put(text, "standard", text)
+            exact.put(text, {}, text)
+        filled = size
+        queries = synthetic_messages(args.lookups, args.seed + 1) + [rng.choice(group) for group in PARAPHRASES]
+
+        semantic_times = []
+        for text in queries:
+            start = time.perf_counter()
+            cache.get(text, "standard")
+            semantic_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        for text in queries:
+            exact.get(text, {})
+        exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        semantic_times.sort()
+        print(f"{size:>8} {statistics.mean(semantic_times) * 1000:>12.3f} "
+              f"{semantic_times[int(0.95 * len(semantic_times))] * 1000:>8.3f} {exact_ms:>9.4f}")
+
+    print(f"\nCache stats: {cache.stats()}")
+    if false_hits:
+        sys.exit(f"{false_hits} lookup(s) returned another question's reply")
+
+
+if __name__ == "__main__":
+    main()
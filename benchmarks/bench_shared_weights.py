@@ -0,0 +1,129 @@
+"""
+Per-process memory of N model processes: private copies vs. shared mmap weights.
+
+For each loading mode, starts N processes that each load the model and run
+one generate call (so every weight page has been touched), then reads
+/proc/<pid>/smaps_rollup for each of them:
+  - RSS: resident memory, shared pages counted in full by every process
+  - PSS: proportional set size, shared pages split between the processes sharing them
+  - USS: unique set size, private pages only (what killing the process would free)
+The sum of PSS is what the N processes really cost.
+
+Modes:
+  - bin: from_pretrained on pytorch_model.bin (a converted copy is written to
+    MODEL_DIR/bench_bin the first time)
+  - safetensors: from_pretrained on model.safetensors
+  - mmap: shared_weights.load_mmap_model, the "mmap_weights" inference profile
+
+Linux only.
+
+Usage:
+    python benchmarks/bench_shared_weights.py [--workers 4] [--modes bin safetensors mmap]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODEL_DIR = os.path.join(ROOT, "model")
+PROMPT = "As Rick Sanchez from Rick and Morty, respond to: How does the portal gun work?"
+
+
+def legacy_dir(model_dir):
+    """A pytorch_model.bin copy of the model, written once"""
+    path = os.path.join(model_dir, "bench_bin")
+    if not os.path.exists(os.path.join(path, "pytorch_model.bin")):
+        from transformers import AutoModelForSeq2SeqLM, BlenderbotTokenizer
+
+        print(f"Writing a pytorch_model.bin copy to {path}...")
+        model = AutoModelForSeq2SeqLM.from_pretrained(model_dir, low_cpu_mem_usage=True)
+        model.save_pretrained(path, safe_serialization=False)
+        BlenderbotTokenizer.from_pretrained(model_dir).save_pretrained(path)
+    return path
+
+
+def child(mode, model_dir):
+    """Load the model the given way, touch every weight, report ready and wait to be measured"""
+    import torch
+    from transformers import AutoModelForSeq2SeqLM, BlenderbotTokenizer
+
+    if mode == "mmap":
+        from shared_weights import load_mmap_model
+
+        model = load_mmap_model(AutoModelForSeq2SeqLM, model_dir)
+    else:
+        model = AutoModelForSeq2SeqLM.from_pretrained(model_dir, low_cpu_mem_usage=True).eval()
+    tokenizer = BlenderbotTokenizer.from_pretrained(model_dir)
+    with torch.no_grad():
+        model.generate(**tokenizer(PROMPT, return_tensors="pt"), max_new_tokens=8, num_beams=1, do_sample=False)
+    print("ready", flush=True)
+    sys.stdin.read()
+
+
+def smaps_rollup(pid):
+    """Memory figures in bytes from /proc/<pid>/smaps_rollup"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    return {
+        "rss": values.get("Rss", 0),
+        "pss": values.get("Pss", 0),
+        "uss": values.get("Private_Clean", 0) + values.get("Private_Dirty", 0),
+        "shared": values.get("Shared_Clean", 0) + values.get("Shared_Dirty", 0),
+    }
+
+
+def measure(mode, model_dir, workers):
+    processes = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child", mode,
+                                   "--model-dir", model_dir],
+                                  stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+                 for _ in range(workers)]
+    try:
+        started = time.perf_counter()
+        for process in processes:
+            if process.stdout.readline().strip() != "ready":
+                sys.exit(f"{mode} worker exited with code {process.wait()}")
+        load_s = time.perf_counter() - started
+        return load_s, [smaps_rollup(process.pid) for process in processes]
+    finally:
+        for process in processes:
+            process.stdin.close()
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--modes", nargs="+", default=["bin", "safetensors", "mmap"])
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.model_dir)
+        return
+
+    if not sys.platform.startswith("linux"):
+        sys.exit("smaps_rollup is Linux only")
+
+    mb = 2 ** 20
+    print(f"{'mode':>12} {'load s':>7} {'RSS MB':>8} {'PSS MB':>8} {'USS MB':>8} {'shared MB':>10} {'total PSS MB':>13}")
+    for mode in args.modes:
+        model_dir = legacy_dir(args.model_dir) if mode == "bin" else args.model_dir
+        load_s, stats = measure(mode, model_dir, args.workers)
+        count = len(stats)
+        print(f"{mode:>12} {load_s:>7.1f} {sum(s['rss'] for s in stats) / count / mb:>8.0f} "
+              f"{sum(s['pss'] for s in stats) / count / mb:>8.0f} {sum(s['uss'] for s in stats) / count / mb:>8.0f} "
+              f"{sum(s['shared'] for s in stats) / count / mb:>10.0f} {sum(s['pss'] for s in stats) / mb:>13.0f}")
+    print(f"\nPer-process averages over {args.workers} workers; total PSS is the memory all of them cost together.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Startup-time benchmark.
+
+Launches `python app.py` and measures, for each model loading mode:
+  - import: seconds until `import app` finishes (separate interpreter)
+  - bind:   seconds until /healthz answers (server accepting connections)
+  - ready:  seconds until /readyz returns 200 (model loaded)
+
+Usage:
+    python benchmarks/bench_startup.py [--modes background blocking] [--port 5055]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_for(url, expect_status, timeout, process):
+    """Poll `url` until it returns `expect_status`; return the elapsed time or None"""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if process.poll() is not None:
+            return None
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == expect_status:
+                    return time.perf_counter() - start
+        except urllib.error.HTTPError as e:
+            if e.code == expect_status:
+                return time.perf_counter() - start
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.05)
+    return None
+
+
+def measure_import():
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import app"], cwd=ROOT, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def measure_server(mode, port, timeout):
+    env = dict(os.environ, RICK_MODEL_LOADING=mode, RICK_DEBUG="0", PORT=str(port))
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "app.py"], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        base = f"http://127.0.0.1:{port}"
+        bind = wait_for(f"{base}/healthz", 200, timeout, process)
+        bind = None if bind is None else time.perf_counter() - start
+        ready = wait_for(f"{base}/readyz", 200, timeout, process)
+        ready = None if ready is None else time.perf_counter() - start
+        return {"mode": mode, "bind_s": bind, "ready_s": ready}
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", default=["background", "blocking"])
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    results = {"import_s": measure_import(), "servers": []}
+    print(f"import app: {results['import_s']:.2f} s")
+
+    for mode in args.modes:
+        result = measure_server(mode, args.port, args.timeout)
+        results["servers"].append(result)
+        bind = "timeout" if result["bind_s"] is None else f"{result['bind_s']:.2f} s"
+        ready = "timeout" if result["ready_s"] is None else f"{result['ready_s']:.2f} s"
+        print(f"{mode:>10}: port bound after {bind}, model ready after {ready}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
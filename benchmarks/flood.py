@@ -0,0 +1,224 @@
+"""
+Simulated flood against the Socket.IO chat handler's backpressure.
+
+Each scenario spoofs client addresses with X-Forwarded-For (which ProxyFix
+trusts), so one machine can play many users:
+  1. session flood: one client sends --burst-size messages back to back.
+     Past the session's token bucket they get {"type": "busy"}; the ones
+     let through are coalesced, so only a couple of generations run.
+  2. IP flood: many sessions from one address, one message each. Past the
+     address's token bucket they get busy replies.
+  3. global flood: more clients than backpressure.max_inflight, each from
+     its own address, all at once. The excess gets busy ("overloaded")
+     replies, unless degraded mode answers them first.
+A well-behaved client from its own address sends one message before the
+floods and one during each of the first two; its latency is reported and it
+must never be turned away.
+
+Every message must be acknowledged with a reply, a "queued" notice or a busy
+reply. The script exits non-zero if a limit didn't hold, a message went
+unanswered, or the well-behaved client was refused.
+
+With --spawn-server the script starts app.py on the stub model, with a slower
+stub (RICK_STUB_BATCH_MS) so the global flood actually fills the queue.
+
+Usage:
+    python benchmarks/flood.py --spawn-server
+    python benchmarks/flood.py --url http://localhost:5000
+"""
+import argparse
+import importlib.util
+import os
+import statistics
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from loadtest import scrape_metrics, spawn_server  # noqa: E402
+from rick_config import CONFIG  # noqa: E402
+
+LIMITS = CONFIG["backpressure"]
+
+
+class FloodClient:
+    """One Socket.IO connection from a spoofed address, recording every response event"""
+
+    def __init__(self, url, ip, session_id):
+        import socketio
+
+        self.session_id = session_id
+        self.events = []
+        self.last_event = time.monotonic()
+        self._lock = threading.Lock()
+        self.client = socketio.Client(reconnection=False)
+        self.client.on("response", self._on_response)
+        self.client.connect(url, headers={"X-Forwarded-For": ip}, wait_timeout=30)
+
+    def _on_response(self, data):
+        with self._lock:
+            self.events.append((time.monotonic(), data.get("type"), data.get("reason")))
+            self.last_event = time.monotonic()
+
+    def send(self, message):
+        self.client.emit("message", {"message": message, "session_id": self.session_id})
+
+    def count(self, kind, reason=None):
+        with self._lock:
+            return sum(1 for _, event, why in self.events if event == kind and (reason is None or why == reason))
+
+    def acknowledged(self):
+        """
+        Messages acknowledged so far: each one is answered by a generation round, queued for the
+        session's next round or turned away (this counts rounds, so it runs ahead of owner messages)
+        """
+        return self.count("message") + self.count("queued") + self.count("busy")
+
+    def generating(self):
+        """Whether a generation round has started ("typing") without its reply yet"""
+        return self.count("typing") > self.count("message")
+
+    def close(self):
+        self.client.disconnect()
+
+
+def wait_until(condition, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+
+def ask(client, message, timeout):
+    """Send one message and wait for its reply or busy; returns (seconds, event type)"""
+    replies, refusals = client.count("message"), client.count("busy")
+    start = time.perf_counter()
+    client.send(message)
+    wait_until(lambda: client.count("message") > replies or client.count("busy") > refusals, timeout)
+    elapsed = time.perf_counter() - start
+    if client.count("message") > replies:
+        return elapsed, "message"
+    return elapsed, "busy" if client.count("busy") > refusals else "timeout"
+
+
+def settle(clients, expected, timeout, quiet=1.0):
+    """Wait until every message is acknowledged (and nothing arrived for `quiet` seconds)"""
+    def done():
+        idle = all(time.monotonic() - client.last_event >= quiet and not client.generating() for client in clients)
+        return idle and sum(client.acknowledged() for client in clients) >= expected
+    return wait_until(done, timeout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--spawn-server", action="store_true", help="Start app.py with the stub model")
+    parser.add_argument("--port", type=int, default=5058)
+    parser.add_argument("--stub-batch-ms", type=int, default=300,
+                        help="Stub model time per batch (with --spawn-server)")
+    parser.add_argument("--burst-size", type=int, default=50, help="Messages in the session flood")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds to wait for each scenario to settle")
+    args = parser.parse_args()
+
+    if importlib.util.find_spec("socketio") is None:
+        sys.exit("The flood test needs the python-socketio client (pip install python-socketio[client])")
+
+    server = None
+    url = args.url
+    if args.spawn_server:
+        os.environ["RICK_STUB_BATCH_MS"] = str(args.stub_batch_ms)
+        server, url = spawn_server(args.port, stub=True)
+
+    failures = []
+    clients = []
+    try:
+        before = scrape_metrics(url)
+        victim = FloodClient(url, "192.0.2.1", "flood-victim")
+        clients.append(victim)
+        victim_latency = {}
+        victim_latency["baseline"] = ask(victim, "How does the portal gun work?", args.timeout)
+
+        # 1. One session sends a burst of messages
+        flooder = FloodClient(url, "198.51.100.1", "flood-session")
+        clients.append(flooder)
+        for i in range(args.burst_size):
+            flooder.send(f"Message number {i}, Rick, why won't you answer me?")
+        victim_latency["session flood"] = ask(victim, "What do you think about Jerry?", args.timeout)
+        if not settle([flooder], args.burst_size, args.timeout):
+            failures.append("session flood: not every message was acknowledged")
+        rounds = flooder.count("message")
+        limited = flooder.count("busy", "session_rate")
+        print(f"Session flood: {args.burst_size} messages -> {rounds} generations, {flooder.count('queued')} "
+              f"coalesced, {limited} rate limited, {flooder.count('busy', 'session_backlog')} over the backlog")
+        if rounds > LIMITS["session_burst"]:
+            failures.append(f"session flood: {rounds} generations for a burst of {LIMITS['session_burst']}")
+        if LIMITS["session_rate"] and not limited:
+            failures.append("session flood: nothing was rate limited")
+
+        # 2. Many sessions from one address
+        sessions = LIMITS["ip_burst"] + 30
+        shared_ip = [FloodClient(url, "198.51.100.2", f"flood-ip-{i}") for i in range(sessions)]
+        clients.extend(shared_ip)
+        for client in shared_ip:
+            client.send("Tell me about the Citadel of Ricks")
+        victim_latency["IP flood"] = ask(victim, "What is the meaning of life?", args.timeout)
+        if not settle(shared_ip, sessions, args.timeout):
+            failures.append("IP flood: not every message was acknowledged")
+        limited = sum(client.count("busy", "ip_rate") for client in shared_ip)
+        answered = sum(client.count("message") for client in shared_ip)
+        print(f"IP flood: {sessions} sessions from one address -> {answered} answered, {limited} rate limited")
+        if LIMITS["ip_rate"] and limited < sessions - LIMITS["ip_burst"] - LIMITS["ip_rate"] * 2:
+            failures.append(f"IP flood: only {limited} of {sessions} messages were rate limited")
+
+        # 3. More distinct clients than the inflight bound, all at once
+        crowd_size = (LIMITS["max_inflight"] or 64) + 40
+        crowd = [FloodClient(url, f"203.0.113.{i % 250 + 1}", f"flood-crowd-{i}") for i in range(crowd_size)]
+        clients.extend(crowd)
+        start = time.perf_counter()
+        for client in crowd:
+            client.send("Explain quantum physics to me like I'm Morty.")
+        if not settle(crowd, crowd_size, args.timeout):
+            failures.append("global flood: not every message was acknowledged")
+        elapsed = time.perf_counter() - start
+        overloaded = sum(client.count("busy", "overloaded") for client in crowd)
+        answered = sum(client.count("message") for client in crowd)
+        after = scrape_metrics(url)
+        switches = "rick_degraded_mode_switches_total"
+        degraded = after.get(switches, 0) - before.get(switches, 0)
+        print(f"Global flood: {crowd_size} clients -> {answered} answered, {overloaded} overloaded, "
+              f"degraded mode switches {degraded:.0f}, settled in {elapsed:.1f} s")
+        if LIMITS["max_inflight"] and not overloaded and not degraded:
+            failures.append("global flood: neither the inflight bound nor degraded mode kicked in")
+
+        print("\nWell-behaved client:")
+        for label, (seconds, kind) in victim_latency.items():
+            print(f"  {label:>14}: {seconds * 1000:8.0f} ms ({kind})")
+            if kind != "message":
+                failures.append(f"well-behaved client got {kind!r} during {label}")
+        times = [seconds for seconds, _ in victim_latency.values()]
+        print(f"  {'median':>14}: {statistics.median(times) * 1000:8.0f} ms")
+
+        rejected = after.get("rick_rejected_messages_total", 0) - before.get("rick_rejected_messages_total", 0)
+        coalesced = after.get("rick_coalesced_messages_total", 0) - before.get("rick_coalesced_messages_total", 0)
+        print(f"\nServer metrics: {rejected:.0f} rejected, {coalesced:.0f} coalesced")
+    finally:
+        for client in clients:
+            try:
+                client.close()
+            except Exception:
+                pass
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    if failures:
+        print()
+        sys.exit("\n".join(failures))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""
+Load test for the chat endpoints.
+
+Drives POST /chat and/or the Socket.IO "message" event with N concurrent
+simulated clients, each with its own session, sending a weighted mix of
+short, scientific, personal and philosophical prompts. For every client
+count it reports p50/p95/p99 latency, throughput and error rate; the
+fallback rate and server RSS come from the server's /metrics.
+
+With --spawn-server the script starts app.py itself; add --stub to run it
+with the deterministic stub model (RICK_STUB_MODEL=1), which needs no model
+download, so the suite runs offline in CI.
+
+Results can be written as JSON and compared against an earlier run; the
+script exits non-zero if p95 latency or throughput regressed by more than
+--threshold.
+
+Usage:
+    python benchmarks/loadtest.py --spawn-server --stub --clients 1 8 32 --output results.json
+    python benchmarks/loadtest.py --url http://localhost:5000 --mode http --compare results.json
+"""
+import argparse
+import importlib.util
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Prompt mix: (category, weight, prompts)
+PROMPT_MIX = [
+    ("short", 0.2, ["hi", "ok cool", "lol", "sure thing", "yeah"]),
+    ("scientific", 0.3, [
+        "How does the portal gun actually work?",
+        "Explain quantum entanglement to me like I'm Morty.",
+        "What's the science behind interdimensional travel?",
+        "How would you build a microverse battery?",
+    ]),
+    ("personal", 0.3, [
+        "What do you really think about Jerry?",
+        "Do you love your family, Rick?",
+        "What's your opinion of the Citadel of Ricks?",
+        "How do you feel about Morty tagging along?",
+    ]),
+    ("philosophical", 0.2, [
+        "What is the meaning of life?",
+        "Does anything in the universe have a purpose?",
+        "Is there a god, or just a smarter Rick?",
+        "What is consciousness, really?",
+    ]),
+]
+
+METRIC_LINE = re.compile(r'^([a-z_]+)(\{[^}]*\})? ([0-9.e+-]+|\+Inf)$')
+
+
+def pick_prompt(rng):
+    _, _, prompts = rng.choices(PROMPT_MIX, weights=[weight for _, weight, _ in PROMPT_MIX])[0]
+    return rng.choice(prompts)
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def client_ip(index):
+    """A distinct X-Forwarded-For address per simulated client, so the per-IP rate limit sees separate users"""
+    return f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}"
+
+
+def http_json(url, payload=None, timeout=300, headers=None):
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    headers = dict(headers or {}, **{"Content-Type": "application/json"})
+    request = urllib.request.Request(url, data=data, headers=headers)
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read().decode("utf-8"))
+
+
+def scrape_metrics(url):
+    """
+    Parse /metrics into {name: total} with labels summed. Short inputs are answered
+    without the model by design, so they aren't counted as fallbacks.
+    """
+    with urllib.request.urlopen(f"{url}/metrics", timeout=30) as response:
+        text = response.read().decode("utf-8")
+    totals = {}
+    for line in text.splitlines():
+        match = METRIC_LINE.match(line)
+        if match and 'reason="short_input"' not in (match.group(2) or ""):
+            totals[match.group(1)] = totals.get(match.group(1), 0.0) + float(match.group(3))
+    return totals
+
+
+def http_client(url, session_id, requests, rng, results, headers):
+    for _ in range(requests):
+        start = time.perf_counter()
+        try:
+            http_json(f"{url}/chat", {"message": pick_prompt(rng), "session_id": session_id}, headers=headers)
+            results.append({"latency": time.perf_counter() - start, "error": False})
+        except urllib.error.HTTPError as e:
+            busy = e.code in (429, 503)
+            results.append({"latency": time.perf_counter() - start, "error": True, "busy": busy})
+        except (urllib.error.URLError, OSError, ValueError):
+            results.append({"latency": time.perf_counter() - start, "error": True})
+
+
+def socket_client(url, session_id, requests, rng, results, timeout, headers):
+    import socketio
+
+    client = socketio.Client(reconnection=False)
+    state = {}
+    done = threading.Event()
+
+    @client.on("response")
+    def on_response(data):
+        if data.get("type") == "chunk" and "first_chunk" not in state:
+            state["first_chunk"] = time.perf_counter()
+        elif data.get("type") == "message":
+            done.set()
+        elif data.get("type") == "busy":
+            state["busy"] = True
+            done.set()
+
+    try:
+        client.connect(url, headers=headers, wait_timeout=30)
+    except Exception:
+        results.extend({"latency": 0.0, "error": True} for _ in range(requests))
+        return
+
+    try:
+        for _ in range(requests):
+            state.clear()
+            done.clear()
+            start = time.perf_counter()
+            client.emit("message", {"message": pick_prompt(rng), "session_id": session_id})
+            ok = done.wait(timeout)
+            end = time.perf_counter()
+            first = state.get("first_chunk", end)
+            busy = state.get("busy", False)
+            results.append({"latency": end - start, "first_chunk": first - start, "error": not ok or busy,
+                            "busy": busy})
+    finally:
+        client.disconnect()
+
+
+def run_level(url, mode, clients, requests, seed, timeout):
+    results = []
+    lock = threading.Lock()
+
+    def client(index):
+        rng = random.Random(f"{seed}:{mode}:{clients}:{index}")
+        session_id = f"loadtest-{mode}-{clients}-{index}-{seed}"
+        headers = {"X-Forwarded-For": client_ip(index)}
+        local = []
+        if mode == "http":
+            http_client(url, session_id, requests, rng, local, headers)
+        else:
+            socket_client(url, session_id, requests, rng, local, timeout, headers)
+        with lock:
+            results.extend(local)
+
+    before = scrape_metrics(url)
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    after = scrape_metrics(url)
+
+    latencies = [r["latency"] for r in results if not r["error"]]
+    errors = sum(r["error"] for r in results)
+    fallbacks = after.get("rick_fallback_responses_total", 0) - before.get("rick_fallback_responses_total", 0)
+    summary = {
+        "mode": mode,
+        "clients": clients,
+        "requests": len(results),
+        "wall_s": wall,
+        "throughput_rps": len(latencies) / wall if wall else 0.0,
+        "p50_s": percentile(latencies, 0.50),
+        "p95_s": percentile(latencies, 0.95),
+        "p99_s": percentile(latencies, 0.99),
+        "error_rate": errors / len(results) if results else 0.0,
+        # Errors that were "busy" replies from the rate limits or the inflight bound
+        "busy_rate": sum(r.get("busy", False) for r in results) / len(results) if results else 0.0,
+        "fallback_rate": fallbacks / len(results) if results else 0.0,
+        "server_rss_bytes": after.get("rick_process_resident_memory_bytes"),
+    }
+    first_chunks = [r["first_chunk"] for r in results if not r["error"] and "first_chunk" in r]
+    if first_chunks:
+        summary["first_chunk_p50_s"] = percentile(first_chunks, 0.50)
+        summary["first_chunk_p95_s"] = percentile(first_chunks, 0.95)
+    return summary
+
+
+def spawn_server(port, stub):
+    env = dict(os.environ, PORT=str(port), RICK_DEBUG="0", RICK_LOG_LEVEL="WARNING")
+    if stub:
+        env["RICK_STUB_MODEL"] = "1"
+    server = subprocess.Popen([sys.executable, "app.py"], cwd=ROOT, env=env)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 600
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            sys.exit(f"Server exited with code {server.returncode}")
+        try:
+            http_json(f"{url}/readyz", timeout=5)
+            return server, url
+        except (urllib.error.URLError, OSError, ValueError):
+            time.sleep(0.5)
+    server.terminate()
+    sys.exit("Server did not become ready in time")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline_path, results, threshold):
+    """Print p95/throughput changes against a baseline run; return True if anything regressed"""
+    with open(baseline_path) as f:
+        baseline = {(r["mode"], r["clients"]): r for r in json.load(f)["results"]}
+
+    regressed = False
+    print(f"\nCompared with {baseline_path} (threshold {threshold:.0%}):")
+    for result in results:
+        old = baseline.get((result["mode"], result["clients"]))
+        if old is None or not old["p95_s"] or not result["p95_s"] or not old["throughput_rps"]:
+            continue
+        p95_change = result["p95_s"] / old["p95_s"] - 1
+        rps_change = result["throughput_rps"] / old["throughput_rps"] - 1
+        bad = p95_change > threshold or rps_change < -threshold
+        regressed = regressed or bad
+        print(f"{result['mode']:>6} {result['clients']:>4} clients: p95 {p95_change:+.1%}, "
+              f"throughput {rps_change:+.1%}{'  REGRESSION' if bad else ''}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--mode", choices=["http", "socket", "both"], default="both")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests-per-client", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds to wait for each socket reply")
+    parser.add_argument("--spawn-server", action="store_true", help="Start app.py for the run")
+    parser.add_argument("--stub", action="store_true", help="Use the deterministic stub model (with --spawn-server)")
+    parser.add_argument("--port", type=int, default=5057, help="Port for --spawn-server")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    modes = ["http", "socket"] if args.mode == "both" else [args.mode]
+    if "socket" in modes and importlib.util.find_spec("socketio") is None:
+        print("python-socketio client not installed; skipping socket mode")
+        modes.remove("socket")
+
+    server = None
+    url = args.url
+    if args.spawn_server:
+        server, url = spawn_server(args.port, args.stub)
+
+    results = []
+    try:
+        print(f"{'mode':>6} {'clients':>8} {'req/s':>8} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8} "
+              f"{'errors':>7} {'fallback':>9} {'RSS MB':>8}")
+        for mode in modes:
+            for clients in args.clients:
+                result = run_level(url, mode, clients, args.requests_per_client, args.seed, args.timeout)
+                results.append(result)
+                rss = result["server_rss_bytes"]
+                print(f"{mode:>6} {clients:>8} {result['throughput_rps']:>8.2f} {result['p50_s'] or 0:>8.3f} "
+                      f"{result['p95_s'] or 0:>8.3f} {result['p99_s'] or 0:>8.3f} {result['error_rate']:>7.1%} "
+                      f"{result['fallback_rate']:>9.1%} {(rss or 0) / 2**20:>8.1f}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "commit": git_commit(),
+                "timestamp": time.time(),
+                "stub": args.stub,
+                "requests_per_client": args.requests_per_client,
+                "results": results,
+            }, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+    if args.compare and compare(args.compare, results, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
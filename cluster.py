@@ -0,0 +1,226 @@
+"""
+Run the chat as several worker processes behind a sticky router.
+
+Each worker is a normal app.py process with its own copy of the model, so N
+workers give N inference lanes on one host. Workers share session history
+through the SQLite session store and send Socket.IO emits through the
+message queue in CONFIG["cluster"]. The router sends every request for a
+session_id to the same worker (rendezvous hashing, so only that worker's
+sessions move if one goes away), which keeps its prefix/response caches and
+in-memory session copy warm. If the chosen worker is down, the next one in
+line takes the request; the shared store still has the history.
+
+The session id is read from the query string (the chat page adds
+?session_id= to its Socket.IO and /clear_history URLs) or, for JSON POSTs
+like /chat, from the body. Requests without one are routed by client
+address. Plain HTTP requests are forwarded with "Connection: close" so a
+reused browser connection can't carry another session to the wrong worker;
+WebSocket upgrades are piped through as-is.
+
+To run the workers behind nginx instead, see deploy/nginx-cluster.conf and
+start only the workers with --no-router.
+
+Usage:
+    python cluster.py [--workers 2] [--port 5000] [--stub] [--no-router]
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import zlib
+from urllib.parse import parse_qs, urlsplit
+
+import eventlet
+
+from rick_config import CONFIG
+
+logger = logging.getLogger("rick.cluster")
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MAX_HEAD_BYTES = 64 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+
+
+def start_worker(index, port, stub):
+    env = dict(os.environ, PORT=str(port), RICK_WORKER_ID=str(index), RICK_DEBUG="0")
+    if CONFIG["cluster"]["message_queue"]:
+        env["RICK_MESSAGE_QUEUE"] = CONFIG["cluster"]["message_queue"]
+    if stub:
+        env["RICK_STUB_MODEL"] = "1"
+    logger.info("Starting worker %d on port %d", index, port)
+    return subprocess.Popen([sys.executable, os.path.join(BASE_DIR, "app.py")], cwd=BASE_DIR, env=env)
+
+
+def rank_workers(key, ports):
+    """Worker ports in preference order for a routing key (rendezvous hashing)"""
+    return sorted(ports, key=lambda port: zlib.crc32(f"{port}:{key}".encode("utf-8")), reverse=True)
+
+
+def read_head(client):
+    """Read an HTTP request head; returns (head bytes, extra bytes already read) or (None, None)"""
+    data = b""
+    while b"\r\n\r\n" not in data:
+        chunk = client.recv(65536)
+        if not chunk or len(data) > MAX_HEAD_BYTES:
+            return None, None
+        data += chunk
+    head, _, rest = data.partition(b"\r\n\r\n")
+    return head + b"\r\n\r\n", rest
+
+
+def parse_head(head):
+    """(request line, {lowercase header: value}) for a request head"""
+    lines = head.decode("latin-1").split("\r\n")
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return lines[0], headers
+
+
+def session_key(request_line, headers, body):
+    """The session_id a request belongs to, if it says"""
+    parts = request_line.split(" ")
+    if len(parts) >= 2:
+        session_id = parse_qs(urlsplit(parts[1]).query).get("session_id")
+        if session_id:
+            return session_id[0]
+    if body and "json" in headers.get("content-type", ""):
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return None
+        if isinstance(payload, dict) and payload.get("session_id"):
+            return str(payload["session_id"])
+    return None
+
+
+def rewrite_head(head, client_address, close):
+    """
+    Add the client address as X-Forwarded-For (the app trusts one proxy hop) and, unless
+    it's an upgrade, ask the worker to close the connection after responding
+    """
+    dropped = ("x-forwarded-for:",) + (("connection:", "keep-alive:") if close else ())
+    lines = [line for line in head.decode("latin-1").split("\r\n")[:-2]
+             if not line.lower().startswith(dropped)]
+    lines.append(f"X-Forwarded-For: {client_address}")
+    if close:
+        lines.append("Connection: close")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+def pipe(source, destination):
+    try:
+        while True:
+            data = source.recv(65536)
+            if not data:
+                break
+            destination.sendall(data)
+    except OSError:
+        pass
+    finally:
+        for sock in (source, destination):
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def handle_client(client, address, ports):
+    try:
+        head, body = read_head(client)
+        if head is None:
+            return
+        request_line, headers = parse_head(head)
+        upgrade = "upgrade" in headers.get("connection", "").lower()
+
+        # Small JSON bodies are read up front so their session_id can be used for routing
+        length = int(headers.get("content-length") or 0)
+        if 0 < length <= MAX_BODY_BYTES:
+            while len(body) < length:
+                chunk = client.recv(65536)
+                if not chunk:
+                    break
+                body += chunk
+
+        key = session_key(request_line, headers, body) or address[0]
+        upstream = None
+        for port in rank_workers(key, ports):
+            try:
+                upstream = eventlet.connect(("127.0.0.1", port))
+                break
+            except OSError:
+                logger.warning("Worker on port %d is unavailable", port)
+        if upstream is None:
+            client.sendall(b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            return
+
+        upstream.sendall(rewrite_head(head, address[0], close=not upgrade) + body)
+        eventlet.spawn(pipe, client, upstream)
+        pipe(upstream, client)
+    except OSError as e:
+        logger.debug("Connection from %s failed: %s", address, e)
+    finally:
+        client.close()
+
+
+def serve_router(port, ports):
+    listener = eventlet.listen(("0.0.0.0", port))
+    logger.info("Sticky router listening on port %d for workers %s", port, ports)
+    pool = eventlet.GreenPool(10000)
+    while True:
+        client, address = listener.accept()
+        pool.spawn_n(handle_client, client, address, ports)
+
+
+def supervise(workers, stub):
+    """Restart workers that exit"""
+    while True:
+        eventlet.sleep(1.0)
+        for index, (port, process) in enumerate(workers):
+            if process.poll() is not None:
+                logger.warning("Worker %d exited with code %s, restarting", index, process.returncode)
+                workers[index] = (port, start_worker(index, port, stub))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=CONFIG["cluster"]["workers"])
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 5000)))
+    parser.add_argument("--base-port", type=int, default=CONFIG["cluster"]["base_port"])
+    parser.add_argument("--stub", action="store_true", help="Run the workers with the stub model")
+    parser.add_argument("--no-router", action="store_true", help="Only run the workers (e.g. behind nginx)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=os.environ.get("RICK_LOG_LEVEL", CONFIG["logging"]["level"]).upper(),
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    ports = [args.base_port + i for i in range(args.workers)]
+    workers = [(port, start_worker(i, port, args.stub)) for i, port in enumerate(ports)]
+
+    def shutdown(*_):
+        for _, process in workers:
+            process.terminate()
+        for _, process in workers:
+            process.wait(timeout=30)
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    try:
+        eventlet.spawn(supervise, workers, args.stub)
+        if args.no_router:
+            while True:
+                eventlet.sleep(3600)
+        serve_router(args.port, ports)
+    except KeyboardInterrupt:
+        shutdown()
+
+
+if __name__ == "__main__":
+    main()
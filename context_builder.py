@@ -0,0 +1,87 @@
+"""
+Token-budgeted, history-aware prompt building.
+
+The prompt is the character preamble followed by as many of the most recent
+conversation turns as fit in a fixed token budget, newest turn always
+included, with a separator after the preamble and between turns so the
+model can tell where one speaker stops. The preamble is tokenized once when the builder is created, and
+each turn is tokenized once and cached on its session, so a new message only
+costs tokenizing that message.
+"""
+
+
+class ContextBuilder:
+    """
+    Build model input ids for a session from a cached preamble plus history.
+
+    Turns are encoded with a leading space and joined with the separator's
+    ids, which gives the same ids as tokenizing the joined text with a
+    byte-level BPE tokenizer (BlenderBot, GPT-2), without ever retokenizing
+    the whole prompt.
+    """
+
+    def __init__(self, tokenizer, preamble="", max_tokens=128, separator="\n"):
+        self.tokenizer = tokenizer
+        # Room left for the tokenizer's special tokens (BlenderBot appends </s>)
+        self.max_tokens = max_tokens - tokenizer.num_special_tokens_to_add()
+        self.separator_ids = tokenizer.encode(separator, add_special_tokens=False) if separator else []
+        preamble_ids = []
+        if preamble:
+            # Never let the preamble take more than half the budget; the separator ends it
+            preamble_ids = self.encode(preamble)[:max(0, self.max_tokens // 2 - len(self.separator_ids))]
+            preamble_ids += self.separator_ids
+        self.preamble_ids = preamble_ids
+
+    def encode(self, text):
+        """Tokenize one turn without special tokens"""
+        return self.tokenizer.encode(" " + text.strip(), add_special_tokens=False)
+
+    def encode_turn(self, session, text):
+        """Token ids for a turn, tokenized at most once per session"""
+        ids = session.token_cache.get(text)
+        if ids is None:
+            ids = session.token_cache[text] = self.encode(text)
+        return ids
+
+    def build(self, session, history=None):
+        """
+        Return (input_ids, turns_used) for the session's history, newest turn last.
+        The newest turn is truncated to its last tokens if it can't fit on its own.
+        Pass `history` when it was copied from the session under the store's lock.
+        """
+        history = list(session.history) if history is None else history
+        budget = self.max_tokens - len(self.preamble_ids)
+        selected = []
+        for text in reversed(history):
+            ids = self.encode_turn(session, text)
+            # An older turn also brings the separator between it and the turn after it
+            cost = len(ids) + (len(self.separator_ids) if selected else 0)
+            if cost > budget:
+                if not selected:
+                    selected.append(ids[len(ids) - budget:])
+                break
+            selected.append(ids)
+            budget -= cost
+
+        self._prune(session, history)
+
+        input_ids = list(self.preamble_ids)
+        for i, ids in enumerate(reversed(selected)):
+            if i:
+                input_ids.extend(self.separator_ids)
+            input_ids.extend(ids)
+        return self.tokenizer.build_inputs_with_special_tokens(input_ids), len(selected)
+
+    @staticmethod
+    def _prune(session, history):
+        # Drop cached ids for turns that have fallen out of the history
+        if len(session.token_cache) > len(history):
+            keep = set(history)
+            for text in [text for text in list(session.token_cache) if text not in keep]:
+                session.token_cache.pop(text, None)
+
+
+def context_budget(model, max_tokens):
+    """Clamp a token budget to what the model's position embeddings allow"""
+    max_positions = getattr(getattr(model, "config", None), "max_position_embeddings", None)
+    return min(max_tokens, max_positions) if max_positions else max_tokens
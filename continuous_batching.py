@@ -0,0 +1,475 @@
+"""
+Continuous (iteration-level) batching for greedy and sampled decoding.
+
+BatchScheduler runs one model.generate per batch, so every prompt in a batch
+waits for its longest reply, and prompts that arrive meanwhile wait for the
+whole batch. ContinuousBatcher runs its own decode loop instead: it holds
+the running sequences' encoder outputs and decoder caches, adds queued
+prompts at every token boundary and hands each sequence back as soon as it
+ends. Every sequence keeps its own generation parameters (temperature,
+top-k, top-p, repetition penalty, no-repeat n-grams, length limits) inside
+the one batched forward pass.
+
+Sequences of different lengths share the batch by left-padding the decoder
+self-attention cache (masked by the decoder attention mask) and
+right-padding the cross-attention cache (masked by the encoder attention
+mask). The padding shifts the cache, so each row's decoder position is
+passed explicitly through a wrapper around the decoder's learned position
+embedding.
+
+A request can come with a streamer (transformers' put/end interface), which
+gets the start token and then each of its row's tokens as they're chosen,
+the way model.generate feeds one.
+
+Beam search needs a beam per sequence; those tiers stay on BatchScheduler.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from deadlines import DeadlineExceeded
+from inference_backends import decoding_settings, length_limits
+
+logger = logging.getLogger(__name__)
+
+
+def supports_continuous_batching(model):
+    """Encoder-decoder models with a learned decoder position embedding"""
+    import torch
+
+    if not getattr(model.config, "is_encoder_decoder", False) or not hasattr(model, "get_decoder"):
+        return False
+    decoder = model.get_decoder()
+    embed = getattr(getattr(decoder, "_orig_mod", decoder), "embed_positions", None)
+    return isinstance(embed, torch.nn.Embedding) or hasattr(embed, "row_positions")
+
+
+def install_row_positions(model):
+    """
+    Wrap the decoder's position embedding so a decode step can give every row its own
+    positions (set `.row_positions.value` in the decoding thread). Other threads, and
+    calls without positions, get the embedding unchanged.
+    """
+    import torch
+
+    decoder = model.get_decoder()
+    decoder = getattr(decoder, "_orig_mod", decoder)
+    embed = decoder.embed_positions
+    if hasattr(embed, "row_positions"):
+        return embed
+
+    class RowPositions(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.embed = embed
+            self.offset = getattr(embed, "offset", 0)
+            self.row_positions = threading.local()
+
+        def forward(self, input_ids_shape, past_key_values_length=0):
+            positions = getattr(self.row_positions, "value", None)
+            if positions is None:
+                return self.embed(input_ids_shape, past_key_values_length)
+            # (batch, length, dim), added to the (batch, length, dim) token embeddings
+            return self.embed.weight[positions + self.offset]
+
+    decoder.embed_positions = RowPositions()
+    return decoder.embed_positions
+
+
+class Sequence:
+    """One request in the running batch"""
+
+    def __init__(self, request, start_token_id):
+        self.request = request
+        self.settings = request.settings
+        self.min_length, self.max_length = length_limits(request.settings)
+        self.tokens = [start_token_id]
+
+
+class ContinuousRequest:
+    """A queued prompt waiting to join the running batch"""
+
+    def __init__(self, prompt, settings, deadline=None, streamer=None):
+        self.prompt = prompt
+        self.settings = settings
+        self.deadline = deadline
+        self.streamer = streamer
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+    def fail(self, error):
+        """Fail the request, and end its stream so a reader isn't left waiting"""
+        if self.future.done():
+            return
+        self.future.set_exception(error)
+        if self.streamer is not None:
+            self.streamer.end()
+
+
+class ContinuousBatcher:
+    """
+    Decode loop that batches at token granularity.
+
+    `encode(prompts)` turns a list of prompts into (encoder hidden states, encoder
+    attention mask) for the model, and `decode(token_ids)` turns a finished sequence into
+    its result. submit() returns a Future for the result. Requests whose deadline passes
+    fail with DeadlineExceeded and leave the batch at the next token.
+    `on_admit(queue_waits)` and `on_finish(generated_tokens)`, if given, are called as
+    sequences join and leave, e.g. to feed metrics.
+    """
+
+    def __init__(self, model, encode, decode, max_batch_size=8, on_admit=None, on_finish=None):
+        self.model = model
+        self.encode = encode
+        self.decode = decode
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.on_admit = on_admit
+        self.on_finish = on_finish
+
+        self.decoder = model.get_decoder()
+        self.positions = install_row_positions(model)
+        self.generation_config = model.generation_config
+        self.start_token_id = model.config.decoder_start_token_id
+        self.eos_token_id = self.generation_config.eos_token_id
+
+        self._queue = queue.Queue()
+        self._worker = None
+        self._running = False
+        self._reset()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "steps": 0,
+            "requests": 0,
+            "generated_tokens": 0,
+            "max_running_seen": 0,
+            "total_queue_wait": 0.0,
+            "max_queue_wait": 0.0,
+        }
+
+    def _reset(self):
+        # Running batch: one Sequence per row, the per-layer [self key, self value] and
+        # [cross key, cross value] caches, their masks, and the logits for each row's next token
+        self.rows = []
+        self.self_cache = None
+        self.cross_cache = None
+        self.self_mask = None
+        self.encoder_mask = None
+        self.logits = None
+
+    def start(self):
+        """Start the decode loop thread"""
+        if self._worker is not None and self._worker.is_alive():
+            return self
+        self._running = True
+        self._worker = threading.Thread(target=self._run, name="rick-continuous", daemon=True)
+        self._worker.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Stop the loop once the running sequences and the queue are done"""
+        self._running = False
+        self._queue.put(None)
+        if self._worker is not None:
+            self._worker.join(timeout)
+            self._worker = None
+
+    def supports(self, params):
+        """Whether generation parameters can run in the loop (no beam search, no draft model)"""
+        return decoding_settings(self.generation_config, params) is not None
+
+    def submit(self, prompt, params, deadline=None, streamer=None):
+        """
+        Queue a prompt with its model.generate parameters; returns a Future for the result.
+        `streamer` gets the prompt's tokens as they're generated.
+        """
+        settings = decoding_settings(self.generation_config, params)
+        if settings is None:
+            raise ValueError("Continuous batching only runs greedy and sampled decoding")
+        request = ContinuousRequest(prompt, settings, deadline, streamer)
+        self._queue.put(request)
+        return request.future
+
+    def queue_depth(self):
+        """Prompts waiting to join the batch"""
+        return self._queue.qsize()
+
+    def running(self):
+        """Sequences in the running batch"""
+        return len(self.rows)
+
+    def stats(self):
+        """Return a snapshot of the decode loop statistics"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["avg_running"] = stats["generated_tokens"] / stats["steps"] if stats["steps"] else 0.0
+        stats["avg_queue_wait"] = stats["total_queue_wait"] / stats["requests"] if stats["requests"] else 0.0
+        stats["queue_depth"] = self.queue_depth()
+        stats["running"] = self.running()
+        return stats
+
+    # Decode loop
+
+    def _run(self):
+        import torch
+
+        while self._running or self.rows or not self._queue.empty():
+            try:
+                with torch.no_grad():
+                    self._admit()
+                    if self.rows:
+                        self._advance()
+            except Exception as e:
+                logger.exception("Continuous batch failed: %s", e)
+                for sequence in self.rows:
+                    sequence.request.fail(e)
+                self._reset()
+
+    def _take_requests(self):
+        """Queued requests that fit in the batch; waits for one if the batch is empty"""
+        requests = []
+        while len(self.rows) + len(requests) < self.max_batch_size:
+            try:
+                if self.rows or requests:
+                    request = self._queue.get_nowait()
+                else:
+                    request = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                break
+            if request is None:
+                # Sentinel from stop()
+                continue
+            if request.deadline is not None and request.deadline.expired():
+                request.fail(DeadlineExceeded(request.deadline.reason))
+                continue
+            requests.append(request)
+        return requests
+
+    def _admit(self):
+        """Encode newly queued prompts, run their first decoder step and add them to the batch"""
+        requests = self._take_requests()
+        if not requests:
+            return
+        try:
+            self._prefill(requests)
+        except Exception as e:
+            # These aren't in self.rows yet, so _run's handler wouldn't fail them
+            for request in requests:
+                request.fail(e)
+            raise
+
+    def _prefill(self, requests):
+        import torch
+
+        now = time.monotonic()
+        waits = [now - request.enqueued_at for request in requests]
+        with self._stats_lock:
+            self._stats["requests"] += len(requests)
+            self._stats["total_queue_wait"] += sum(waits)
+            self._stats["max_queue_wait"] = max(self._stats["max_queue_wait"], max(waits))
+        if self.on_admit is not None:
+            self.on_admit(waits)
+
+        hidden, encoder_mask = self.encode([request.prompt for request in requests])
+        encoder_mask = encoder_mask.to(torch.long)
+        start = torch.full((len(requests), 1), self.start_token_id, dtype=torch.long, device=hidden.device)
+        outputs = self.decoder(input_ids=start, encoder_hidden_states=hidden, encoder_attention_mask=encoder_mask,
+                               use_cache=True, return_dict=True)
+        logits = self._logits(outputs.last_hidden_state)
+        self_cache = [list(layer[:2]) for layer in outputs.past_key_values]
+        cross_cache = [list(layer[2:4]) for layer in outputs.past_key_values]
+        self_mask = torch.ones_like(start)
+        sequences = [Sequence(request, self.start_token_id) for request in requests]
+        for row, request in enumerate(requests):
+            if request.streamer is not None:
+                request.streamer.put(start[row].cpu())
+
+        if not self.rows:
+            self.rows = sequences
+            self.self_cache, self.cross_cache = self_cache, cross_cache
+            self.self_mask, self.encoder_mask, self.logits = self_mask, encoder_mask, logits
+            return
+
+        # Left-pad the newcomers' one-token self cache to the batch's length, and right-pad
+        # whichever cross cache is shorter
+        past_length = self.self_mask.shape[1]
+        encoder_length = max(self.encoder_mask.shape[1], encoder_mask.shape[1])
+        self.self_cache = [[torch.cat([cached, _pad(new, 2, past_length, left=True)])
+                            for cached, new in zip(layer, new_layer)]
+                           for layer, new_layer in zip(self.self_cache, self_cache)]
+        self.cross_cache = [[torch.cat([_pad(cached, 2, encoder_length), _pad(new, 2, encoder_length)])
+                             for cached, new in zip(layer, new_layer)]
+                            for layer, new_layer in zip(self.cross_cache, cross_cache)]
+        self.self_mask = torch.cat([self.self_mask, _pad(self_mask, 1, past_length, left=True)])
+        self.encoder_mask = torch.cat([_pad(self.encoder_mask, 1, encoder_length),
+                                       _pad(encoder_mask, 1, encoder_length)])
+        self.logits = torch.cat([self.logits, logits])
+        self.rows.extend(sequences)
+
+    def _logits(self, hidden_states):
+        logits = self.model.lm_head(hidden_states[:, -1, :])
+        bias = getattr(self.model, "final_logits_bias", None)
+        return (logits + bias if bias is not None else logits).float()
+
+    def _advance(self):
+        """Pick every row's next token, retire finished rows and run one decoder step for the rest"""
+        import torch
+
+        next_tokens = self._choose_tokens()
+        keep = []
+        for index, (sequence, token) in enumerate(zip(self.rows, next_tokens.tolist())):
+            sequence.tokens.append(token)
+            request = sequence.request
+            if request.streamer is not None:
+                request.streamer.put(torch.tensor([token]))
+            if request.deadline is not None and request.deadline.expired():
+                request.fail(DeadlineExceeded(request.deadline.reason))
+            elif token == self.eos_token_id or len(sequence.tokens) >= sequence.max_length:
+                self._finish(sequence)
+            else:
+                keep.append(index)
+        with self._stats_lock:
+            self._stats["steps"] += 1
+            self._stats["generated_tokens"] += len(self.rows)
+            self._stats["max_running_seen"] = max(self._stats["max_running_seen"], len(self.rows))
+
+        if not keep:
+            self._reset()
+            return
+        if len(keep) < len(self.rows):
+            self._retain(keep)
+            next_tokens = next_tokens[keep]
+
+        # Each row's new token sits at its own position: the number of tokens before it
+        positions = torch.tensor([[len(sequence.tokens) - 1] for sequence in self.rows], device=next_tokens.device)
+        attention_mask = torch.cat([self.self_mask, torch.ones_like(self.self_mask[:, :1])], dim=1)
+        # With cached cross-attention keys the encoder states are only checked for their length
+        cross_key = self.cross_cache[0][0]
+        encoder_states = cross_key.new_zeros(()).expand(len(self.rows), self.encoder_mask.shape[1],
+                                                        cross_key.shape[1] * cross_key.shape[3])
+        past = tuple(tuple(self_layer) + tuple(cross_layer)
+                     for self_layer, cross_layer in zip(self.self_cache, self.cross_cache))
+
+        self.positions.row_positions.value = positions
+        try:
+            outputs = self.decoder(input_ids=next_tokens[:, None], attention_mask=attention_mask,
+                                   encoder_hidden_states=encoder_states,
+                                   encoder_attention_mask=self.encoder_mask, past_key_values=past,
+                                   use_cache=True, return_dict=True)
+        finally:
+            self.positions.row_positions.value = None
+        self.self_cache = [list(layer[:2]) for layer in outputs.past_key_values]
+        self.self_mask = attention_mask
+        self.logits = self._logits(outputs.last_hidden_state)
+
+    def _finish(self, sequence):
+        if self.on_finish is not None:
+            self.on_finish(len(sequence.tokens) - 1)
+        request = sequence.request
+        request.future.set_result(self.decode(sequence.tokens))
+        if request.streamer is not None:
+            request.streamer.end()
+
+    def _retain(self, keep):
+        """Drop finished rows from the batch, and padding columns no row needs any more"""
+        import torch
+
+        index = torch.tensor(keep, device=self.self_mask.device)
+        self_mask = self.self_mask.index_select(0, index)
+        encoder_mask = self.encoder_mask.index_select(0, index)
+        # The longest remaining rows decide how much padding is left
+        first = int((self_mask.sum(dim=0) > 0).nonzero()[0])
+        last = int((encoder_mask.sum(dim=0) > 0).nonzero()[-1]) + 1
+        self.self_cache = [[tensor.index_select(0, index)[:, :, first:] for tensor in layer]
+                           for layer in self.self_cache]
+        self.cross_cache = [[tensor.index_select(0, index)[:, :, :last] for tensor in layer]
+                            for layer in self.cross_cache]
+        self.self_mask = self_mask[:, first:]
+        self.encoder_mask = encoder_mask[:, :last]
+        self.logits = self.logits.index_select(0, index)
+        self.rows = [self.rows[i] for i in keep]
+
+    def _choose_tokens(self):
+        """
+        The next token of every row under its own settings: the logits processors
+        model.generate would apply, then greedy or temperature/top-k/top-p sampling
+        """
+        import torch
+
+        scores = self.logits.clone()
+        for row, sequence in enumerate(self.rows):
+            self._process_row(scores[row], sequence)
+
+        sampled = [row for row, sequence in enumerate(self.rows) if sequence.settings["do_sample"]]
+        next_tokens = scores.argmax(dim=-1)
+        if sampled:
+            index = torch.tensor(sampled, device=scores.device)
+            probs = self._sampling_probs(scores.index_select(0, index), [self.rows[row] for row in sampled])
+            next_tokens[index] = torch.multinomial(probs, 1).squeeze(1)
+        return next_tokens
+
+    def _process_row(self, scores, sequence):
+        import torch
+
+        settings = sequence.settings
+        tokens = sequence.tokens
+        length = len(tokens)
+        penalty = settings["repetition_penalty"]
+        if penalty and penalty != 1.0:
+            seen_ids = torch.tensor(tokens, device=scores.device)
+            seen = scores[seen_ids]
+            scores[seen_ids] = torch.where(seen < 0, seen * penalty, seen / penalty)
+
+        size = settings["no_repeat_ngram_size"]
+        if size and length + 1 >= size:
+            prefix = tokens[length - size + 1:]
+            banned = [tokens[i + size - 1] for i in range(length - size + 1) if tokens[i:i + size - 1] == prefix]
+            if banned:
+                scores[banned] = -float("inf")
+
+        if length < sequence.min_length:
+            scores[self.eos_token_id] = -float("inf")
+        forced_eos = settings["forced_eos_token_id"]
+        if forced_eos is not None and length == sequence.max_length - 1:
+            scores.fill_(-float("inf"))
+            scores[forced_eos] = 0.0
+
+    def _sampling_probs(self, scores, sequences):
+        """Per-row temperature, top-k and top-p (nucleus) filtering, as probabilities"""
+        import torch
+
+        def column(key, default):
+            values = [sequence.settings[key] for sequence in sequences]
+            return torch.tensor([[default if value is None else value] for value in values],
+                                dtype=scores.dtype, device=scores.device)
+
+        vocab_size = scores.shape[-1]
+        temperature = column("temperature", 1.0)
+        scores = scores / torch.where(temperature > 0, temperature, torch.ones_like(temperature))
+        ordered, order = scores.sort(dim=-1, descending=True)
+
+        top_k = column("top_k", 0).clamp(max=vocab_size).long()
+        top_k = torch.where(top_k > 0, top_k, torch.full_like(top_k, vocab_size))
+        kth = ordered.gather(1, top_k - 1)
+        remove = ordered < kth
+
+        probs = ordered.masked_fill(remove, -float("inf")).softmax(dim=-1)
+        # Keep the smallest set of tokens reaching top_p, and always the most likely one
+        remove |= probs.cumsum(dim=-1) - probs >= column("top_p", 1.0)
+        remove[:, 0] = False
+        filtered = ordered.masked_fill(remove, -float("inf"))
+        return torch.full_like(scores, -float("inf")).scatter(1, order, filtered).softmax(dim=-1)
+
+
+def _pad(tensor, dim, length, left=False):
+    """Zero-pad `tensor` along `dim` to `length`"""
+    import torch
+
+    missing = length - tensor.shape[dim]
+    if missing <= 0:
+        return tensor
+    shape = list(tensor.shape)
+    shape[dim] = missing
+    padding = torch.zeros(shape, dtype=tensor.dtype, device=tensor.device)
+    return torch.cat([padding, tensor] if left else [tensor, padding], dim=dim)
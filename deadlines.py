@@ -0,0 +1,75 @@
+"""
+Request deadlines and cancellation.
+
+The web layer gives every chat message a Deadline when it arrives and
+cancels it if the client disconnects. The deadline travels with the request
+through the engine, the batch queue and model.generate: expired requests are
+dropped from the queue, and a stopping criterion ends generate early once
+every request in the batch has expired or been cancelled. Callers then answer
+with a themed fallback instead of waiting for the model.
+"""
+import time
+
+
+class DeadlineExceeded(RuntimeError):
+    """Raised when a request's deadline passed or the client went away before the model answered"""
+
+    def __init__(self, reason="timeout"):
+        super().__init__(f"Request {reason}")
+        # "timeout", "cancelled" or "shed"
+        self.reason = reason
+
+
+class Overloaded(DeadlineExceeded):
+    """Raised by admission control when the queue ahead of a request would outlast its deadline"""
+
+    def __init__(self, estimated_wait):
+        super().__init__("shed")
+        self.estimated_wait = estimated_wait
+
+
+class Deadline:
+    """A point in time a request must be answered by, which can also be cancelled early"""
+
+    __slots__ = ("expires_at", "cancelled")
+
+    def __init__(self, timeout):
+        self.expires_at = time.monotonic() + timeout
+        self.cancelled = False
+
+    def remaining(self):
+        """Seconds left, 0 once expired or cancelled"""
+        if self.cancelled:
+            return 0.0
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.cancelled or time.monotonic() >= self.expires_at
+
+    def cancel(self):
+        """Give up on the request, e.g. because the client disconnected"""
+        self.cancelled = True
+
+    @property
+    def reason(self):
+        return "cancelled" if self.cancelled else "timeout"
+
+    def check(self):
+        """Raise DeadlineExceeded if the request should stop"""
+        if self.expired():
+            raise DeadlineExceeded(self.reason)
+
+
+def deadline_stopping_criteria(deadlines):
+    """
+    StoppingCriteriaList for model.generate that stops once every deadline in the batch
+    has expired. A batch keeps going while any of its requests still wants the reply;
+    requests without a deadline (None) never expire.
+    """
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    class DeadlineCriteria(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return all(deadline is not None and deadline.expired() for deadline in deadlines)
+
+    return StoppingCriteriaList([DeadlineCriteria()])
@@ -0,0 +1,110 @@
+"""
+Automatic switch into a zero-model "degraded mode" under overload.
+
+While it's on, every message is answered from the response tables
+(response_tables.py) without waiting for a generation slot or the model,
+so replies take microseconds instead of queueing behind a backlog that
+would blow through their deadlines anyway.
+
+The switch samples the prompt backlog and system CPU use at most once per
+check_interval, on the request path (no background thread). It has
+hysteresis: it switches in at the enter thresholds, and back only once the
+backlog and CPU use are below the lower exit thresholds and it has been on
+for min_seconds, so it doesn't flap at the boundary.
+"""
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CpuUsage:
+    """System-wide CPU busy fraction since the previous call, from /proc/stat (or the load average elsewhere)"""
+
+    def __init__(self):
+        self._last = self._read()
+
+    @staticmethod
+    def _read():
+        try:
+            with open("/proc/stat") as f:
+                values = [int(value) for value in f.readline().split()[1:]]
+        except (OSError, ValueError):
+            return None
+        # idle + iowait
+        return sum(values), values[3] + (values[4] if len(values) > 4 else 0)
+
+    def __call__(self):
+        current = self._read()
+        if current is None or self._last is None:
+            try:
+                return os.getloadavg()[0] / (os.cpu_count() or 1)
+            except (AttributeError, OSError):
+                return 0.0
+        total, idle = current[0] - self._last[0], current[1] - self._last[1]
+        self._last = current
+        return 1.0 - idle / total if total > 0 else 0.0
+
+
+class DegradedMode:
+    """Overload switch with hysteresis over the summed depth of the watched queues and CPU use"""
+
+    def __init__(self, enter_queue_depth=32, exit_queue_depth=8, enter_cpu=0.95, exit_cpu=0.8, min_seconds=10,
+                 check_interval=1.0, cpu_usage=None, on_change=None):
+        self.enter_queue_depth = enter_queue_depth
+        self.exit_queue_depth = exit_queue_depth
+        self.enter_cpu = enter_cpu
+        self.exit_cpu = exit_cpu
+        self.min_seconds = min_seconds
+        self.check_interval = check_interval
+        self.cpu_usage = cpu_usage or CpuUsage()
+        # Called with (engaged, reason) on every switch
+        self.on_change = on_change
+
+        self._queues = []
+        self._lock = threading.Lock()
+        self._next_check = 0.0
+        self.engaged = False
+        self.engaged_at = None
+        self.queue_depth = 0
+        self.cpu = 0.0
+
+    def watch(self, queue_depth):
+        """Add a callable returning a number of waiting prompts to the backlog"""
+        self._queues.append(queue_depth)
+        return self
+
+    def active(self, now=None):
+        """Whether messages should skip the model; re-samples at most once per check_interval"""
+        now = time.monotonic() if now is None else now
+        if now >= self._next_check and self._lock.acquire(blocking=False):
+            try:
+                self._next_check = now + self.check_interval
+                self._update(now)
+            finally:
+                self._lock.release()
+        return self.engaged
+
+    def _update(self, now):
+        self.queue_depth = depth = sum(queue_depth() for queue_depth in self._queues)
+        self.cpu = cpu = self.cpu_usage()
+        if not self.engaged:
+            if depth >= self.enter_queue_depth:
+                self._switch(True, now, f"{depth} prompts waiting")
+            elif self.enter_cpu and cpu >= self.enter_cpu and depth > self.exit_queue_depth:
+                self._switch(True, now, f"CPU {cpu:.0%} busy with {depth} prompts waiting")
+        elif now - self.engaged_at >= self.min_seconds and depth <= self.exit_queue_depth \
+                and (not self.exit_cpu or cpu < self.exit_cpu):
+            self._switch(False, now, f"{depth} prompts waiting, CPU {cpu:.0%} busy")
+
+    def _switch(self, engaged, now, reason):
+        self.engaged = engaged
+        self.engaged_at = now if engaged else None
+        if engaged:
+            logger.warning("Overloaded (%s), answering from the response tables", reason)
+        else:
+            logger.info("Load is back to normal (%s), using the model again", reason)
+        if self.on_change is not None:
+            self.on_change(engaged, reason)
@@ -0,0 +1,34 @@
+"""
+Cross-process locking for files derived from the model weights.
+
+cluster.py starts every worker at once, so on first boot they all try to
+build the same aligned weights, int8 cache or ONNX export. Whoever takes
+file_lock() first builds it; the others wait, then re-check and find it
+done. Writes go to a per-process temp name and are renamed into place, so
+no process ever sees a half-written file.
+"""
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no locking, the per-process temp names still keep writes apart
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on `path + ".lock"` while the block runs"""
+    with open(path + ".lock", "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def temp_path(path):
+    """A temp name next to `path` that no other process writes to"""
+    return f"{path}.{os.getpid()}.tmp"
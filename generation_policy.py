@@ -0,0 +1,78 @@
+"""
+Latency-tiered generation policy.
+
+Not every message needs 4-beam sampling up to 100 tokens. The policy maps a
+message's intents to a tier (CONFIG["generation"]):
+- "fast": greedy decoding with a tight max_new_tokens, for personal chit-chat
+- "standard": small-beam decoding, for philosophical questions
+- "quality": the full beam-search sampling the chat always used, for
+  scientific questions and anything no rule matches
+
+Beam search only applies to /chat replies: streamed (Socket.IO) replies
+can't use it, so they decode the tier's settings with a single beam.
+
+Each tier has a latency SLO; the engine records every generation against it.
+Greedy tiers can also use assisted (speculative) decoding, where a smaller
+draft model proposes tokens and the main model checks them in one forward
+pass.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+# model.generate parameters that only mean something with more than one beam
+BEAM_PARAMS = ("num_beams", "early_stopping", "length_penalty", "num_beam_groups", "diversity_penalty")
+
+
+class GenerationPolicy:
+    """Picks a generation tier for a message and holds each tier's parameters and SLO"""
+
+    def __init__(self, config):
+        self.tiers = {name: dict(tier) for name, tier in config["tiers"].items()}
+        # (feature, tier) pairs, checked in order; the first feature present wins
+        self.rules = [tuple(rule) for rule in config["rules"]]
+        self.default_tier = config["default_tier"]
+        for name in [tier for _, tier in self.rules] + [self.default_tier]:
+            if name not in self.tiers:
+                raise ValueError(f"Unknown generation tier {name!r}")
+
+        # Draft model for assisted decoding, used by tiers with "assisted": True
+        assistant = config["assistant"]
+        self.assistant_model_name = assistant["name"] if assistant["enabled"] else None
+        for name, tier in self.tiers.items():
+            if tier.get("assisted") and not self.supports_assisted(name):
+                # transformers only runs assisted generation with greedy search
+                logger.warning("Tier %r uses beam search or sampling, so it can't use assisted decoding", name)
+                tier["assisted"] = False
+
+    def select(self, intents):
+        """Tier name for a message's Intents"""
+        for feature, tier in self.rules:
+            if feature in intents:
+                return tier
+        return self.default_tier
+
+    def params(self, tier):
+        """model.generate parameters for a tier"""
+        return self.tiers[tier]["params"]
+
+    def stream_params(self, tier):
+        """
+        Streaming needs greedy/sampled decoding (beam search can't emit tokens as it goes), so
+        a streamed reply keeps the tier's sampling and length settings with a single beam
+        """
+        params = {key: value for key, value in self.tiers[tier]["params"].items() if key not in BEAM_PARAMS}
+        params["num_beams"] = 1
+        return params
+
+    def slo(self, tier):
+        """Latency target for a tier in seconds"""
+        return self.tiers[tier]["slo_ms"] / 1000.0
+
+    def supports_assisted(self, tier):
+        params = self.tiers[tier]["params"]
+        return params.get("num_beams", 1) == 1 and not params.get("do_sample", False)
+
+    def assisted(self, tier):
+        """True if the tier should use the draft model when one is loaded"""
+        return self.assistant_model_name is not None and bool(self.tiers[tier].get("assisted"))
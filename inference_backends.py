@@ -0,0 +1,430 @@
+"""
+Pluggable inference backends for the seq2seq model.
+
+Every model.generate call the engine makes goes through a backend
+(CONFIG["model"]["backend"]):
+- "eager": PyTorch, the model as loaded
+- "compile": the encoder and decoder wrapped in torch.compile
+- "onnx": the encoder, the first decoder step and the decoder-with-past step
+  exported to ONNX and run on CPU ONNX Runtime, with a numpy decode loop
+
+The ONNX export is cached under MODEL_DIR/onnx and rebuilt when the weights
+or the torch version change. The ONNX loop does greedy and sampled decoding
+with the same length, repetition and n-gram settings as model.generate;
+anything else (beam search, assisted decoding) is handed to the eager model,
+so every generation tier keeps working whatever the backend.
+"""
+import json
+import logging
+import os
+import shutil
+
+from file_lock import file_lock, temp_path
+
+logger = logging.getLogger(__name__)
+
+ONNX_DIR = "onnx"
+ONNX_META_FILE = "export.json"
+ONNX_OPSET = 14
+# Bump when the exported graphs change, so old exports are rebuilt
+ONNX_EXPORT_VERSION = 1
+ONNX_GRAPHS = ("encoder", "decoder_init", "decoder_with_past")
+
+BACKENDS = ("eager", "compile", "onnx")
+
+# model.generate parameters the custom greedy/sampling loops implement (the beam ones only with num_beams=1)
+DECODING_PARAMS = {"max_length", "max_new_tokens", "min_length", "min_new_tokens", "do_sample", "temperature",
+                   "top_k", "top_p", "num_beams", "repetition_penalty", "no_repeat_ngram_size",
+                   "forced_eos_token_id", "early_stopping", "length_penalty", "streamer", "stopping_criteria"}
+
+
+def decoding_settings(generation_config, params):
+    """
+    The model's generation config merged with `params`, as model.generate sees them, or
+    None if a greedy/sampling loop can't run them (beam search, assisted decoding, ...)
+    """
+    if set(params) - DECODING_PARAMS:
+        return None
+    settings = {key: getattr(generation_config, key, None) for key in DECODING_PARAMS}
+    settings.update(params)
+    if (settings["num_beams"] or 1) > 1:
+        return None
+    return settings
+
+
+def length_limits(settings):
+    """
+    (min_length, max_length) of the decoder sequence, start token included, with
+    model.generate's rules: max_new_tokens wins over max_length, and both minimums apply
+    """
+    if settings["max_new_tokens"] is not None:
+        max_length = settings["max_new_tokens"] + 1
+    else:
+        max_length = settings["max_length"] or 20
+    min_length = max(settings["min_length"] or 0,
+                     settings["min_new_tokens"] + 1 if settings["min_new_tokens"] else 0)
+    return min_length, max_length
+
+
+class EagerBackend:
+    """model.generate on the PyTorch model"""
+
+    name = "eager"
+
+    def __init__(self, model):
+        self.model = model
+
+    def generate(self, model_inputs, params):
+        """Output token ids (batch x length) for model.generate inputs and parameters"""
+        return self.model.generate(**model_inputs, **params)
+
+
+class CompiledBackend(EagerBackend):
+    """
+    model.generate with the encoder and decoder compiled by torch.compile. Compilation
+    happens on the first calls; if it fails the original modules are put back. Other
+    errors (bad inputs, deadlines) are raised as they are and keep the compiled modules.
+    """
+
+    name = "compile"
+
+    def __init__(self, model, mode=None):
+        import torch
+
+        super().__init__(model)
+        self.base = getattr(model, "model", model)
+        self.eager_modules = (self.base.encoder, self.base.decoder)
+        # dynamic=True so growing sequence lengths don't recompile on every step
+        self.base.encoder = torch.compile(self.base.encoder, dynamic=True, mode=mode)
+        self.base.decoder = torch.compile(self.base.decoder, dynamic=True, mode=mode)
+        self.failed = False
+        # Dynamo and backend compiler (inductor) failures all derive from this
+        self.compile_errors = (torch._dynamo.exc.TorchDynamoException,)
+
+    def generate(self, model_inputs, params):
+        if not self.failed:
+            try:
+                return super().generate(model_inputs, params)
+            except self.compile_errors as e:
+                logger.warning("torch.compile failed, falling back to eager PyTorch: %s", e)
+                self.failed = True
+                self.base.encoder, self.base.decoder = self.eager_modules
+        return super().generate(model_inputs, params)
+
+
+def _past_names(num_layers, prefix, kinds=("self_key", "self_value", "cross_key", "cross_value")):
+    return [f"{prefix}_{layer}_{kind}" for layer in range(num_layers) for kind in kinds]
+
+
+def _export_modules(model):
+    """torch modules for the three ONNX graphs"""
+    import torch
+
+    class Encoder(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.encoder = model.get_encoder()
+
+        def forward(self, input_ids, attention_mask):
+            return self.encoder(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+
+    class Decoder(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.decoder = model.get_decoder()
+            self.lm_head = model.lm_head
+            self.register_buffer("final_logits_bias", getattr(model, "final_logits_bias", torch.zeros(1)))
+
+        def step(self, decoder_input_ids, encoder_hidden_states, encoder_attention_mask, past_key_values):
+            outputs = self.decoder(input_ids=decoder_input_ids, encoder_hidden_states=encoder_hidden_states,
+                                   encoder_attention_mask=encoder_attention_mask,
+                                   past_key_values=past_key_values, use_cache=True, return_dict=True)
+            logits = self.lm_head(outputs.last_hidden_state[:, -1, :]) + self.final_logits_bias
+            return logits, outputs.past_key_values
+
+    class DecoderInit(Decoder):
+        def forward(self, decoder_input_ids, encoder_hidden_states, encoder_attention_mask):
+            logits, present = self.step(decoder_input_ids, encoder_hidden_states, encoder_attention_mask, None)
+            return (logits,) + tuple(tensor for layer in present for tensor in layer)
+
+    class DecoderWithPast(Decoder):
+        def forward(self, decoder_input_ids, encoder_hidden_states, encoder_attention_mask, *past):
+            layers = tuple(tuple(past[i:i + 4]) for i in range(0, len(past), 4))
+            logits, present = self.step(decoder_input_ids, encoder_hidden_states, encoder_attention_mask, layers)
+            # Cross-attention keys and values don't change after the first step
+            return (logits,) + tuple(tensor for layer in present for tensor in layer[:2])
+
+    return Encoder().eval(), DecoderInit().eval(), DecoderWithPast().eval()
+
+
+def _export(model, paths):
+    import torch
+
+    num_layers = model.config.decoder_layers
+    past = _past_names(num_layers, "past")
+    present = _past_names(num_layers, "present")
+    present_self = _past_names(num_layers, "present", kinds=("self_key", "self_value"))
+    batch_axes = {0: "batch", 1: "encoder_length"}
+    encoder, decoder_init, decoder_with_past = _export_modules(model)
+
+    input_ids = torch.ones((2, 8), dtype=torch.long)
+    attention_mask = torch.ones_like(input_ids)
+    decoder_input_ids = torch.full((2, 1), model.config.decoder_start_token_id, dtype=torch.long)
+    with torch.no_grad():
+        torch.onnx.export(encoder, (input_ids, attention_mask), paths["encoder"],
+                          input_names=["input_ids", "attention_mask"], output_names=["last_hidden_state"],
+                          dynamic_axes={"input_ids": batch_axes, "attention_mask": batch_axes,
+                                        "last_hidden_state": batch_axes},
+                          opset_version=ONNX_OPSET)
+
+        hidden = encoder(input_ids, attention_mask)
+        decoder_inputs = ["decoder_input_ids", "encoder_hidden_states", "encoder_attention_mask"]
+        decoder_axes = {"decoder_input_ids": {0: "batch"}, "encoder_hidden_states": batch_axes,
+                        "encoder_attention_mask": batch_axes, "logits": {0: "batch"}}
+        cache_axes = {name: {0: "batch", 2: "encoder_length" if "cross" in name else "decoder_length"}
+                      for name in present}
+        torch.onnx.export(decoder_init, (decoder_input_ids, hidden, attention_mask), paths["decoder_init"],
+                          input_names=decoder_inputs, output_names=["logits"] + present,
+                          dynamic_axes=dict(decoder_axes, **cache_axes), opset_version=ONNX_OPSET)
+
+        cache = decoder_init(decoder_input_ids, hidden, attention_mask)[1:]
+        past_axes = {name: {0: "batch", 2: "encoder_length" if "cross" in name else "past_length"} for name in past}
+        present_axes = {name: {0: "batch", 2: "decoder_length"} for name in present_self}
+        torch.onnx.export(decoder_with_past, (decoder_input_ids, hidden, attention_mask) + tuple(cache),
+                          paths["decoder_with_past"], input_names=decoder_inputs + past,
+                          output_names=["logits"] + present_self,
+                          dynamic_axes=dict(decoder_axes, **past_axes, **present_axes), opset_version=ONNX_OPSET)
+
+
+def _export_is_current(meta_path, paths, signature):
+    if not (os.path.exists(meta_path) and all(os.path.exists(path) for path in paths.values())):
+        return False
+    with open(meta_path) as f:
+        if json.load(f) == signature:
+            return True
+    logger.info("ONNX export is stale, rebuilding it")
+    return False
+
+
+def export_onnx(model_dir, load_float_model, quantize=False):
+    """
+    Export the model to MODEL_DIR/onnx once and return {graph name: .onnx path}. The
+    export is reused while its weights signature matches. `load_float_model` returns
+    the fp32 PyTorch model to export; it's only called when an export is needed. With
+    `quantize` the graphs get ONNX Runtime dynamic int8 quantization.
+    """
+    from inference_profile import weights_signature
+
+    export_dir = os.path.join(model_dir, ONNX_DIR)
+    meta_path = os.path.join(export_dir, ONNX_META_FILE)
+    # Each graph gets its own directory: models over 2 GB keep their weights in external files
+    paths = {name: os.path.join(export_dir, name, "model.onnx") for name in ONNX_GRAPHS}
+    signature = dict(weights_signature(model_dir), opset=ONNX_OPSET, version=ONNX_EXPORT_VERSION,
+                     quantized=bool(quantize))
+
+    if _export_is_current(meta_path, paths, signature):
+        return paths
+
+    # Workers starting together all get here on first boot; one exports, the rest wait and re-check
+    with file_lock(export_dir):
+        if _export_is_current(meta_path, paths, signature):
+            return paths
+
+        # Export into a directory of our own and swap it in whole, so no one sees a partial export
+        build_dir = temp_path(export_dir)
+        shutil.rmtree(build_dir, ignore_errors=True)
+        build_paths = {name: os.path.join(build_dir, name, "model.onnx") for name in ONNX_GRAPHS}
+        logger.info("Exporting the model to ONNX in %s...", export_dir)
+        for path in build_paths.values():
+            os.makedirs(os.path.dirname(path))
+        _export(load_float_model(), build_paths)
+
+        if quantize:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            for path in build_paths.values():
+                logger.info("Quantizing %s to int8...", path)
+                quantize_dynamic(path, path + ".int8", weight_type=QuantType.QInt8, use_external_data_format=True)
+                os.replace(path + ".int8", path)
+
+        with open(os.path.join(build_dir, ONNX_META_FILE), "w") as f:
+            json.dump(signature, f)
+        shutil.rmtree(export_dir, ignore_errors=True)
+        os.replace(build_dir, export_dir)
+    logger.info("ONNX export cached in %s", export_dir)
+    return paths
+
+
+class OnnxBackend(EagerBackend):
+    """
+    Greedy and sampled decoding on ONNX Runtime (CPU). The eager model stays loaded for
+    the requests this backend can't run and for the encoder prefix cache, whose states
+    are used as they are instead of running the ONNX encoder.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model, model_dir, load_float_model=None, quantize=False, num_threads=None, seed=None):
+        import numpy as np
+        import onnxruntime
+
+        super().__init__(model)
+        paths = export_onnx(model_dir, load_float_model or (lambda: model), quantize)
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.sessions = {name: onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+                         for name, path in paths.items()}
+        self.inputs = {name: {arg.name for arg in session.get_inputs()} for name, session in self.sessions.items()}
+
+        self.config = model.config
+        self.generation_config = model.generation_config
+        self.num_layers = model.config.decoder_layers
+        self.past_names = _past_names(self.num_layers, "past")
+        self.rng = np.random.default_rng(seed)
+
+    def generate(self, model_inputs, params):
+        import torch
+
+        settings = decoding_settings(self.generation_config, params)
+        if settings is None:
+            return super().generate(model_inputs, params)
+        return torch.from_numpy(self.decode(model_inputs, settings))
+
+    def run(self, graph, feeds):
+        # Exports can drop inputs a graph doesn't use, so only pass the ones it declares
+        return self.sessions[graph].run(None, {name: value for name, value in feeds.items()
+                                               if name in self.inputs[graph]})
+
+    def decode(self, model_inputs, settings):
+        """The greedy/sampling loop: returns decoder token ids (batch x length) like model.generate"""
+        import numpy as np
+
+        attention_mask = model_inputs["attention_mask"].cpu().numpy().astype(np.int64)
+        if "encoder_outputs" in model_inputs:
+            hidden = model_inputs["encoder_outputs"].last_hidden_state.float().cpu().numpy()
+        else:
+            input_ids = model_inputs["input_ids"].cpu().numpy().astype(np.int64)
+            hidden = self.run("encoder", {"input_ids": input_ids, "attention_mask": attention_mask})[0]
+
+        batch = hidden.shape[0]
+        eos = self.generation_config.eos_token_id
+        pad = self.generation_config.pad_token_id
+        if pad is None:
+            pad = eos
+        min_length, max_length = length_limits(settings)
+        streamer = settings["streamer"]
+        stopping_criteria = settings["stopping_criteria"]
+
+        sequences = np.full((batch, 1), self.config.decoder_start_token_id, dtype=np.int64)
+        if streamer is not None:
+            streamer.put(sequences)
+        feeds = {"decoder_input_ids": sequences, "encoder_hidden_states": hidden,
+                 "encoder_attention_mask": attention_mask}
+        outputs = self.run("decoder_init", feeds)
+        logits = outputs[0]
+        cache = outputs[1:]
+        cross = [cache[i + 2:i + 4] for i in range(0, len(cache), 4)]
+        self_cache = [cache[i:i + 2] for i in range(0, len(cache), 4)]
+        finished = np.zeros(batch, dtype=bool)
+
+        while True:
+            scores = self.process_scores(logits.astype(np.float32), sequences, min_length, max_length, settings)
+            if settings["do_sample"]:
+                next_tokens = self.sample(scores, settings)
+            else:
+                next_tokens = scores.argmax(axis=-1)
+            next_tokens = np.where(finished, pad, next_tokens).astype(np.int64)
+            sequences = np.concatenate([sequences, next_tokens[:, None]], axis=1)
+            if streamer is not None:
+                streamer.put(next_tokens)
+            finished |= next_tokens == eos
+            if finished.all() or sequences.shape[1] >= max_length:
+                break
+            if stopping_criteria is not None and stopping_criteria(sequences, scores):
+                break
+
+            feeds["decoder_input_ids"] = next_tokens[:, None]
+            for layer in range(self.num_layers):
+                names = self.past_names[4 * layer:4 * layer + 4]
+                feeds.update(zip(names, list(self_cache[layer]) + list(cross[layer])))
+            outputs = self.run("decoder_with_past", feeds)
+            logits = outputs[0]
+            self_cache = [outputs[i:i + 2] for i in range(1, len(outputs), 2)]
+
+        if streamer is not None:
+            streamer.end()
+        return sequences
+
+    def process_scores(self, scores, sequences, min_length, max_length, settings):
+        """The logits processors model.generate applies for these settings, in numpy"""
+        import numpy as np
+
+        eos = self.generation_config.eos_token_id
+        length = sequences.shape[1]
+        penalty = settings["repetition_penalty"]
+        if penalty and penalty != 1.0:
+            rows = np.arange(scores.shape[0])[:, None]
+            seen = scores[rows, sequences]
+            scores[rows, sequences] = np.where(seen < 0, seen * penalty, seen / penalty)
+
+        size = settings["no_repeat_ngram_size"]
+        if size and length + 1 >= size:
+            for row, tokens in enumerate(sequences.tolist()):
+                prefix = tokens[length - size + 1:]
+                banned = [tokens[i + size - 1] for i in range(length - size + 1) if tokens[i:i + size - 1] == prefix]
+                scores[row, banned] = -np.inf
+
+        if length < min_length:
+            scores[:, eos] = -np.inf
+        forced_eos = settings["forced_eos_token_id"]
+        if forced_eos is not None and length == max_length - 1:
+            scores[:, :] = -np.inf
+            scores[:, forced_eos] = 0.0
+        return scores
+
+    def sample(self, scores, settings):
+        """One token per row: temperature, top-k and top-p (nucleus) sampling"""
+        import numpy as np
+
+        temperature = settings["temperature"]
+        if temperature and temperature != 1.0:
+            scores = scores / temperature
+        top_k = settings["top_k"]
+        if top_k and top_k < scores.shape[-1]:
+            kth = np.partition(scores, -top_k, axis=-1)[:, -top_k][:, None]
+            scores = np.where(scores < kth, -np.inf, scores)
+        top_p = settings["top_p"]
+        if top_p is not None and top_p < 1.0:
+            order = np.argsort(-scores, axis=-1)
+            ordered = np.take_along_axis(scores, order, axis=-1)
+            probs = np.exp(ordered - ordered[:, :1])
+            probs /= probs.sum(axis=-1, keepdims=True)
+            # Keep the smallest set of tokens reaching top_p, and always the most likely one
+            remove = np.cumsum(probs, axis=-1) - probs >= top_p
+            remove[:, 0] = False
+            np.put_along_axis(scores, order, np.where(remove, -np.inf, ordered), axis=-1)
+
+        probs = np.exp(scores - scores.max(axis=-1, keepdims=True))
+        probs /= probs.sum(axis=-1, keepdims=True)
+        draws = self.rng.random((scores.shape[0], 1))
+        return np.minimum((np.cumsum(probs, axis=-1) < draws).sum(axis=-1), scores.shape[-1] - 1)
+
+
+def create_backend(name, model, model_dir, profile=None, load_float_model=None):
+    """
+    Create the named backend for a loaded model. `load_float_model` returns an fp32 copy
+    of the model for the ONNX export when the loaded one is quantized or bf16.
+    """
+    profile = profile or {}
+    if name == "eager":
+        return EagerBackend(model)
+    if name == "compile":
+        return CompiledBackend(model)
+    if name == "onnx":
+        quantize = profile.get("precision") == "int8"
+        if profile.get("precision", "fp32") == "fp32":
+            load_float_model = None
+        return OnnxBackend(model, model_dir, load_float_model=load_float_model, quantize=quantize,
+                           num_threads=profile.get("num_threads"))
+    raise ValueError(f"Unknown inference backend {name!r}, expected one of {', '.join(BACKENDS)}")
@@ -0,0 +1,177 @@
+"""
+CPU inference profiles for the chat model.
+
+A profile (CONFIG["model"]["inference_profile"]) picks the numeric precision
+and torch threading for inference:
+- "fp32": the model as saved
+- "int8": dynamic int8 quantization of every Linear layer (CPU only). The
+  quantized weights are cached in MODEL_DIR so it only happens once.
+- "bf16": bfloat16 weights, if the CPU supports bf16 kernels
+With "mmap_weights" the fp32 weights are memory-mapped from safetensors
+instead of copied (see shared_weights), so worker processes share them.
+"""
+import json
+import logging
+import os
+
+from file_lock import file_lock, temp_path
+
+logger = logging.getLogger(__name__)
+
+QUANTIZED_CACHE_FILE = "quantized_int8.pt"
+QUANTIZED_META_FILE = "quantized_int8.json"
+
+
+def apply_thread_settings(profile):
+    """Apply the profile's torch intra-op and inter-op thread counts"""
+    import torch
+
+    if profile.get("num_threads"):
+        torch.set_num_threads(profile["num_threads"])
+    if profile.get("num_interop_threads"):
+        try:
+            torch.set_num_interop_threads(profile["num_interop_threads"])
+        except RuntimeError as e:
+            # Can only be set once, before any inter-op parallel work has started
+            logger.warning("Could not set inter-op threads: %s", e)
+    logger.info("Torch threads: %d intra-op, %d inter-op", torch.get_num_threads(), torch.get_num_interop_threads())
+
+
+def bf16_supported():
+    """Check whether this CPU has native bf16 kernels"""
+    import torch
+
+    check = getattr(torch.ops.mkldnn, "_is_mkldnn_bf16_supported", None)
+    try:
+        return bool(check()) if check is not None else False
+    except Exception:
+        return False
+
+
+def weights_signature(model_dir):
+    """Identify the source weights a quantized cache was built from"""
+    import torch
+
+    signature = {"torch": torch.__version__}
+    for name in ("model.safetensors", "pytorch_model.bin"):
+        path = os.path.join(model_dir, name)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            signature.update({"weights": name, "size": stat.st_size, "mtime": stat.st_mtime})
+            break
+    return signature
+
+
+def _quantize(model):
+    import torch
+
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _empty_model(model_class, model_dir):
+    """Build the model architecture without loading (or randomly initializing) weights"""
+    from transformers import AutoConfig
+
+    config = AutoConfig.from_pretrained(model_dir)
+    try:
+        from transformers.modeling_utils import no_init_weights
+    except ImportError:
+        return model_class.from_config(config)
+    with no_init_weights():
+        return model_class.from_config(config)
+
+
+def _load_cached_quantized(model_class, model_dir, signature):
+    """The cached int8 model if it was built from these weights, else None"""
+    import torch
+
+    cache_path = os.path.join(model_dir, QUANTIZED_CACHE_FILE)
+    meta_path = os.path.join(model_dir, QUANTIZED_META_FILE)
+    if not (os.path.exists(cache_path) and os.path.exists(meta_path)):
+        return None
+    with open(meta_path) as f:
+        cached_signature = json.load(f)
+    if cached_signature != signature:
+        logger.info("Quantized cache is stale, rebuilding it")
+        return None
+    logger.info("Loading cached int8 model from %s", cache_path)
+    model = _empty_model(model_class, model_dir).eval()
+    # Uninitialized memory can hold NaNs that break the observers; the cached weights replace these
+    for module in model.modules():
+        if isinstance(module, torch.nn.Linear):
+            module.weight.data.zero_()
+    model = _quantize(model)
+    model.load_state_dict(torch.load(cache_path, map_location="cpu"))
+    return model
+
+
+def load_quantized_model(model_class, model_dir, use_cache=True):
+    """
+    Load an int8 dynamically quantized model, reusing the cached quantized weights
+    when they were built from the current weights with the current torch version.
+    """
+    import torch
+
+    if not use_cache:
+        logger.info("Quantizing Linear layers to int8...")
+        return _quantize(model_class.from_pretrained(model_dir, low_cpu_mem_usage=True).eval())
+
+    cache_path = os.path.join(model_dir, QUANTIZED_CACHE_FILE)
+    meta_path = os.path.join(model_dir, QUANTIZED_META_FILE)
+    signature = weights_signature(model_dir)
+    model = _load_cached_quantized(model_class, model_dir, signature)
+    if model is not None:
+        return model
+
+    # Workers starting together all miss the cache on first boot; one builds it, the rest wait and re-check
+    with file_lock(cache_path):
+        model = _load_cached_quantized(model_class, model_dir, signature)
+        if model is not None:
+            return model
+
+        logger.info("Quantizing Linear layers to int8...")
+        model = _quantize(model_class.from_pretrained(model_dir, low_cpu_mem_usage=True).eval())
+
+        # Write to temp files first so a crash never leaves a half-written cache
+        temp = temp_path(cache_path)
+        torch.save(model.state_dict(), temp)
+        os.replace(temp, cache_path)
+        temp = temp_path(meta_path)
+        with open(temp, "w") as f:
+            json.dump(signature, f)
+        os.replace(temp, meta_path)
+        logger.info("Cached int8 model to %s", cache_path)
+    return model
+
+
+def load_model_with_profile(model_class, model_dir, profile, device="cpu"):
+    """Load the model from `model_dir` with the precision the profile asks for"""
+    import torch
+
+    precision = profile.get("precision", "fp32")
+    if precision == "int8" and device != "cpu":
+        logger.warning("int8 dynamic quantization only runs on CPU, using fp32")
+        precision = "fp32"
+
+    if precision == "int8":
+        return load_quantized_model(model_class, model_dir, profile.get("cache_quantized", True))
+
+    if profile.get("mmap_weights") and device == "cpu":
+        from shared_weights import load_mmap_model
+
+        try:
+            model = load_mmap_model(model_class, model_dir)
+        except Exception as e:
+            logger.warning("Could not memory-map the weights, loading a private copy: %s", e)
+            model = model_class.from_pretrained(model_dir, low_cpu_mem_usage=True).eval()
+    else:
+        model = model_class.from_pretrained(model_dir, low_cpu_mem_usage=True).eval()
+    if precision == "bf16":
+        # The cast makes a private copy, so mmap sharing only holds for fp32
+        if device != "cpu" or bf16_supported():
+            model = model.to(torch.bfloat16)
+        else:
+            logger.warning("This CPU has no bf16 support, using fp32")
+    elif precision != "fp32":
+        logger.warning("Unknown precision %r, using fp32", precision)
+    return model
@@ -0,0 +1,165 @@
+"""
+Keyword intent and mood classification.
+
+Every keyword list the chat uses (question words, fallback topics, mood cues)
+is compiled into one index. Classifying a message lowercases and tokenizes it
+once, then looks each word up in a dict, so the cost no longer grows with the
+number of keyword lists. Keywords match whole words: "you" doesn't match
+"young" and "god" doesn't match "good". A trailing "*" makes a keyword a
+prefix ("invent*" matches "invention"), and keywords with spaces match
+consecutive words.
+
+The result is an Intents bit vector with one bit per feature.
+"""
+import re
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Feature name -> keywords
+FEATURE_KEYWORDS = {
+    # Short inputs skip the model unless they ask something
+    "question": ["why", "how", "what", "when", "where", "explain"],
+    # Questions that get a science aside in improve_response_quality
+    "asks_explanation": ["how", "why", "what", "explain"],
+    # Replies that already sound scientific
+    "mentions_science": ["dimension*", "science*", "scientific", "quantum", "portal*"],
+
+    # Topics for themed fallback replies
+    "topic_multiverse": ["universe*", "dimension*", "portal*", "space*", "time", "times"],
+    "topic_science": ["science*", "scientific", "physics", "chemistry", "biology", "math*"],
+    "topic_family": ["morty*", "family", "beth*", "summer*", "jerry*"],
+
+    # Question types for the generation tier (generation_policy)
+    "topic_technical": ["science*", "scientific", "physics", "dimension*", "universe*", "theor*", "quantum",
+                        "technolog*", "portal*", "invent*", "experiment*"],
+    "topic_personal": ["you", "your", "feel*", "think", "opinion*", "morty*", "family", "beth*", "jerry*",
+                       "summer*", "citadel*", "council*", "enem*"],
+    "topic_philosophical": ["meaning*", "life", "purpose*", "exist*", "universe*", "god", "gods", "reality",
+                            "conscious*", "soul*", "moral*"],
+
+    # Mood cues in determine_rick_mood
+    "mood_question": ["why", "how come", "explain*"],
+    "mood_frustrated": ["basic", "simple", "obvious*", "everyone knows"],
+    "mood_excited": ["discover*", "invent*", "breakthrough*", "amazing", "incredible"],
+    "mood_dismissive": ["normal", "everyday", "regular", "human*", "feeling*", "emotion*"],
+    "mood_drunk": ["drink*", "drank", "alcohol*", "beer*", "whiskey", "flask*", "drunk*", "wasted"],
+}
+
+
+class Intents:
+    """The features found in one text, as a bit vector over an IntentIndex's features"""
+
+    __slots__ = ("mask", "index")
+
+    def __init__(self, mask, index):
+        self.mask = mask
+        self.index = index
+
+    def __contains__(self, name):
+        return bool(self.mask & self.index.bits[name])
+
+    def __repr__(self):
+        return f"Intents({', '.join(self.names())})"
+
+    def names(self):
+        """Feature names present, in index order"""
+        return [name for name, bit in self.index.bits.items() if self.mask & bit]
+
+    def vector(self):
+        """0/1 feature vector in index order"""
+        return [1 if self.mask & bit else 0 for bit in self.index.bits.values()]
+
+
+class IntentIndex:
+    """Precompiled keyword index mapping words, prefixes and phrases to feature bits"""
+
+    def __init__(self, feature_keywords):
+        self.names = list(feature_keywords)
+        self.bits = {name: 1 << i for i, name in enumerate(self.names)}
+        self._words = {}
+        self._prefixes = {}
+        self._phrases = {}
+
+        for name, keywords in feature_keywords.items():
+            bit = self.bits[name]
+            for keyword in keywords:
+                keyword = keyword.lower()
+                if " " in keyword:
+                    key = tuple(WORD_PATTERN.findall(keyword))
+                    self._phrases[key] = self._phrases.get(key, 0) | bit
+                elif keyword.endswith("*"):
+                    prefix = keyword[:-1]
+                    self._prefixes[prefix] = self._prefixes.get(prefix, 0) | bit
+                else:
+                    self._words[keyword] = self._words.get(keyword, 0) | bit
+
+        self._prefix_lengths = sorted({len(prefix) for prefix in self._prefixes})
+        self._phrase_lengths = sorted({len(phrase) for phrase in self._phrases})
+        # Extra bit on words that start a phrase, so phrases are only checked when one could match
+        self._phrase_start_bit = 1 << len(self.names)
+        self._phrase_starts = {phrase[0] for phrase in self._phrases}
+        self._feature_mask = self._phrase_start_bit - 1
+        # Memo of every word seen so far; chat vocabulary is small, so this stays bounded in practice
+        self._word_masks = {}
+        self._max_memo = 100000
+
+    def tokenize(self, text):
+        return WORD_PATTERN.findall(text.lower())
+
+    def _word_mask(self, word):
+        mask = self._word_masks.get(word)
+        if mask is None:
+            mask = self._words.get(word, 0)
+            for length in self._prefix_lengths:
+                if length > len(word):
+                    break
+                mask |= self._prefixes.get(word[:length], 0)
+            if word in self._phrase_starts:
+                mask |= self._phrase_start_bit
+            if len(self._word_masks) < self._max_memo:
+                self._word_masks[word] = mask
+        return mask
+
+    def classify_tokens(self, tokens):
+        """Feature mask for an already tokenized text"""
+        memo = self._word_masks
+        mask = 0
+        for word in tokens:
+            word_mask = memo.get(word)
+            mask |= self._word_mask(word) if word_mask is None else word_mask
+        if mask & self._phrase_start_bit:
+            for length in self._phrase_lengths:
+                for i in range(len(tokens) - length + 1):
+                    mask |= self._phrases.get(tuple(tokens[i:i + length]), 0)
+        return mask & self._feature_mask
+
+    def classify(self, text):
+        """Intents for one text"""
+        return Intents(self.classify_tokens(self.tokenize(text)), self)
+
+    def classify_batch(self, texts):
+        """Intents for many texts; repeated texts are classified once"""
+        findall = WORD_PATTERN.findall
+        classify_tokens = self.classify_tokens
+        seen = {}
+        results = []
+        for text in texts:
+            intents = seen.get(text)
+            if intents is None:
+                intents = seen[text] = Intents(classify_tokens(findall(text.lower())), self)
+            results.append(intents)
+        return results
+
+
+# Shared index used by the engine and rick_processor
+INTENTS = IntentIndex(FEATURE_KEYWORDS)
+
+
+def classify(text):
+    """Intents for one text using the shared index"""
+    return INTENTS.classify(text)
+
+
+def classify_batch(texts):
+    """Intents for many texts using the shared index"""
+    return INTENTS.classify_batch(texts)
@@ -0,0 +1,64 @@
+"""
+Structured log records.
+
+Fields passed with `extra=` (session, tier, token counts, stage timings...)
+are written out with every record instead of being folded into the message
+text: as key=value pairs after the message in the "text" format, or as the
+keys of a one-line JSON object in the "json" format, so log pipelines can
+filter and aggregate on them.
+"""
+import json
+import logging
+
+# Attributes every LogRecord has; anything else on a record came from `extra=`
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def record_fields(record):
+    """The `extra=` fields of a log record"""
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+
+class KeyValueFormatter(logging.Formatter):
+    """The usual text line followed by the record's fields as key=value pairs"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = record_fields(record)
+        if not fields:
+            return line
+        pairs = " ".join(f"{key}={json.dumps(value, default=str, ensure_ascii=False)}"
+                         for key, value in fields.items())
+        head, newline, trace = line.partition("\n")
+        return f"{head} {pairs}{newline}{trace}"
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message and the record's fields"""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(record_fields(record))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+FORMATTERS = {"text": KeyValueFormatter, "json": JsonFormatter}
+
+
+def configure_logging(level, log_format="text"):
+    """Send the root logger's records to stderr at `level` in the "text" or "json" format"""
+    if log_format not in FORMATTERS:
+        raise ValueError(f"Unknown log format {log_format!r}, expected one of {sorted(FORMATTERS)}")
+    handler = logging.StreamHandler()
+    handler.setFormatter(FORMATTERS[log_format]())
+    logging.basicConfig(level=level.upper(), handlers=[handler])
@@ -0,0 +1,71 @@
+"""
+Encoder-output cache for the constant persona prefix.
+
+BlenderBot is an encoder-decoder model, so every request used to re-encode
+the persona preamble along with the conversation. Here the preamble is run
+through the encoder once and its hidden states are kept; each request only
+encodes its own conversation turns, and the two are concatenated along the
+sequence axis before decoding. The decoder cross-attends to both, as if they
+were one input.
+
+The encoder is bidirectional, so this isn't bit-identical to encoding the
+joined text: preamble and conversation don't attend to each other inside the
+encoder, only through the decoder's cross-attention. In exchange the
+conversation gets the model's full position budget to itself.
+
+The cached states are rebuilt whenever the model object, the preamble text or
+the model dtype changes.
+"""
+import threading
+
+
+class EncoderPrefixCache:
+    """Keep the encoder hidden states for a fixed prefix and prepend them to each batch"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key = None
+        self._states = None
+        self.builds = 0
+
+    def prefix_states(self, model, tokenizer, prefix):
+        """Encoder hidden states for `prefix`, shape (1, prefix_len, hidden)"""
+        import torch
+
+        key = (id(model), prefix, str(model.dtype))
+        with self._lock:
+            if self._key != key:
+                ids = tokenizer(prefix, return_tensors="pt", truncation=True,
+                                max_length=model.config.max_position_embeddings)
+                ids = ids.to(model.device)
+                with torch.no_grad():
+                    self._states = model.get_encoder()(**ids).last_hidden_state
+                self._key = key
+                self.builds += 1
+            return self._states
+
+    def encode(self, model, tokenizer, prefix, input_ids, attention_mask):
+        """
+        Encode a batch of conversation inputs and prepend the cached prefix states.
+        Returns (encoder_outputs, attention_mask) to pass to model.generate.
+        """
+        import torch
+        from transformers.modeling_outputs import BaseModelOutput
+
+        prefix_states = self.prefix_states(model, tokenizer, prefix)
+        batch_size = input_ids.shape[0]
+        with torch.no_grad():
+            states = model.get_encoder()(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+        states = torch.cat([prefix_states.expand(batch_size, -1, -1), states], dim=1)
+        prefix_mask = attention_mask.new_ones((batch_size, prefix_states.shape[1]))
+        return BaseModelOutput(last_hidden_state=states), torch.cat([prefix_mask, attention_mask], dim=1)
+
+    def clear(self):
+        with self._lock:
+            self._key = None
+            self._states = None
+
+
+def supports_prefix_cache(model):
+    """Only encoder-decoder models have encoder outputs to reuse"""
+    return bool(getattr(model.config, "is_encoder_decoder", False)) and hasattr(model, "get_encoder")
@@ -0,0 +1,162 @@
+"""
+Cache of raw model outputs keyed on the normalized prompt plus generation parameters.
+
+Only the raw model output is stored, before improve_response_quality and
+rickify_response run, so cached replies still get fresh personality
+randomization. Entries are evicted LRU-first when the entry or byte cap is
+reached, and expire after a TTL. The cache can optionally be persisted to a
+JSON file. The file records a fingerprint of the settings that decide the
+model's output (model, quantization, backend, preamble); a file written
+under different settings is discarded on load instead of serving replies
+from the old model.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_prompt(text):
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    return WHITESPACE_PATTERN.sub(" ", text.lower()).strip().rstrip("?!.").strip()
+
+
+def make_cache_key(prompt, params):
+    """Build a cache key from the prompt and resolved generation parameters"""
+    return normalize_prompt(prompt) + "\x00" + json.dumps(params, sort_keys=True)
+
+
+def cache_fingerprint(**settings):
+    """Short hash of the settings that decide the model's output"""
+    return hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache of raw model outputs with entry and byte caps.
+    `fingerprint` identifies the model setup the outputs came from (see cache_fingerprint).
+    """
+
+    def __init__(self, max_entries=2048, max_bytes=8 * 1024 * 1024, ttl=86400, persist_path=None,
+                 persist_every=20, fingerprint=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.persist_path = persist_path
+        self.persist_every = persist_every
+        self.fingerprint = fingerprint
+
+        # key -> (response, stored_at, size_bytes)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if persist_path:
+            self.load()
+
+    def get(self, prompt, params):
+        """Return the cached raw output for this prompt and parameters, or None"""
+        key = make_cache_key(prompt, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and time.time() - entry[1] > self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, prompt, params, response):
+        """Store a raw model output"""
+        key = make_cache_key(prompt, params)
+        self._store(key, response, time.time())
+
+        if self.persist_path and self.persist_every:
+            with self._lock:
+                self._unsaved += 1
+                save = self._unsaved >= self.persist_every
+            if save:
+                self.save()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def save(self):
+        """Write the cache to persist_path (atomically)"""
+        if not self.persist_path:
+            return
+        with self._lock:
+            data = {key: [response, stored_at] for key, (response, stored_at, _) in self._entries.items()}
+            self._unsaved = 0
+        tmp_path = self.persist_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": self.fingerprint, "entries": data}, f)
+        os.replace(tmp_path, self.persist_path)
+
+    def load(self):
+        """Load entries from persist_path, skipping any that have expired"""
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Could not load response cache from %s: %s", self.persist_path, e)
+            return
+        if not isinstance(data, dict) or "entries" not in data or data.get("fingerprint") != self.fingerprint:
+            logger.info("Response cache at %s is from a different model setup, starting empty", self.persist_path)
+            return
+        now = time.time()
+        for key, (response, stored_at) in data["entries"].items():
+            if not self.ttl or now - stored_at <= self.ttl:
+                self._store(key, response, stored_at)
+
+    def _store(self, key, response, stored_at):
+        size = len(key.encode("utf-8")) + len(response.encode("utf-8"))
+        if self.max_bytes and size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (response, stored_at, size)
+            self._bytes += size
+            # Evict least recently used entries until we're under both caps
+            while (self.max_entries and len(self._entries) > self.max_entries) or \
+                    (self.max_bytes and self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
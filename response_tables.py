@@ -0,0 +1,118 @@
+"""
+Canned reply tables, compiled once into constant-time pickers.
+
+rick_config.RESPONSE_TABLES declares each table as categories in priority
+order, each with the intent features and keywords that select it and its
+weighted replies. compile_tables() turns them into:
+- one bit per category: intent features become a mask over intent.INTENTS,
+  and the table's keywords get their own IntentIndex, so choosing a category
+  is a few bit tests on masks the message needs anyway
+- a Vose alias table per category, so a weighted pick is two random numbers
+  and two list lookups however many replies the category has
+
+None of this touches the model, so the tables also answer every message
+while the server is in degraded mode (see degraded_mode.py).
+"""
+import random
+
+from intent import INTENTS, IntentIndex, classify
+
+
+class AliasTable:
+    """Weighted random choice in O(1) (Vose's alias method)"""
+
+    __slots__ = ("items", "probability", "alias")
+
+    def __init__(self, items, weights):
+        if not items:
+            raise ValueError("An alias table needs at least one item")
+        if any(weight <= 0 for weight in weights):
+            raise ValueError("Weights must be positive")
+        count = len(items)
+        total = float(sum(weights))
+        scaled = [weight * count / total for weight in weights]
+        probability = [1.0] * count
+        alias = list(range(count))
+        small = [i for i, value in enumerate(scaled) if value < 1.0]
+        large = [i for i, value in enumerate(scaled) if value >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            probability[less] = scaled[less]
+            alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+        # Whatever is left is 1.0 up to rounding, so it keeps its own slot
+        self.items = tuple(items)
+        self.probability = tuple(probability)
+        self.alias = tuple(alias)
+
+    def __len__(self):
+        return len(self.items)
+
+    def pick(self, rng=random):
+        slot = int(rng.random() * len(self.items))
+        return self.items[slot] if rng.random() < self.probability[slot] else self.items[self.alias[slot]]
+
+
+class ResponseTable:
+    """One compiled table: categories in priority order, each an AliasTable of replies"""
+
+    def __init__(self, name, categories, intent_index=INTENTS):
+        if not categories:
+            raise ValueError(f"Response table {name!r} has no categories")
+        self.name = name
+        self.intent_index = intent_index
+        self.names = []
+        self.pickers = []
+        # Per category: mask over intent_index's features and over the keyword index's features
+        self.intent_masks = []
+        self.keyword_masks = []
+        keywords = {}
+        for category in categories:
+            category_name = category["name"]
+            features = category.get("intents", ())
+            unknown = [feature for feature in features if feature not in intent_index.bits]
+            if unknown:
+                raise ValueError(f"Unknown intent features in {name}.{category_name}: {unknown}")
+            responses = [response if isinstance(response, str) else response[0]
+                         for response in category["responses"]]
+            weights = [1 if isinstance(response, str) else response[1] for response in category["responses"]]
+            self.names.append(category_name)
+            self.pickers.append(AliasTable(responses, weights))
+            self.intent_masks.append(sum(intent_index.bits[feature] for feature in set(features)))
+            if category.get("keywords"):
+                keywords[category_name] = category["keywords"]
+        self.keyword_index = IntentIndex(keywords) if keywords else None
+        self.keyword_masks = [self.keyword_index.bits.get(name, 0) if self.keyword_index else 0
+                              for name in self.names]
+        # Categories with no intents or keywords match everything; without one, the last category is the default
+        self.default = next((i for i, (intent_mask, keyword_mask)
+                             in enumerate(zip(self.intent_masks, self.keyword_masks))
+                             if not intent_mask and not keyword_mask), len(self.names) - 1)
+        self.uses_intents = any(self.intent_masks)
+
+    def category(self, text="", intents=None):
+        """Index of the category a message falls in"""
+        if intents is None and self.uses_intents:
+            intents = classify(text)
+        intent_mask = intents.mask if intents is not None else 0
+        # Keywords are only looked up once a category that has some is reached
+        keyword_mask = None
+        for i in range(self.default):
+            if intent_mask & self.intent_masks[i]:
+                return i
+            if self.keyword_masks[i]:
+                if keyword_mask is None:
+                    keyword_mask = self.keyword_index.classify(text).mask
+                if keyword_mask & self.keyword_masks[i]:
+                    return i
+        return self.default
+
+    def pick(self, text="", rng=random, intents=None):
+        """A reply for a message; `intents` is its intent.Intents if the caller already classified it"""
+        return self.pickers[self.category(text, intents)].pick(rng)
+
+
+def compile_tables(tables, intent_index=INTENTS):
+    """Compile rick_config.RESPONSE_TABLES-style declarations into {name: ResponseTable}"""
+    return {name: ResponseTable(name, categories, intent_index) for name, categories in tables.items()}
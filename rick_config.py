@@ -22,28 +22,295 @@ CONFIG = {
             "microsoft/DialoGPT-medium"
         ],
         
-        # Default generation parameters
-        "default_params": {
-            "max_length": 150,
-            "min_length": 30,
-            "temperature": 0.85,
-            "top_p": 0.92,
-            "num_beams": 4,
-            "repetition_penalty": 1.2,
-            "no_repeat_ngram_size": 2
+        # CPU inference tuning
+        "inference_profile": {
+            # "fp32", "int8" (dynamic quantization of Linear layers, CPU only) or "bf16"
+            "precision": "fp32",
+
+            # Torch intra-op / inter-op thread counts (None keeps torch's defaults)
+            "num_threads": None,
+            "num_interop_threads": None,
+
+            # Save the int8 weights in the model directory so boots skip quantization
+            "cache_quantized": True,
+
+            # Memory-map the fp32 safetensors weights instead of copying them, so worker
+            # processes on one host share a single copy through the page cache (CPU only)
+            "mmap_weights": True
+        },
+
+        # Encode the persona preamble once per model load and reuse its encoder states,
+        # so each request only encodes the conversation (encoder-decoder models only)
+        "prefix_cache": True,
+
+        # Inference backend behind model.generate: "eager" (PyTorch), "compile" (torch.compile)
+        # or "onnx" (exported once to MODEL_DIR/onnx and run on CPU ONNX Runtime; greedy and
+        # sampled tiers only, beam search and assisted decoding stay on PyTorch)
+        "backend": "eager"
+    },
+
+    # Generation tiers: each message's intents pick how hard the model works on it.
+    # num_beams and the other beam search settings only apply to /chat: streamed Socket.IO replies
+    # (streaming.enabled) decode with one beam and keep the tier's sampling and length settings,
+    # so the quality tier streams as top-p sampling and the standard tier as greedy decoding.
+    "generation": {
+        "tiers": {
+            # Greedy with a short reply, for personal chit-chat
+            "fast": {
+                "params": {
+                    "num_beams": 1,
+                    "do_sample": False,
+                    "max_new_tokens": 32,
+                    "min_new_tokens": 8,
+                    "repetition_penalty": 1.2,
+                    "no_repeat_ngram_size": 3
+                },
+                # Latency target in milliseconds (misses are counted in /metrics)
+                "slo_ms": 1500,
+                # Use the draft model below for assisted decoding (greedy tiers only)
+                "assisted": True
+            },
+            # Small beam, for philosophical questions
+            "standard": {
+                "params": {
+                    "num_beams": 2,
+                    "do_sample": False,
+                    "max_new_tokens": 48,
+                    "min_new_tokens": 12,
+                    "repetition_penalty": 1.2,
+                    "no_repeat_ngram_size": 2,
+                    "early_stopping": True
+                },
+                "slo_ms": 3000
+            },
+            # The full beam-search sampling the chat always used, for scientific and unclassified questions
+            "quality": {
+                "params": {
+                    "max_length": 100,
+                    "min_length": 20,
+                    "do_sample": True,
+                    "temperature": 0.9,
+                    "top_p": 0.92,
+                    "num_beams": 4,
+                    "repetition_penalty": 1.2,
+                    "no_repeat_ngram_size": 2
+                },
+                "slo_ms": 6000
+            }
+        },
+
+        # (intent feature, tier) rules checked in order; the first match wins
+        "rules": [
+            ["topic_technical", "quality"],
+            ["topic_personal", "fast"],
+            ["topic_philosophical", "standard"]
+        ],
+        # Tier for messages no rule matches
+        "default_tier": "quality",
+
+        # Smaller model that drafts tokens for the main model to verify (assisted decoding).
+        # It shares BlenderBot's tokenizer; it's downloaded to MODEL_DIR/assistant on first use.
+        "assistant": {
+            "enabled": False,
+            "name": "facebook/blenderbot-400M-distill"
         }
     },
     
+    # Server startup settings
+    "startup": {
+        # "background" binds the server right away and loads the model in a thread
+        # (requests get themed fallback replies until it's ready); "blocking" loads first
+        "model_loading": "background"
+    },
+
     # Conversation settings
     "conversation": {
-        # Maximum conversation turns to remember
-        "max_turns": 5,
-        
-        # Whether to add Rick-specific context to each prompt
-        "use_rick_context": True,
-        
-        # Whether to use adaptive generation parameters based on question type
-        "use_adaptive_generation": True
+        # Maximum conversation turns to remember (user messages and Rick's replies each count)
+        "max_turns": 10,
+
+        # Prompt token budget for the preamble plus recent turns
+        # (clamped to the model's maximum positions, 128 for BlenderBot)
+        "max_context_tokens": 128,
+
+        # Persona line placed before the conversation in every prompt
+        "preamble": "You are Rick Sanchez from Rick and Morty.",
+
+        # Text placed after the preamble and between turns (BlenderBot was trained on
+        # newline-separated dialogue history)
+        "turn_separator": "\n"
+    },
+
+    # Session storage settings
+    "sessions": {
+        # "memory" keeps sessions in-process, "sqlite" also persists history across restarts
+        "backend": "memory",
+
+        # Maximum number of sessions to keep (least recently used are dropped first)
+        "max_sessions": 1000,
+
+        # Drop sessions that have been idle for this many seconds
+        "idle_ttl": 3600,
+
+        # Database file for the sqlite backend (relative to the app directory)
+        "sqlite_path": "sessions.db",
+
+        # Several processes use the same sqlite database (cluster.py turns this on for its workers)
+        "shared": False
+    },
+
+    # Inference batching settings
+    "batching": {
+        # Whether to batch concurrent requests into a single model.generate call
+        "enabled": True,
+
+        # Maximum number of prompts per batch
+        "max_batch_size": 8,
+
+        # How long to wait for more prompts before running a batch (milliseconds)
+        "batch_window_ms": 15,
+
+        # "static": one model.generate per batch, so a batch lasts as long as its longest reply.
+        # "continuous": a decode loop where prompts join and leave the running batch at every
+        # token (greedy and sampled tiers; beam search tiers stay static)
+        "mode": "static"
+    },
+
+    # Response cache settings (raw model outputs, before rickification)
+    "cache": {
+        # Whether to reuse model outputs for repeated prompts
+        "enabled": True,
+
+        # Maximum number of cached responses and their total size in bytes
+        "max_entries": 2048,
+        "max_bytes": 8 * 1024 * 1024,
+
+        # Seconds before a cached response expires
+        "ttl": 24 * 60 * 60,
+
+        # File to persist the cache to across restarts (None keeps it in memory only). It's
+        # discarded on load if the model, inference profile, backend, preamble or turn separator changed.
+        "persist_path": None
+    },
+
+    # Semantic cache: reuse the raw model output of an earlier message that says the same thing in
+    # other words after the same earlier turns (so mostly first messages). Only the latest message
+    # is compared by similarity; the conversation before it has to match exactly.
+    "semantic_cache": {
+        "enabled": False,
+
+        # "hashed" (hashed word and character n-grams, nothing to download) or a sentence
+        # encoder such as "sentence-transformers/all-MiniLM-L6-v2", downloaded once to model/embedder
+        "encoder": "hashed",
+
+        # Vector size for the hashed encoder
+        "dimensions": 4096,
+
+        # Minimum cosine similarity for a hit
+        "threshold": 0.85,
+
+        # Entries kept per generation tier (least recently used go first) and seconds before they expire
+        "max_entries_per_bucket": 1024,
+        "ttl": 24 * 60 * 60
+    },
+
+    # Inference worker settings
+    "inference": {
+        # Run generation in native worker threads so the eventlet hub stays responsive
+        "use_worker_threads": True,
+
+        # Maximum number of generations running at the same time
+        "max_concurrent_generations": 8
+    },
+
+    # Flood protection for chat messages: over a limit, the client gets {"type": "busy"} instead of a reply
+    "backpressure": {
+        # Token buckets per session and per client IP: sustained messages per second and burst size
+        # (a rate of 0 disables that limit)
+        "session_rate": 0.5,
+        "session_burst": 5,
+        "ip_rate": 5.0,
+        "ip_burst": 30,
+
+        # Rate limit buckets kept in memory (the least recently seen clients are forgotten first)
+        "max_tracked_clients": 10000,
+
+        # Messages a session sends while its previous reply is being generated are answered together,
+        # in one generation, up to this many at a time
+        "max_coalesced_messages": 5,
+
+        # Extra time to wait for more messages from a session before answering (milliseconds; 0 answers right away)
+        "coalesce_window_ms": 0,
+
+        # Generations running or waiting for a slot before new messages are turned away (0 = no limit)
+        "max_inflight": 64
+    },
+
+    # Degraded mode: under overload, answer every message from RESPONSE_TABLES (below) without the model,
+    # until the backlog has drained
+    "degraded_mode": {
+        "enabled": True,
+
+        # Switch in when this many prompts are waiting (for a generation slot or a batch)...
+        "enter_queue_depth": 32,
+
+        # ...or when system CPU use reaches this fraction while more than exit_queue_depth prompts wait
+        # (generation alone keeps the CPU busy, so a busy CPU without a backlog isn't overload)
+        "enter_cpu": 0.95,
+
+        # Switch back once the backlog is at most this deep and CPU use is below exit_cpu,
+        # but not sooner than min_seconds after switching in
+        "exit_queue_depth": 8,
+        "exit_cpu": 0.8,
+        "min_seconds": 10,
+
+        # How often the queue depth and CPU use are sampled (seconds)
+        "check_interval": 1.0
+    },
+
+    # Request deadline settings
+    "deadlines": {
+        # Seconds a chat message may take before it gets a themed reply instead of the model's
+        # (clients can ask for less with "timeout_ms"; 0 disables deadlines)
+        "request_timeout": 30,
+
+        # Answer right away with a themed reply when the batch queue ahead of a message
+        # would already take longer than its deadline
+        "admission_control": True
+    },
+
+    # Streaming settings
+    "streaming": {
+        # Send Socket.IO replies sentence by sentence while the model decodes. Streamed prompts
+        # share batches, admission control and the queue with /chat prompts.
+        "enabled": True,
+
+        # Give up if the model produces nothing for this many seconds
+        "chunk_timeout": 60
+    },
+
+    # Multi-process mode (python cluster.py)
+    "cluster": {
+        # Worker processes, each holding its own copy of the model
+        "workers": 2,
+
+        # Workers listen on base_port, base_port + 1, ...; the sticky router listens on PORT (default 5000)
+        "base_port": 5101,
+
+        # Socket.IO message queue shared by the workers: "sqlite:///file" (relative to the app
+        # directory) for a single host, or a Redis/Kombu URL for several hosts
+        "message_queue": "sqlite:///socketio_queue.db",
+
+        # How often each worker polls the SQLite message queue (milliseconds)
+        "queue_poll_ms": 20
+    },
+
+    # Logging settings
+    "logging": {
+        # DEBUG logs every request and response; RICK_LOG_LEVEL overrides this
+        "level": "INFO",
+        # "text" lines with key=value fields (session, tier, tokens, stage timings), or
+        # "json" for one JSON object per line; RICK_LOG_FORMAT overrides this
+        "format": "text"
     },
     
     # Character settings
@@ -65,7 +332,10 @@ CONFIG = {
         },
         
         # Whether to dynamically determine mood based on question content
-        "dynamic_mood": True
+        "dynamic_mood": True,
+
+        # Seed for each session's personality RNG (None for non-reproducible output)
+        "seed": None
     },
     
     # Response enhancement
@@ -99,4 +369,79 @@ FALLBACK_RESPONSES = [
     "The Council of Ricks must be jamming our transmission. Try again with a question worthy of my time.",
     "My portal gun is interfering with the connection. Maybe try asking something that doesn't waste my time?",
     "Did Jerry program this server? Because it's failing just like his marriage. Ask something else."
-]
\ No newline at end of file
+]
+
+# Canned replies that need no model, compiled at startup by response_tables.py.
+# Each table is a list of categories in priority order; a message gets the first category
+# whose "intents" (feature names from intent.py) or "keywords" it matches, and a category
+# with neither matches everything. Keywords follow intent.py's rules: whole words, a
+# trailing "*" for a prefix, spaces for a phrase. Responses are strings, or [text, weight]
+# to make one come up more often (the default weight is 1).
+RESPONSE_TABLES = {
+    # Themed replies when the model can't answer (deadline, not loaded, error, degraded mode)
+    "themed": [
+        {
+            "name": "multiverse",
+            "intents": ["topic_multiverse"],
+            "responses": [
+                "The multiverse is infinitely complex. Your human brain couldn't comprehend it.",
+                "Dimensions are like TV channels, except every channel has a different version of you that's slightly less pathetic.",
+                "Time and space are just constructs. I've been to places where time runs backwards and pizza eats people.",
+                "My portal gun lets me travel anywhere in the multiverse. It's powered by crystallized quantum energy, something you'll never understand.",
+            ]
+        },
+        {
+            "name": "science",
+            "intents": ["topic_science"],
+            "responses": [
+                "Science isn't about asking stupid questions, it's about questioning stupid answers.",
+                "Your understanding of physics is like a toddler trying to understand calculus.",
+                "I've synthesized chemicals that would make your brain explode just by looking at them.",
+                "Math is the universal language. Too bad you're speaking baby talk.",
+            ]
+        },
+        {
+            "name": "family",
+            "intents": ["topic_family"],
+            "responses": [
+                "Morty's a good kid, but sometimes his stupidity makes me want to move to another dimension.",
+                "My family? They're the reason I drink. Well, one of the reasons.",
+                "Beth's my daughter. She's almost as smart as me, but wasted her potential cutting up horses.",
+                "Jerry is the human equivalent of a participation trophy.",
+                "Summer's alright. At least she doesn't follow me around like a lost puppy like Morty.",
+            ]
+        },
+        {
+            "name": "general",
+            "responses": [
+                "I've seen things that would make your brain melt.",
+                "That's the kind of question that gets people killed in dimension C-137.",
+                "I could explain it to you, but you'd need at least 15 more IQ points to understand.",
+                "I don't have time for this. I've got experiments running in the garage.",
+                "In an infinite multiverse, there's a version of me that cares about this question. I'm not that version.",
+            ]
+        },
+    ],
+
+    # Dismissive replies for very short inputs that aren't questions
+    "simple": [
+        {
+            "name": "dismissive",
+            "responses": [
+                "Yeah, whatever.",
+                "Is that all you've got to say?",
+                "Fascinating conversation skills you got there.",
+                "Oh great, another genius with vocabulary issues.",
+                "Keep it coming, Einstein.",
+                "That's your brilliant contribution?",
+                "Wow, profound stuff right there.",
+                "I'm blown away by your eloquence.",
+            ]
+        },
+    ],
+
+    # Replies when the whole reply pipeline fails
+    "fallback": [
+        {"name": "error", "responses": FALLBACK_RESPONSES},
+    ],
+}
@@ -0,0 +1,996 @@
+"""
+Rick inference engine.
+
+RickEngine owns the model, tokenizer, device, session store, response cache,
+batch scheduler and generation settings, and turns a session's message into
+a rickified reply. It has no web dependencies, so it can be benchmarked,
+profiled and scaled on its own; app.py is a thin Flask/Socket.IO adapter on
+top of it.
+
+Creating an engine is cheap: nothing is loaded and no threads are started
+until load() (or start_loading()) is called.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from batching import BatchScheduler, RowStreamers
+from context_builder import ContextBuilder, context_budget
+from continuous_batching import ContinuousBatcher, supports_continuous_batching
+from degraded_mode import DegradedMode
+from deadlines import DeadlineExceeded, Overloaded, deadline_stopping_criteria
+from generation_policy import GenerationPolicy
+from intent import classify
+from inference_backends import EagerBackend, create_backend
+from inference_profile import apply_thread_settings, load_model_with_profile
+from metrics import REGISTRY
+from prefix_cache import EncoderPrefixCache, supports_prefix_cache
+from response_cache import ResponseCache, cache_fingerprint
+from rick_config import CONFIG
+from rick_processor import (RickPersonality, StreamingRickifier, clean_generic_phrases, get_fallback_response,
+                            get_simple_response, get_themed_response, improve_response_quality, is_simple_input,
+                            rickify_response)
+from semantic_cache import SemanticCache, create_embedder
+from session_store import create_session_store
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Engine metrics, exposed at /metrics by the web adapter
+STAGE_SECONDS = REGISTRY.histogram(
+    "rick_stage_seconds", "Time spent in each response stage (context, tokenize, encode, generate, decode, improve, rickify)")
+QUEUE_WAIT_SECONDS = REGISTRY.histogram("rick_queue_wait_seconds", "Time prompts waited for a batch slot")
+BATCH_SIZE = REGISTRY.histogram("rick_batch_size", "Prompts per batched generate call",
+                                buckets=(1, 2, 4, 8, 16, 32, 64))
+PROMPT_TOKENS = REGISTRY.counter("rick_prompt_tokens_total", "Prompt tokens sent to the model")
+GENERATED_TOKENS = REGISTRY.counter("rick_generated_tokens_total", "Tokens generated by the model")
+TOKENS_PER_SECOND = REGISTRY.histogram("rick_generation_tokens_per_second", "Generated tokens per second per batch",
+                                       buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000))
+FALLBACKS = REGISTRY.counter("rick_fallback_responses_total", "Replies that didn't come from the model, by reason")
+TIER_SECONDS = REGISTRY.histogram("rick_tier_generation_seconds",
+                                  "Model response time by generation tier, including the batch queue")
+SLO_MISSES = REGISTRY.counter("rick_tier_slo_misses_total", "Generations slower than their tier's latency SLO")
+SEMANTIC_LOOKUP_SECONDS = REGISTRY.histogram("rick_semantic_cache_lookup_seconds",
+                                             "Time spent embedding and searching in the semantic cache",
+                                             buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                                                      0.05, 0.1))
+DEGRADED_SWITCHES = REGISTRY.counter("rick_degraded_mode_switches_total",
+                                     "Switches into (direction=enter) and out of (direction=exit) degraded mode")
+DEGRADED_REPLY_SECONDS = REGISTRY.histogram("rick_degraded_reply_seconds",
+                                            "Time to answer a message from the response tables in degraded mode",
+                                            buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001,
+                                                     0.0025, 0.01))
+
+
+class ModelNotReady(RuntimeError):
+    """Raised when a generation is requested before the model has loaded"""
+
+
+@contextmanager
+def timed_stage(stage, timings):
+    """Observe a response stage in STAGE_SECONDS and add its milliseconds to a request's `timings`"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        timings[stage] = round(timings.get(stage, 0.0) + elapsed * 1000, 1)
+
+
+def log_reply(session_id, tier, outcome, prompt_tokens, response, timings):
+    """One DEBUG record per reply with its session, tier, outcome, token count and stage timings"""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    logger.debug("Reply ready", extra={"session": session_id, "tier": tier, "outcome": outcome,
+                                       "prompt_tokens": prompt_tokens, "reply_chars": len(response),
+                                       "stages_ms": timings})
+
+
+class RickEngine:
+    """
+    Model, sessions and generation pipeline behind the chat.
+
+    - generate(session_id, text, deadline): full rickified reply
+    - stream(session_id, text, deadline): yields rickified sentences as the model decodes
+    - generate_batch(prompts, key, deadlines, streamers): raw model outputs for a batch of prompts
+
+    The optional Deadline bounds how long the model may work on a message; past it
+    (or once the client has gone) the reply is a themed fallback.
+    """
+
+    def __init__(self, config=CONFIG, base_dir=BASE_DIR, model_dir=None, session_store=None):
+        self.config = config
+        self.base_dir = base_dir
+        self.model_dir = model_dir or os.path.join(base_dir, "model")
+        self.model_name = config["model"]["name"]
+        self.inference_profile = config["model"]["inference_profile"]
+        self.backend_name = config["model"]["backend"]
+
+        # Prompt preamble and token budget for history-aware prompts
+        self.preamble = config["conversation"]["preamble"]
+        self.turn_separator = config["conversation"]["turn_separator"]
+        self.max_context_tokens = config["conversation"]["max_context_tokens"]
+        self.prefix_cache_enabled = config["model"]["prefix_cache"]
+
+        # Intents pick a generation tier (parameters plus latency SLO) for each message
+        self.policy = GenerationPolicy(config["generation"])
+        self.streaming_enabled = config["streaming"]["enabled"]
+        # Shed requests whose deadline the batch queue would already break
+        self.admission_control = config["deadlines"]["admission_control"]
+        # Recent seconds per batch for each tier, for the admission estimate
+        self.batch_seconds = {}
+        self.stream_chunk_timeout = config["streaming"]["chunk_timeout"]
+
+        # Device is picked when the model loads, so creating an engine doesn't pull in torch
+        self.device = "cpu"
+        self.model = None
+        self.tokenizer = None
+        # Builds token-budgeted prompts from session history; created once the tokenizer loads
+        self.context_builder = None
+        # Encoder states for the persona preamble, computed once per model load
+        self.prefix_cache = EncoderPrefixCache()
+        self.use_prefix_cache = False
+        # Preamble token ids for inputs that can't use the cached prefix states
+        self.preamble_ids = []
+        # Draft model for assisted decoding, if the config enables one
+        self.assistant_model = None
+        # Runs model.generate (PyTorch, torch.compile or ONNX Runtime); created with the model
+        self.backend = None
+
+        # Model loading progress, reported by /healthz and /readyz
+        self.status = {
+            "state": "not_started",  # not_started, downloading, loading_tokenizer, loading_model, ready, failed
+            "progress": 0.0,
+            "started_at": None,
+            "ready_at": None,
+            "error": None,
+            "backend": None,
+            "degraded": False,
+        }
+
+        # Conversation sessions: bounded history plus personality, with LRU and idle TTL eviction
+        if session_store is None:
+            session_store = create_session_store(config["sessions"],
+                                                 max_turns=config["conversation"]["max_turns"],
+                                                 personality_factory=self.create_personality,
+                                                 base_dir=base_dir)
+        self.session_store = session_store
+
+        # Cache raw model outputs for repeated prompts
+        self.response_cache = None
+        if config["cache"]["enabled"]:
+            persist_path = config["cache"]["persist_path"]
+            self.response_cache = ResponseCache(
+                max_entries=config["cache"]["max_entries"],
+                max_bytes=config["cache"]["max_bytes"],
+                ttl=config["cache"]["ttl"],
+                persist_path=os.path.join(base_dir, persist_path) if persist_path else None,
+                fingerprint=cache_fingerprint(model=self.model_name, profile=self.inference_profile,
+                                              backend=self.backend_name, preamble=self.preamble,
+                                              separator=self.turn_separator),
+            )
+            if self.response_cache.persist_path:
+                atexit.register(self.response_cache.save)
+
+        # Reuse raw outputs for differently worded messages with the same meaning
+        self.semantic_cache = None
+        semantic = config["semantic_cache"]
+        if semantic["enabled"]:
+            embedder = create_embedder(semantic["encoder"], semantic["dimensions"],
+                                       os.path.join(self.model_dir, "embedder"))
+            self.semantic_cache = SemanticCache(embedder, threshold=semantic["threshold"],
+                                                max_entries_per_bucket=semantic["max_entries_per_bucket"],
+                                                ttl=semantic["ttl"])
+
+        # Batch concurrent requests together if enabled (started by load())
+        self.batch_scheduler = None
+        if config["batching"]["enabled"]:
+            self.batch_scheduler = BatchScheduler(
+                self.run_batch,
+                max_batch_size=config["batching"]["max_batch_size"],
+                batch_window=config["batching"]["batch_window_ms"] / 1000.0,
+                on_batch=self._record_batch,
+            )
+        # Token-level batching for greedy and sampled tiers; created with the model
+        self.continuous_batching = config["batching"]["enabled"] and config["batching"]["mode"] == "continuous"
+        self.continuous_batcher = None
+
+        # Answer from the response tables, skipping the model, while the backlog is too deep
+        self.degraded_mode = None
+        degraded = config["degraded_mode"]
+        if degraded["enabled"]:
+            self.degraded_mode = DegradedMode(
+                enter_queue_depth=degraded["enter_queue_depth"],
+                exit_queue_depth=degraded["exit_queue_depth"],
+                enter_cpu=degraded["enter_cpu"],
+                exit_cpu=degraded["exit_cpu"],
+                min_seconds=degraded["min_seconds"],
+                check_interval=degraded["check_interval"],
+                on_change=self._record_degraded_switch,
+            ).watch(self.queue_depth)
+
+        self._register_metrics()
+
+    def _register_metrics(self):
+        REGISTRY.callback("rick_active_sessions", "Sessions held in the session store", lambda: len(self.session_store))
+        REGISTRY.callback("rick_model_ready", "1 once the model has loaded", lambda: 1 if self.ready() else 0)
+        REGISTRY.callback("rick_prefix_cache_builds_total", "Times the persona prefix was encoded",
+                          lambda: self.prefix_cache.builds, "counter")
+        if self.batch_scheduler is not None:
+            REGISTRY.callback("rick_queue_depth", "Prompts waiting for a batch", self.batch_scheduler.queue_depth)
+        if self.continuous_batching:
+            REGISTRY.callback("rick_continuous_queue_depth", "Prompts waiting to join the continuous batch",
+                              lambda: self.continuous_batcher.queue_depth() if self.continuous_batcher else 0)
+            REGISTRY.callback("rick_continuous_running", "Sequences in the running continuous batch",
+                              lambda: self.continuous_batcher.running() if self.continuous_batcher else 0)
+        if self.degraded_mode is not None:
+            REGISTRY.callback("rick_degraded_mode", "1 while messages are answered from the response tables",
+                              lambda: 1 if self.degraded() else 0)
+        if self.response_cache is not None:
+            def cache_stat(name):
+                return lambda: self.response_cache.stats()[name]
+
+            REGISTRY.callback("rick_response_cache_hits_total", "Response cache hits", cache_stat("hits"), "counter")
+            REGISTRY.callback("rick_response_cache_misses_total", "Response cache misses", cache_stat("misses"),
+                              "counter")
+            REGISTRY.callback("rick_response_cache_evictions_total", "Response cache evictions",
+                              cache_stat("evictions"), "counter")
+            REGISTRY.callback("rick_response_cache_entries", "Responses held in the cache", cache_stat("entries"))
+            REGISTRY.callback("rick_response_cache_bytes", "Approximate size of the cache", cache_stat("bytes"))
+        if self.semantic_cache is not None:
+            def semantic_stat(name):
+                return lambda: self.semantic_cache.stats()[name]
+
+            REGISTRY.callback("rick_semantic_cache_hits_total", "Semantic cache hits", semantic_stat("hits"),
+                              "counter")
+            REGISTRY.callback("rick_semantic_cache_misses_total", "Semantic cache misses", semantic_stat("misses"),
+                              "counter")
+            REGISTRY.callback("rick_semantic_cache_evictions_total", "Semantic cache evictions",
+                              semantic_stat("evictions"), "counter")
+            REGISTRY.callback("rick_semantic_cache_entries", "Messages held in the semantic cache",
+                              semantic_stat("entries"))
+            REGISTRY.callback("rick_semantic_cache_hit_rate", "Semantic cache hits per lookup",
+                              semantic_stat("hit_rate"))
+
+    # Model loading
+
+    def set_status(self, state, progress, error=None):
+        """Update the model loading progress"""
+        self.status["state"] = state
+        self.status["progress"] = progress
+        self.status["error"] = error
+        if state == "ready":
+            self.status["ready_at"] = time.time()
+        logger.info("Model status: %s (%.0f%%)", state, progress * 100)
+
+    def ready(self):
+        """True once the model and tokenizer can serve requests"""
+        return self.status["state"] == "ready"
+
+    def model_files_present(self, model_dir=None):
+        """Check whether model weights were already saved to model_dir"""
+        model_dir = model_dir or self.model_dir
+        return any(os.path.exists(os.path.join(model_dir, name))
+                   for name in ("model.safetensors", "pytorch_model.bin"))
+
+    def download(self, model_name=None, model_dir=None):
+        """
+        Download the configured model (or `model_name`) for offline chat.
+        Options:
+        - "facebook/blenderbot-400M-distill" (good balance of quality and size)
+        - "facebook/blenderbot-1B-distill" (better but larger)
+        """
+        from transformers import AutoModelForSeq2SeqLM, BlenderbotTokenizer
+
+        model_name = model_name or self.model_name
+        model_dir = model_dir or self.model_dir
+        os.makedirs(model_dir, exist_ok=True)
+        logger.info("Downloading model %s to %s...", model_name, model_dir)
+        self.set_status("downloading", 0.1)
+
+        # Download and save tokenizer
+        downloaded_tokenizer = BlenderbotTokenizer.from_pretrained(model_name)
+        downloaded_tokenizer.save_pretrained(model_dir)
+        logger.info("Tokenizer saved successfully!")
+
+        # Download and save model as safetensors so later starts can memory-map it
+        # (load_local then loads it back with the inference profile)
+        downloaded_model = AutoModelForSeq2SeqLM.from_pretrained(model_name, low_cpu_mem_usage=True)
+        downloaded_model.save_pretrained(model_dir, safe_serialization=True)
+        logger.info("Model saved successfully!")
+
+    def load_local(self):
+        """Load the model and tokenizer from model_dir"""
+        from transformers import AutoModelForSeq2SeqLM, BlenderbotTokenizer
+
+        logger.info("Loading model from %s...", self.model_dir)
+
+        self.set_status("loading_tokenizer", 0.2)
+        tokenizer = BlenderbotTokenizer.from_pretrained(self.model_dir)
+
+        # safetensors weights are memory-mapped, and low_cpu_mem_usage skips the random init pass.
+        # The inference profile can quantize to int8 or cast to bf16 on the way in.
+        self.set_status("loading_model", 0.4)
+        model = load_model_with_profile(AutoModelForSeq2SeqLM, self.model_dir, self.inference_profile, self.device)
+        model.to(self.device)
+
+        # The preamble is encoded once here, not on every request: either its encoder states
+        # are cached, or its token ids are cached in the context builder
+        self.prefix_cache.clear()
+        prefixed = self.prefix_cache_enabled and supports_prefix_cache(model)
+        if prefixed:
+            self.prefix_cache.prefix_states(model, tokenizer, self.preamble)
+        self.context_builder = ContextBuilder(tokenizer, "" if prefixed else self.preamble,
+                                              max_tokens=context_budget(model, self.max_context_tokens),
+                                              separator=self.turn_separator)
+        self.preamble_ids = ContextBuilder(tokenizer, self.preamble,
+                                           max_tokens=context_budget(model, self.max_context_tokens),
+                                           separator=self.turn_separator).preamble_ids
+        self.use_prefix_cache = prefixed
+        self.tokenizer = tokenizer
+        self.model = model
+        if self.continuous_batching:
+            self.continuous_batcher = self.create_continuous_batcher(model)
+        self.backend = self.create_backend(model)
+        self.status["backend"] = self.backend.name
+
+        logger.info("Model loaded successfully!")
+
+    def create_backend(self, model):
+        """The configured inference backend for `model`, or eager PyTorch if it can't start"""
+        from transformers import AutoModelForSeq2SeqLM
+
+        def load_float_model():
+            return AutoModelForSeq2SeqLM.from_pretrained(self.model_dir, low_cpu_mem_usage=True).eval()
+
+        try:
+            backend = create_backend(self.backend_name, model, self.model_dir, self.inference_profile,
+                                     load_float_model=load_float_model)
+        except Exception as e:
+            logger.warning("Could not start the %s backend, using eager PyTorch: %s", self.backend_name, e)
+            return EagerBackend(model)
+        logger.info("Inference backend: %s", backend.name)
+        return backend
+
+    def create_continuous_batcher(self, model):
+        """The token-level decode loop for `model`, or None (static batching) if it can't run one"""
+        if not supports_continuous_batching(model):
+            logger.warning("Continuous batching isn't supported for this model, using static batches")
+            return None
+        return ContinuousBatcher(model, self.encode_prompts,
+                                 lambda tokens: self.tokenizer.decode(tokens, skip_special_tokens=True),
+                                 max_batch_size=self.config["batching"]["max_batch_size"],
+                                 on_admit=self._record_admission, on_finish=GENERATED_TOKENS.inc)
+
+    def load_assistant(self):
+        """
+        Load the draft model for assisted decoding into MODEL_DIR/assistant, downloading it
+        if needed. It must share the main model's tokenizer. A failure only disables
+        assisted decoding.
+        """
+        from transformers import AutoModelForSeq2SeqLM
+
+        name = self.policy.assistant_model_name
+        assistant_dir = os.path.join(self.model_dir, "assistant")
+        try:
+            if not self.model_files_present(assistant_dir):
+                self.download(name, assistant_dir)
+            self.set_status("loading_assistant", 0.8)
+            assistant = load_model_with_profile(AutoModelForSeq2SeqLM, assistant_dir, self.inference_profile,
+                                                self.device)
+            assistant.to(self.device)
+        except Exception as e:
+            logger.warning("Could not load draft model %s, assisted decoding disabled: %s", name, e)
+            return
+        if assistant.config.vocab_size != self.model.config.vocab_size:
+            logger.warning("Draft model %s has a different vocabulary, assisted decoding disabled", name)
+            return
+        self.assistant_model = assistant
+        logger.info("Assisted decoding enabled with draft model %s", name)
+
+    def load(self):
+        """Load the model, downloading it first if needed, and start the batch scheduler"""
+        import torch
+
+        self.status["started_at"] = time.time()
+        self.set_status("starting", 0.0)
+        try:
+            self.device = "cuda" if torch.cuda.is_available() else "cpu"
+            logger.info("Using device: %s", self.device)
+            apply_thread_settings(self.inference_profile)
+
+            # Check if model exists, download if not
+            if not self.model_files_present():
+                self.download()
+            self.load_local()
+            if self.policy.assistant_model_name:
+                self.load_assistant()
+        except Exception as e:
+            logger.exception("Error loading model: %s", e)
+            logger.error("Please ensure you have internet connection for the first run or download the model manually.")
+            self.set_status("failed", self.status["progress"], error=str(e))
+            return False
+
+        if self.batch_scheduler is not None:
+            self.batch_scheduler.start()
+            logger.info("Batching enabled (max batch size %d)", self.batch_scheduler.max_batch_size)
+        if self.continuous_batcher is not None:
+            self.continuous_batcher.start()
+            logger.info("Continuous batching enabled for greedy and sampled tiers")
+
+        self.set_status("ready", 1.0)
+        logger.info("Model ready after %.1f seconds", self.status["ready_at"] - self.status["started_at"])
+        return True
+
+    def start_loading(self, background=True):
+        """
+        Load the model either in a background thread (requests get themed fallback
+        replies until it's ready) or blocking. Returns False if a blocking load failed.
+        """
+        if self.status["state"] != "not_started":
+            return True
+        if not background:
+            return self.load()
+        threading.Thread(target=self.load, name="rick-model-loader", daemon=True).start()
+        return True
+
+    # Sessions
+
+    def create_personality(self, session_id):
+        """Create the Rick personality state (RNG and no-repeat trackers) for a new session"""
+        # A configured seed makes each session's rickification reproducible
+        seed = self.config["character"]["seed"]
+        return RickPersonality(seed=None if seed is None else f"{seed}:{session_id}")
+
+    def get_personality(self, session_id):
+        """Get the session's RickPersonality"""
+        return self.session_store.get(session_id).personality
+
+    def remember_turn(self, session_id, text):
+        """Add a turn (a user message or Rick's reply) to the session's conversation history"""
+        self.session_store.add_turn(session_id, text)
+
+    def clear(self, session_id):
+        """Forget a session's conversation history"""
+        self.session_store.clear(session_id)
+
+    def build_context(self, session_id):
+        """
+        Build the model input for a session: the preamble plus as many recent turns as fit.
+        Returns (prompt_text, input_ids); prompt_text covers the turns used and keys the cache.
+        """
+        # One copy of the history, so another request adding a turn or clearing the
+        # session can't change it between choosing the turns and keying the cache
+        session, history = self.session_store.snapshot(session_id)
+        input_ids, turns_used = self.context_builder.build(session, history)
+        return "\n".join(history[-turns_used:] if turns_used else []), input_ids
+
+    # Generation
+
+    def generation_inputs(self, inputs):
+        """
+        Turn tokenized inputs into model.generate arguments.
+        With the prefix cache on, only the conversation is encoded here and the cached
+        persona states are put in front of it.
+        """
+        if not self.use_prefix_cache:
+            return dict(inputs)
+        with STAGE_SECONDS.time(stage="encode"):
+            encoder_outputs, attention_mask = self.prefix_cache.encode(
+                self.model, self.tokenizer, self.preamble, inputs["input_ids"], inputs["attention_mask"])
+        return {"encoder_outputs": encoder_outputs, "attention_mask": attention_mask}
+
+    def assisted_inputs(self, inputs):
+        """
+        model.generate arguments for assisted decoding of a single prompt. The draft model
+        runs its own encoder, so it can't share the cached prefix states; the preamble ids go
+        back in front of the conversation instead, dropping its oldest tokens if needed.
+        """
+        import torch
+
+        if not self.use_prefix_cache:
+            return dict(inputs)
+        budget = context_budget(self.model, self.max_context_tokens)
+        preamble = torch.tensor([self.preamble_ids], dtype=inputs["input_ids"].dtype, device=self.device)
+        input_ids = torch.cat([preamble, inputs["input_ids"][:, -(budget - preamble.shape[1]):]], dim=1)
+        return {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
+
+    def tokenize(self, prompts):
+        """
+        Pad a list of prompts into one batch of model inputs. Prompts are strings or already
+        tokenized id lists (from the context builder).
+        """
+        with STAGE_SECONDS.time(stage="tokenize"):
+            if isinstance(prompts[0], str):
+                inputs = self.tokenizer(prompts,
+                                        return_tensors="pt",
+                                        max_length=self.max_context_tokens,  # Limit context length
+                                        truncation=True,
+                                        padding=True)
+            else:
+                inputs = self.tokenizer.pad({"input_ids": prompts}, return_tensors="pt")
+            inputs = inputs.to(self.device)
+        # Count real tokens only, not padding
+        PROMPT_TOKENS.inc(int(inputs["attention_mask"].sum()))
+        return inputs
+
+    def encode_prompts(self, prompts):
+        """Encoder states and attention mask for a list of prompts (for the continuous batcher)"""
+        model_inputs = self.generation_inputs(self.tokenize(prompts))
+        if "encoder_outputs" in model_inputs:
+            return model_inputs["encoder_outputs"].last_hidden_state, model_inputs["attention_mask"]
+        with STAGE_SECONDS.time(stage="encode"):
+            encoder_outputs = self.model.get_encoder()(**model_inputs)
+        return encoder_outputs.last_hidden_state, model_inputs["attention_mask"]
+
+    def scheduler_params(self, key):
+        """model.generate parameters for a scheduler key: a tier, or "<tier>:stream" for its streamed replies"""
+        tier, _, mode = (key or self.policy.default_tier).partition(":")
+        return self.policy.stream_params(tier) if mode == "stream" else self.policy.params(tier)
+
+    def generate_batch(self, prompts, key=None, deadlines=None, streamers=None):
+        """
+        Run one batched model.generate call for a list of prompts.
+        Prompts are strings or already tokenized id lists (from the context builder).
+        They are padded together so every session in the batch shares the forward passes.
+        `key` is the generation tier, or "<tier>:stream" for streamed replies (the policy's
+        default tier if None); the batch scheduler only batches prompts with the same key.
+        Generation stops early once every prompt's deadline (if any) has passed. Each
+        prompt's streamer, if any, gets its tokens as they're generated.
+        """
+        import torch
+
+        tier = (key or self.policy.default_tier).partition(":")[0]
+        params = self.scheduler_params(key)
+        tokenizer = self.tokenizer
+        inputs = self.tokenize(prompts)
+        # transformers only supports assisted generation one prompt at a time
+        if self.assistant_model is not None and len(prompts) == 1 and self.policy.assisted(tier):
+            model_inputs = self.assisted_inputs(inputs)
+            params = dict(params, assistant_model=self.assistant_model)
+        else:
+            model_inputs = self.generation_inputs(inputs)
+        if deadlines and any(deadline is not None for deadline in deadlines):
+            params = dict(params, stopping_criteria=deadline_stopping_criteria(deadlines))
+        if streamers and any(streamer is not None for streamer in streamers):
+            params = dict(params, streamer=RowStreamers(streamers))
+
+        started = time.perf_counter()
+        with torch.no_grad():
+            outputs = self.backend.generate(model_inputs, params)
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage="generate")
+
+        # Count real tokens only, not padding
+        generated_tokens = int((outputs != tokenizer.pad_token_id).sum())
+        GENERATED_TOKENS.inc(generated_tokens)
+        if elapsed > 0:
+            TOKENS_PER_SECOND.observe(generated_tokens / elapsed)
+
+        with STAGE_SECONDS.time(stage="decode"):
+            return tokenizer.batch_decode(outputs, skip_special_tokens=True)
+
+    def run_batch(self, prompts, key=None, deadlines=None, streamers=None):
+        """generate_batch, keeping a moving average of each key's batch time for admission control"""
+        started = time.perf_counter()
+        results = self.generate_batch(prompts, key, deadlines, streamers)
+        elapsed = time.perf_counter() - started
+        # A batch cut short by its deadlines says nothing about how long a full one takes
+        if not deadlines or not all(deadline is not None and deadline.expired() for deadline in deadlines):
+            self.record_batch_seconds(key or self.policy.default_tier, elapsed)
+        return results
+
+    def record_batch_seconds(self, tier, elapsed):
+        """Fold a batch time into the tier's moving average"""
+        previous = self.batch_seconds.get(tier)
+        self.batch_seconds[tier] = elapsed if previous is None else 0.8 * previous + 0.2 * elapsed
+
+    def scheduler_for(self, tier):
+        """
+        The queue a tier's prompts (or "<tier>:stream" streamed ones) go through: the continuous
+        batcher if it can run the parameters, else the batch scheduler (None with batching off)
+        """
+        if self.continuous_batcher is not None and self.continuous_batcher.supports(self.scheduler_params(tier)):
+            return self.continuous_batcher
+        return self.batch_scheduler
+
+    def estimated_wait(self, tier):
+        """
+        Rough seconds until a new prompt for `tier` would be answered: the batches already
+        queued ahead of it plus its own, at the tier's recent batch time (0 until measured,
+        so nothing is shed before the first batch)
+        """
+        per_batch = self.batch_seconds.get(tier, 0.0)
+        scheduler = self.scheduler_for(tier)
+        if scheduler is None:
+            return per_batch
+        batches_ahead = scheduler.queue_depth() // scheduler.max_batch_size
+        return (batches_ahead + 1) * per_batch
+
+    def queue_depth(self):
+        """Prompts waiting for a batch or to join the continuous batch"""
+        depth = 0
+        if self.batch_scheduler is not None:
+            depth += self.batch_scheduler.queue_depth()
+        if self.continuous_batcher is not None:
+            depth += self.continuous_batcher.queue_depth()
+        return depth
+
+    def degraded(self):
+        """True while overloaded: messages are answered from the response tables without the model"""
+        return self.degraded_mode is not None and self.degraded_mode.active()
+
+    def _record_degraded_switch(self, engaged, reason):
+        self.status["degraded"] = engaged
+        DEGRADED_SWITCHES.inc(direction="enter" if engaged else "exit")
+
+    def admit(self, tier, deadline):
+        """Raise Overloaded if the request can't be answered before its deadline"""
+        if deadline is None or not self.admission_control:
+            return
+        estimate = self.estimated_wait(tier)
+        if estimate > deadline.remaining():
+            raise Overloaded(estimate)
+
+    def _record_batch(self, batch_size, queue_waits):
+        """Record batch size and how long each prompt waited in the queue"""
+        BATCH_SIZE.observe(batch_size)
+        for wait in queue_waits:
+            QUEUE_WAIT_SECONDS.observe(wait)
+
+    def _record_admission(self, queue_waits):
+        """Record how long prompts waited to join the continuous batch"""
+        for wait in queue_waits:
+            QUEUE_WAIT_SECONDS.observe(wait)
+
+    def record_tier_latency(self, tier, elapsed):
+        """Record a generation's latency against its tier's SLO"""
+        TIER_SECONDS.observe(elapsed, tier=tier)
+        if elapsed > self.policy.slo(tier):
+            SLO_MISSES.inc(tier=tier)
+            logger.debug("Tier %s missed its SLO: %.0f ms", tier, elapsed * 1000)
+
+    @staticmethod
+    def earlier_turns(prompt, message):
+        """The conversation in `prompt` before its latest `message` (all of it if it doesn't end there)"""
+        return prompt[:-len(message)] if prompt.endswith(message) else prompt
+
+    def semantic_get(self, message, bucket, prompt=""):
+        """The semantic cache's raw output for a message like this one after the same turns, or None"""
+        if self.semantic_cache is None or not message:
+            return None
+        started = time.perf_counter()
+        cached = self.semantic_cache.get(message, bucket, self.earlier_turns(prompt, message))
+        SEMANTIC_LOOKUP_SECONDS.observe(time.perf_counter() - started)
+        return cached
+
+    def semantic_put(self, message, bucket, response, prompt=""):
+        """Remember a raw output for the semantic cache"""
+        if self.semantic_cache is not None and message and response:
+            self.semantic_cache.put(message, bucket, response, self.earlier_turns(prompt, message))
+
+    def generate_raw(self, prompt, input_ids=None, tier=None, deadline=None, message=None):
+        """
+        Generate a raw model response, going through the batch scheduler when enabled.
+        `input_ids` is the tokenized form of `prompt` when the caller already has it, and
+        `tier` the generation tier (the policy's default tier if None). Raises
+        DeadlineExceeded if `deadline` passes first, or Overloaded if the queue makes
+        that certain up front.
+        Repeated prompts are served from the response cache, and with the semantic cache
+        on, a user `message` worded like an earlier one in the same tier, after the same
+        turns, gets that one's output. Callers still rickify the result, so cached replies get fresh personality
+        randomization.
+        """
+        tier = tier or self.policy.default_tier
+        params = self.policy.params(tier)
+        if self.response_cache is not None:
+            cached = self.response_cache.get(prompt, params)
+            if cached is not None:
+                logger.debug("Response cache hit")
+                return cached
+        cached = self.semantic_get(message, tier, prompt)
+        if cached is not None:
+            return cached
+
+        if not self.ready():
+            # Callers fall back to themed responses until the model has loaded
+            raise ModelNotReady(f"Model not ready ({self.status['state']})")
+        if deadline is not None:
+            deadline.check()
+            self.admit(tier, deadline)
+        model_input = prompt if input_ids is None else input_ids
+        started = time.perf_counter()
+        scheduler = self.scheduler_for(tier)
+        if scheduler is None:
+            response = self.run_batch([model_input], tier, [deadline])[0]
+        else:
+            if scheduler is self.continuous_batcher:
+                future = scheduler.submit(model_input, params, deadline=deadline)
+            else:
+                future = scheduler.submit(model_input, key=tier, deadline=deadline)
+            try:
+                response = future.result(timeout=None if deadline is None else deadline.remaining())
+            except FutureTimeout:
+                raise DeadlineExceeded(deadline.reason)
+        if deadline is not None:
+            # An aborted generate returns a truncated reply; don't serve or cache it
+            deadline.check()
+        elapsed = time.perf_counter() - started
+        if scheduler is not None and scheduler is self.continuous_batcher:
+            # No batches here; a request's own time feeds the admission estimate
+            self.record_batch_seconds(tier, elapsed)
+        self.record_tier_latency(tier, elapsed)
+
+        if self.response_cache is not None:
+            self.response_cache.put(prompt, params, response)
+        self.semantic_put(message, tier, response, prompt)
+        return response
+
+    def degraded_reply(self, session_id, user_input):
+        """A rickified reply from the response tables, without the model or a generation slot"""
+        started = time.perf_counter()
+        response = self.table_reply(session_id, user_input, "degraded")
+        DEGRADED_REPLY_SECONDS.observe(time.perf_counter() - started)
+        return response
+
+    def table_reply(self, session_id, user_input, reason):
+        """
+        A rickified themed reply from the response tables, counted as a fallback for `reason`
+        (e.g. a deadline that passed while the message waited for a generation slot)
+        """
+        self.remember_turn(session_id, user_input)
+        personality = self.get_personality(session_id)
+        intents = classify(user_input)
+        if is_simple_input(user_input, intents):
+            FALLBACKS.inc(reason="short_input")
+            response = get_simple_response(personality.rng)
+        else:
+            FALLBACKS.inc(reason=reason)
+            response = get_themed_response(user_input, personality.rng, intents)
+        self.remember_turn(session_id, response)
+        return rickify_response(response, personality)
+
+    def generate(self, session_id, user_input, deadline=None):
+        """Generate a reply that sounds like Rick from Rick and Morty"""
+        logger.debug("Processing input: %r for session %r", user_input, session_id)
+        if self.degraded():
+            return self.degraded_reply(session_id, user_input)
+
+        # Add the new user input to the history
+        self.remember_turn(session_id, user_input)
+        personality = self.get_personality(session_id)
+        rng = personality.rng
+        # Tokenized and classified once, shared by every keyword check below
+        intents = classify(user_input)
+
+        # Use direct rickification for very short inputs to avoid model issues
+        if is_simple_input(user_input, intents):
+            FALLBACKS.inc(reason="short_input")
+            response = get_simple_response(rng)
+            self.remember_turn(session_id, response)
+            return rickify_response(response, personality)
+
+        # Per-request stage timings and outcome for the reply's log record
+        timings = {}
+        tier = None
+        input_ids = ()
+        outcome = "model"
+        try:
+            try:
+                if self.context_builder is None:
+                    raise ModelNotReady(f"Model not ready ({self.status['state']})")
+
+                # Preamble plus the most recent turns that fit in the token budget
+                with timed_stage("context", timings):
+                    prompt, input_ids = self.build_context(session_id)
+                logger.debug("Prompt context (%d tokens): %s", len(input_ids), prompt)
+
+                tier = self.policy.select(intents)
+                started = time.perf_counter()
+                response = self.generate_raw(prompt, input_ids, tier, deadline, message=user_input)
+                # Queue wait included; the generate stage histogram has the model's own time
+                timings["model"] = round((time.perf_counter() - started) * 1000, 1)
+                logger.debug("Generated response: %.100s...", response)
+
+            except DeadlineExceeded as e:
+                logger.debug("%s, using themed response", e)
+                outcome = e.reason
+                FALLBACKS.inc(reason=e.reason)
+                response = get_themed_response(user_input, rng, intents)
+
+            except ModelNotReady as e:
+                logger.debug("%s, using themed response", e)
+                outcome = "model_not_ready"
+                FALLBACKS.inc(reason="model_not_ready")
+                response = get_themed_response(user_input, rng, intents)
+
+            except Exception as e:
+                logger.warning("Model generation failed: %s", e, extra={"session": session_id, "tier": tier})
+
+                # Fall back to predetermined responses for different question types
+                outcome = "model_error"
+                FALLBACKS.inc(reason="model_error")
+                response = get_themed_response(user_input, rng, intents)
+
+            # Improve the response quality
+            with timed_stage("improve", timings):
+                response = improve_response_quality(response, user_input, rng, intents)
+
+            # Remember the reply before rickifying, so stutters and burps don't eat the token budget
+            self.remember_turn(session_id, response)
+
+            # Rickify the response
+            with timed_stage("rickify", timings):
+                response = rickify_response(response, personality)
+            logger.debug("Final response: %.100s...", response)
+            log_reply(session_id, tier, outcome, len(input_ids), response, timings)
+
+            # Clear CUDA cache if using GPU
+            if self.device == "cuda":
+                import torch
+
+                torch.cuda.empty_cache()
+
+            return response
+        except Exception as e:
+            logger.exception("Error in model inference: %s", e)  # Logs the full stack trace
+            FALLBACKS.inc(reason="inference_error")
+            fallback = get_fallback_response(rng)
+            logger.debug("Using fallback response: %s", fallback)
+            return rickify_response(fallback, personality)
+
+    def stream(self, session_id, user_input, deadline=None):
+        """
+        Generate a reply and yield it sentence by sentence while the model decodes.
+        Each finished sentence is rickified as soon as it's complete. The full reply is
+        the yielded pieces joined with spaces. Iterating blocks while the model works.
+        If `deadline` passes mid-reply, decoding stops and the reply ends there.
+        """
+        if self.degraded():
+            yield self.degraded_reply(session_id, user_input)
+            return
+        intents = classify(user_input)
+        if not self.streaming_enabled or not self.ready() or self.context_builder is None \
+                or is_simple_input(user_input, intents):
+            yield self.generate(session_id, user_input, deadline)
+            return
+
+        self.remember_turn(session_id, user_input)
+
+        timings = {}
+        with timed_stage("context", timings):
+            prompt, input_ids = self.build_context(session_id)
+        personality = self.get_personality(session_id)
+        rickifier = StreamingRickifier(personality)
+        tier = self.policy.select(intents)
+        # Streamed replies are decoded with their own parameters, so they have their own
+        # scheduler key and cache bucket
+        key = f"{tier}:stream"
+        params = self.scheduler_params(key)
+        cached = self.response_cache.get(prompt, params) if self.response_cache is not None else None
+        if cached is None:
+            cached = self.semantic_get(user_input, key, prompt)
+        if cached is not None:
+            # Replay the cached raw output through a fresh rickifier
+            logger.debug("Response cache hit")
+            parts = rickifier.feed(clean_generic_phrases(cached) + " ")
+            tail = rickifier.finish()
+            if tail:
+                parts.append(tail)
+            self.remember_turn(session_id, clean_generic_phrases(cached).strip())
+            yield from parts
+            return
+
+        errors = []
+        # DeadlineExceeded if the deadline cut the reply short
+        stopped = None
+        sent = []
+        raw_text = []
+        started = time.perf_counter()
+        try:
+            if deadline is not None:
+                deadline.check()
+            for text in self.decode_stream(input_ids, key, deadline):
+                raw_text.append(text)
+                with timed_stage("rickify", timings):
+                    sentences = rickifier.feed(clean_generic_phrases(text))
+                for sentence in sentences:
+                    sent.append(sentence)
+                    yield sentence
+            if deadline is not None:
+                deadline.check()
+        except DeadlineExceeded as e:
+            stopped = e
+        except Exception as e:
+            errors.append(e)
+
+        tail = rickifier.finish()
+        if tail:
+            sent.append(tail)
+            yield tail
+
+        # Decoding and rickifying overlap while streaming, so "model" is the whole stream
+        timings["model"] = round((time.perf_counter() - started) * 1000, 1)
+        outcome = "model"
+        if stopped is not None:
+            logger.debug("Streaming stopped early: %s", stopped)
+            outcome = stopped.reason
+        elif errors:
+            logger.warning("Streaming generation failed: %s", errors[0], extra={"session": session_id, "tier": key})
+            outcome = "model_error"
+        else:
+            self.record_tier_latency(tier, time.perf_counter() - started)
+            if self.response_cache is not None and raw_text:
+                self.response_cache.put(prompt, params, "".join(raw_text).strip())
+            self.semantic_put(user_input, key, "".join(raw_text).strip(), prompt)
+
+        if not sent:
+            # Nothing usable came out of the model in time; send a themed reply instead
+            FALLBACKS.inc(reason=stopped.reason if stopped is not None else "model_error")
+            response = improve_response_quality(get_themed_response(user_input, personality.rng, intents),
+                                                user_input, personality.rng, intents)
+            self.remember_turn(session_id, response)
+            response = rickify_response(response, personality)
+            log_reply(session_id, key, outcome, len(input_ids), response, timings)
+            yield response
+            return
+
+        self.remember_turn(session_id, clean_generic_phrases("".join(raw_text)).strip())
+        log_reply(session_id, key, outcome, len(input_ids), " ".join(sent), timings)
+
+    def create_streamer(self):
+        """A streamer that turns one prompt's generated tokens into text pieces as they arrive"""
+        from transformers import TextIteratorStreamer
+
+        return TextIteratorStreamer(self.tokenizer, skip_prompt=True, timeout=self.stream_chunk_timeout,
+                                    skip_special_tokens=True)
+
+    def decode_stream(self, input_ids, key, deadline=None):
+        """
+        Yield decoded text pieces for one prompt as the model generates them, until `deadline`.
+        The prompt goes through the same admission control and queue as a non-streamed one
+        (`key` is "<tier>:stream"), and gets its tokens from the batch it decodes in.
+        """
+        self.admit(key, deadline)
+        streamer = self.create_streamer()
+        started = time.perf_counter()
+        scheduler = self.scheduler_for(key)
+        if scheduler is None:
+            future = Future()
+
+            def generate():
+                try:
+                    future.set_result(self.run_batch([input_ids], key, [deadline], [streamer])[0])
+                except Exception as e:
+                    future.set_exception(e)
+                    streamer.end()
+
+            # Decode in a native thread while the caller consumes the text
+            threading.Thread(target=generate, name="rick-stream", daemon=True).start()
+        elif scheduler is self.continuous_batcher:
+            future = scheduler.submit(input_ids, self.scheduler_params(key), deadline=deadline, streamer=streamer)
+        else:
+            future = scheduler.submit(input_ids, key=key, deadline=deadline, streamer=streamer)
+        yield from streamer
+        # Raises if the request failed or was dropped at its deadline
+        future.result(timeout=self.stream_chunk_timeout)
+        if scheduler is not None and scheduler is self.continuous_batcher:
+            # No batches here; a request's own time feeds the admission estimate
+            self.record_batch_seconds(key, time.perf_counter() - started)
+
+    def close(self):
+        """Stop the batch schedulers and persist the response cache"""
+        if self.batch_scheduler is not None:
+            self.batch_scheduler.stop()
+        if self.continuous_batcher is not None:
+            self.continuous_batcher.stop()
+        if self.response_cache is not None and self.response_cache.persist_path:
+            self.response_cache.save()
+
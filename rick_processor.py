@@ -1,5 +1,10 @@
 import random
 import re
+from collections import deque
+
+from intent import classify
+from response_tables import compile_tables
+from rick_config import RESPONSE_TABLES
 
 # Rick's catchphrases and speech patterns
 RICK_CATCHPHRASES = [
@@ -75,6 +80,19 @@ RICK_REPLACEMENTS = {
     "interesting": "mildly intriguing to my genius brain",
 }
 
+# All phrase replacements compiled into one alternation, so a reply is scanned once.
+# Longer phrases come first so they win over any shorter phrase they contain.
+REPLACEMENT_LOOKUP = {normal.lower(): rick for normal, rick in RICK_REPLACEMENTS.items()}
+REPLACEMENT_PATTERN = re.compile(
+    r'\b(?:' + '|'.join(re.escape(normal) for normal in sorted(RICK_REPLACEMENTS, key=len, reverse=True)) + r')\b',
+    re.IGNORECASE
+)
+
+# Other patterns used on every reply
+I_PATTERN = re.compile(r'\bI\b')
+SENTENCE_SPLIT_PATTERN = re.compile(r'(?<=[.!?])\s+')
+STUTTER_LETTERS = frozenset("abcdefgwABCDEFGW")
+
 # Rick's mood factors
 RICK_MOODS = {
     "frustrated": {
@@ -115,67 +133,89 @@ RICK_SCIENCE_TERMS = {
     "dimensions": ["C-137", "J19ζ7", "alternate timeline", "parallel universe", "fifth dimension", "microverse", "miniverse"]
 }
 
-# Track usage of catchphrases to avoid repetition
-used_catchphrases = []
-used_interjections = []
-used_endings = []
+class NoRepeatSampler:
+    """
+    Pick items at random without repeating the most recent picks.
+    Recently used items sit in a cooldown queue, so each pick is O(1).
+    """
+
+    def __init__(self, items, rng, cooldown=None):
+        self.available = list(items)
+        self.rng = rng
+        # Keep roughly half the items out of rotation after use
+        self.cooldown = len(self.available) // 2 if cooldown is None else min(cooldown, len(self.available) - 1)
+        self.cooling = deque()
+
+    def pick(self):
+        """Return an item that hasn't been picked recently"""
+        idx = self.rng.randrange(len(self.available))
+        item = self.available[idx]
+
+        # Swap-remove the chosen item and put it on cooldown
+        self.available[idx] = self.available[-1]
+        self.available.pop()
+        self.cooling.append(item)
+        if len(self.cooling) > self.cooldown:
+            self.available.append(self.cooling.popleft())
+
+        return item
+
+
+class RickPersonality:
+    """
+    Per-session Rick state: a seedable RNG plus no-repeat trackers for catchphrases,
+    interjections and endings. Each session owns one, so no locking is needed.
+    """
+
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+        self.catchphrases = NoRepeatSampler(RICK_CATCHPHRASES, self.rng)
+        self.interjections = NoRepeatSampler(RICK_INTERJECTIONS, self.rng)
+        self.endings = NoRepeatSampler(RICK_ENDINGS, self.rng)
 
-def determine_rick_mood(text):
-    """Determine Rick's mood based on the content of the response"""
-    text_lower = text.lower()
+def determine_rick_mood(text, rng=random, intents=None):
+    """
+    Determine Rick's mood based on the content of the response.
+    `intents` is the text's intent.Intents if the caller already classified it.
+    """
+    if intents is None:
+        intents = classify(text)
     
     # Check for question patterns that might frustrate Rick
-    if "?" in text or any(word in text_lower for word in ["why", "how come", "explain"]):
-        if any(word in text_lower for word in ["basic", "simple", "obvious", "everyone knows"]):
+    if "?" in text or "mood_question" in intents:
+        if "mood_frustrated" in intents:
             return "frustrated"
     
     # Check for scientific/discovery patterns that might excite Rick
-    if any(word in text_lower for word in ["discover", "invent", "breakthrough", "amazing", "incredible"]):
+    if "mood_excited" in intents:
         return "excited"
     
     # Check for mundane topics that Rick might dismiss
-    if any(word in text_lower for word in ["normal", "everyday", "regular", "human", "feelings", "emotions"]):
+    if "mood_dismissive" in intents:
         return "dismissive"
     
     # Check for alcohol references or signs of intoxication
-    if any(word in text_lower for word in ["drink", "alcohol", "beer", "whiskey", "flask", "drunk", "wasted"]):
+    if "mood_drunk" in intents:
         return "drunk"
     
     # Default to random mood with weighted probabilities
     moods = ["frustrated", "excited", "dismissive", "drunk"]
     weights = [0.3, 0.3, 0.3, 0.1]  # Less likely to be drunk by default
-    return random.choices(moods, weights=weights)[0]
-
-def get_unused_item(items_list, used_items):
-    """Get an item that hasn't been used recently"""
-    available_items = [item for item in items_list if item not in used_items]
-    if not available_items:
-        # If all items have been used, reset and use any
-        used_items.clear()
-        available_items = items_list
-    
-    chosen_item = random.choice(available_items)
-    used_items.append(chosen_item)
-    
-    # Keep the used list reasonable in size
-    if len(used_items) > len(items_list) // 2:
-        used_items.pop(0)
-    
-    return chosen_item
+    return rng.choices(moods, weights=weights)[0]
 
-def insert_science_references(text):
+def insert_science_references(text, rng=random):
     """Insert scientific terminology into the text"""
-    if random.random() < 0.4:
-        category = random.choice(list(RICK_SCIENCE_TERMS.keys()))
-        term = random.choice(RICK_SCIENCE_TERMS[category])
+    if rng.random() < 0.4:
+        category = rng.choice(list(RICK_SCIENCE_TERMS.keys()))
+        term = rng.choice(RICK_SCIENCE_TERMS[category])
         
         # Find a good spot to insert the term
-        sentences = re.split(r'(?<=[.!?])\s+', text)
+        sentences = SENTENCE_SPLIT_PATTERN.split(text)
         if len(sentences) > 1:
-            insert_idx = random.randint(0, len(sentences) - 1)
+            insert_idx = rng.randint(0, len(sentences) - 1)
             
             # Create a science reference
-            if random.random() < 0.5:
+            if rng.random() < 0.5:
                 science_ref = f" It's like {term} theory 101."
             else:
                 science_ref = f" Any idiot with basic {term} knowledge would know that."
@@ -186,93 +226,291 @@ def insert_science_references(text):
     
     return text
 
-def rickify_response(response):
-    """Transform a normal AI response to sound like Rick from Rick and Morty with mood awareness"""
+def pick_interjection(mood_config, personality):
+    """Pick an opening interjection, sometimes mood-specific"""
+    if personality.rng.random() < 0.3 and mood_config["interjections"]:
+        # Use mood-specific interjection
+        return personality.rng.choice(mood_config["interjections"])
+    # Use general interjection
+    return personality.interjections.pick()
+
+def pick_catchphrase(mood_config, personality):
+    """Pick a catchphrase, sometimes mood-specific"""
+    if personality.rng.random() < 0.4 and mood_config["catchphrases"]:
+        # Use mood-specific catchphrase
+        return personality.rng.choice(mood_config["catchphrases"])
+    # Use general catchphrase
+    return personality.catchphrases.pick()
+
+def pick_ending(mood_config, personality):
+    """Pick a Rick-like ending, sometimes mood-specific"""
+    if personality.rng.random() < 0.4 and mood_config["endings"]:
+        # Use mood-specific ending
+        return personality.rng.choice(mood_config["endings"])
+    # Use general ending
+    return personality.endings.pick()
+
+def pick_dimension_reference(rng=random):
+    """Pick a random reference to dimensions or Rick's tech"""
+    dimension_refs = [
+        f" Not in this dimension, anyway.",
+        f" Maybe in dimension {rng.choice(['C-137', 'J19ζ7', 'D-99', 'C-500', '35-C'])}, but not here.",
+        f" The Council of Ricks would agree with me.",
+        f" Even the Citadel doesn't understand this stuff.",
+        f" I've got a portal gun that could solve this in seconds.",
+        f" My portal gun technology proves it.",
+        f" I could build a device to fix this with some scraps and a good buzz going."
+    ]
+    return rng.choice(dimension_refs)
+
+def replace_phrases(text):
+    """Replace certain phrases with Rick-like alternatives"""
+    # Whole words only, case-insensitive; the matched phrase picks its replacement
+    return REPLACEMENT_PATTERN.sub(lambda match: REPLACEMENT_LOOKUP[match.group(0).lower()], text)
+
+def add_stutters(text, stutter_probability, rng=random):
+    """Stutter on some words and on "I" """
+    # Stutter on some words that start with certain letters
+    words = text.split()
+    for i, word in enumerate(words):
+        if len(word) > 2 and word[0] in STUTTER_LETTERS and rng.random() < stutter_probability:
+            # Add stuttering like "w-w-word"
+            words[i] = f"{word[0]}-{word[0]}-{word}"
+    text = " ".join(words)
+    
+    # Add random stuttering on "I"
+    return I_PATTERN.sub(lambda x: "I-I-I" if rng.random() < stutter_probability else "I", text)
+
+def add_burps(text, rng=random):
+    """Drop burps into random spots of some sentences"""
+    sentences = SENTENCE_SPLIT_PATTERN.split(text)
+    for i in range(len(sentences)):
+        if rng.random() < 0.3:
+            words = sentences[i].split()
+            if words:
+                burp_idx = rng.randint(0, len(words) - 1)
+                words[burp_idx] = words[burp_idx] + " *burp*"
+                sentences[i] = " ".join(words)
+    return ' '.join(sentences)
+
+def rickify_response(response, personality=None):
+    """
+    Transform a normal AI response to sound like Rick from Rick and Morty with mood awareness.
+    Pass the session's RickPersonality to keep catchphrases from repeating across replies
+    and to make the output reproducible for a seeded personality.
+    """
+    if personality is None:
+        personality = RickPersonality()
+    rng = personality.rng
     
     # Determine Rick's mood for this response
-    mood = determine_rick_mood(response)
+    mood = determine_rick_mood(response, rng)
     mood_config = RICK_MOODS[mood]
     
     # Start with a burp or interjection sometimes
-    if random.random() < 0.5:
-        if random.random() < 0.3 and mood_config["interjections"]:
-            # Use mood-specific interjection
-            interjection = random.choice(mood_config["interjections"])
-        else:
-            # Use general interjection
-            interjection = get_unused_item(RICK_INTERJECTIONS, used_interjections)
-        
+    if rng.random() < 0.5:
+        interjection = pick_interjection(mood_config, personality)
         response = f"{interjection}, {response.lower()}"
     
     # Replace certain phrases with Rick-like alternatives
-    for normal, rick in RICK_REPLACEMENTS.items():
-        # Use word boundaries to only replace whole words, case-insensitive
-        response = re.sub(r'\b' + normal + r'\b', rick, response, flags=re.IGNORECASE)
+    response = replace_phrases(response)
     
-    # Stutter on some words that start with certain letters
-    words = response.split()
-    for i, word in enumerate(words):
-        if len(word) > 2 and word[0].lower() in "abcdefgw" and random.random() < mood_config["stutter_probability"]:
-            # Add stuttering like "w-w-word"
-            words[i] = f"{word[0]}-{word[0]}-{word}"
-    response = " ".join(words)
-    
-    # Add random stuttering on "I"
-    response = re.sub(r'\bI\b', lambda x: "I-I-I" if random.random() < mood_config["stutter_probability"] else "I", response)
+    # Stutter on some words and on "I"
+    response = add_stutters(response, mood_config["stutter_probability"], rng)
     
     # Add a catchphrase at the beginning or end sometimes
-    if random.random() < 0.25:
-        if random.random() < 0.4 and mood_config["catchphrases"]:
-            # Use mood-specific catchphrase
-            catchphrase = random.choice(mood_config["catchphrases"])
-        else:
-            # Use general catchphrase
-            catchphrase = get_unused_item(RICK_CATCHPHRASES, used_catchphrases)
+    if rng.random() < 0.25:
+        catchphrase = pick_catchphrase(mood_config, personality)
         
-        if random.random() < 0.7:
+        if rng.random() < 0.7:
             response = f"{catchphrase} {response}"
         else:
             response = f"{response} {catchphrase}"
     
     # Add a Rick-like ending sometimes
-    if random.random() < 0.3 and not response.endswith((".", "!", "?")):
+    if rng.random() < 0.3 and not response.endswith((".", "!", "?")):
         response += "."
-    if random.random() < 0.35:
-        if random.random() < 0.4 and mood_config["endings"]:
-            # Use mood-specific ending
-            ending = random.choice(mood_config["endings"])
-        else:
-            # Use general ending
-            ending = get_unused_item(RICK_ENDINGS, used_endings)
-        
-        response += f" {ending}"
+    if rng.random() < 0.35:
+        response += f" {pick_ending(mood_config, personality)}"
     
     # Add some random burps
-    if random.random() < mood_config["burp_probability"]:
-        sentences = re.split(r'(?<=[.!?])\s+', response)
-        for i in range(len(sentences)):
-            if random.random() < 0.3:
-                words = sentences[i].split()
-                if words:
-                    burp_idx = random.randint(0, len(words) - 1)
-                    words[burp_idx] = words[burp_idx] + " *burp*"
-                    sentences[i] = " ".join(words)
-        response = ' '.join(sentences)
+    if rng.random() < mood_config["burp_probability"]:
+        response = add_burps(response, rng)
     
     # Insert some scientific terminology
-    response = insert_science_references(response)
+    response = insert_science_references(response, rng)
     
     # Add dimension references sometimes
-    if random.random() < 0.2:
-        dimension_refs = [
-            f" Not in this dimension, anyway.",
-            f" Maybe in dimension {random.choice(['C-137', 'J19ζ7', 'D-99', 'C-500', '35-C'])}, but not here.",
-            f" The Council of Ricks would agree with me.",
-            f" Even the Citadel doesn't understand this stuff.",
-            f" I've got a portal gun that could solve this in seconds.",
-            f" My portal gun technology proves it.",
-            f" I could build a device to fix this with some scraps and a good buzz going."
-        ]
-        response += random.choice(dimension_refs)
+    if rng.random() < 0.2:
+        response += pick_dimension_reference(rng)
     
-    return response
\ No newline at end of file
+    return response
+
+
+class StreamingRickifier:
+    """
+    Rickify a response incrementally as the model decodes it.
+
+    Text is fed in as it arrives; every finished sentence is rickified and returned
+    straight away. Openers (interjection, catchphrase) go on the first sentence and
+    closers (ending, science and dimension references) are added by finish().
+    """
+
+    def __init__(self, personality=None):
+        self.personality = personality if personality is not None else RickPersonality()
+        self.buffer = ""
+        self.mood_config = None
+        self.burps_enabled = False
+        self.started = False
+
+    def feed(self, text):
+        """Add decoded text and return the rickified sentences it completed"""
+        self.buffer += text
+        sentences = SENTENCE_SPLIT_PATTERN.split(self.buffer)
+        # The last piece may still be growing
+        self.buffer = sentences.pop()
+        return [self._rickify_sentence(sentence) for sentence in sentences if sentence.strip()]
+
+    def finish(self):
+        """Flush whatever is buffered and add Rick's closing remarks"""
+        text = ""
+        if self.buffer.strip():
+            text = self._rickify_sentence(self.buffer)
+        self.buffer = ""
+
+        if self.mood_config is None:
+            return text
+
+        rng = self.personality.rng
+        closing = ""
+        if rng.random() < 0.35:
+            closing += f" {pick_ending(self.mood_config, self.personality)}"
+        if rng.random() < 0.4:
+            category = rng.choice(list(RICK_SCIENCE_TERMS.keys()))
+            term = rng.choice(RICK_SCIENCE_TERMS[category])
+            closing += f" It's like {term} theory 101."
+        if rng.random() < 0.2:
+            closing += pick_dimension_reference(rng)
+
+        return (text + closing).strip()
+
+    def _start(self, sentence):
+        # Set the mood from the first sentence, then decide the opener
+        rng = self.personality.rng
+        self.mood_config = RICK_MOODS[determine_rick_mood(sentence, rng)]
+        self.burps_enabled = rng.random() < self.mood_config["burp_probability"]
+        self.started = True
+
+        if rng.random() < 0.5:
+            sentence = f"{pick_interjection(self.mood_config, self.personality)}, {sentence.lower()}"
+        return sentence
+
+    def _rickify_sentence(self, sentence):
+        sentence = sentence.strip()
+        first = not self.started
+        if first:
+            sentence = self._start(sentence)
+
+        sentence = replace_phrases(sentence)
+        rng = self.personality.rng
+        sentence = add_stutters(sentence, self.mood_config["stutter_probability"], rng)
+        if self.burps_enabled:
+            sentence = add_burps(sentence, rng)
+
+        if first and rng.random() < 0.25 * 0.7:
+            sentence = f"{pick_catchphrase(self.mood_config, self.personality)} {sentence}"
+
+        return sentence
+
+
+# Canned replies from rick_config, compiled once at import
+REPLY_TABLES = compile_tables(RESPONSE_TABLES)
+
+
+def is_simple_input(user_input, intents=None):
+    """Very short inputs that aren't questions skip the model entirely"""
+    if len(user_input.split()) > 3:
+        return False
+    if intents is None:
+        intents = classify(user_input)
+    return "question" not in intents
+
+
+def get_simple_response(rng=random):
+    """Pick a dismissive reply for very short inputs"""
+    return REPLY_TABLES["simple"].pick(rng=rng)
+
+
+def get_themed_response(user_input, rng=random, intents=None):
+    """Fall back to predetermined responses for different question types"""
+    return REPLY_TABLES["themed"].pick(user_input, rng, intents)
+
+
+def get_fallback_response(rng=random):
+    """Pick a reply for when the whole reply pipeline fails"""
+    return REPLY_TABLES["fallback"].pick(rng=rng)
+
+
+# Generic/templated phrases that don't sound like Rick
+GENERIC_PHRASES = [
+    "I'm here to help",
+    "I'd be happy to",
+    "As an AI",
+    "I don't have personal",
+    "I cannot",
+    "I don't have the ability",
+    "As a language model"
+]
+
+
+def clean_generic_phrases(response):
+    """Remove generic/templated phrases that don't sound like Rick"""
+    for phrase in GENERIC_PHRASES:
+        if phrase in response:
+            response = response.replace(phrase, "")
+    return response
+
+
+def improve_response_quality(response, user_input, rng=random, intents=None):
+    """
+    Apply additional preprocessing to improve response quality.
+    `intents` is the user input's intent.Intents if the caller already classified it.
+    """
+
+    # Skip processing if response is too short
+    if not response or len(response) < 5:
+        return "Look, I'm too busy for this. Ask something that requires my genius brain."
+
+    # Remove generic/templated phrases that don't sound like Rick
+    response = clean_generic_phrases(response)
+
+    # Add science references for science questions
+    if intents is None:
+        intents = classify(user_input)
+    if "asks_explanation" in intents:
+        if "mentions_science" not in classify(response):
+            science_terms = [
+                "interdimensional",
+                "quantum",
+                "multiverse",
+                "temporal",
+                "subatomic",
+                "molecular",
+                "neural",
+                "galactic"
+            ]
+            if len(response) > 0:
+                term = rng.choice(science_terms)
+                sentence_end = response.find('.')
+                if sentence_end > 0:
+                    response = response[:sentence_end] + f". It's basic {term} physics, really." + response[
+                                                                                                   sentence_end + 1:]
+
+    # Clean up response
+    response = response.strip()
+
+    # Ensure we have something to return
+    if not response or len(response.split()) < 3:
+        return "Look, I'm too busy for this. Ask something that requires my genius brain."
+
+    return response
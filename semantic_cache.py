@@ -0,0 +1,272 @@
+"""
+Semantic cache of raw model outputs for differently worded messages.
+
+The exact response cache only hits when a prompt repeats word for word.
+Here each user message is embedded and compared with the messages already
+answered in the same bucket (the generation tier its intents picked) after
+the same earlier turns, and the raw output of the closest one is reused when
+the cosine similarity reaches the threshold. "whats the meaning of life" and "what is life's
+meaning?" land on the same entry.
+
+Embeddings come from either:
+- HashedNgramEmbedder: word and character n-grams hashed into a fixed-size
+  vector. Nothing to download, and contractions, possessives and filler
+  words are normalized away first so word order and phrasing matter less.
+- TransformerEmbedder: a small local sentence encoder (mean-pooled
+  transformer, e.g. sentence-transformers/all-MiniLM-L6-v2), downloaded once.
+
+Each bucket is a fixed-capacity torch matrix of unit vectors, so a lookup
+is one matrix-vector product. Entries expire after a TTL, and a full bucket
+evicts its least recently used entry. Only the user's latest message is
+embedded; the conversation before it is hashed, and a lookup only considers
+entries stored with the same hash, so a reply is never reused in a
+conversation it doesn't fit. In practice most hits are first messages.
+"""
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+
+from response_cache import normalize_prompt
+
+logger = logging.getLogger(__name__)
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+CONTRACTIONS = {
+    "whats": "what is", "what's": "what is", "hows": "how is", "how's": "how is", "whos": "who is",
+    "who's": "who is", "wheres": "where is", "where's": "where is", "whys": "why is", "why's": "why is",
+    "im": "i am", "i'm": "i am", "youre": "you are", "you're": "you are", "dont": "do not", "don't": "do not",
+    "doesnt": "does not", "doesn't": "does not", "cant": "can not", "can't": "can not", "isnt": "is not",
+    "isn't": "is not", "wont": "will not", "won't": "will not", "ur": "your", "u": "you",
+}
+# Words that don't change what is being asked; question words and negations are kept
+FILLER_WORDS = frozenset(
+    "a an the is are was were be been am do does did of to in on at for about with and or so just really "
+    "please tell me rick hey hi you your yours can could would will".split()
+)
+
+
+def content_words(text):
+    """Normalized words of a message: contractions expanded, possessives and filler words dropped"""
+    words = []
+    for word in normalize_prompt(text).replace("’", "'").split():
+        word = word.strip(".,!?;:\"()[]")
+        word = CONTRACTIONS.get(word, word)
+        if word.endswith("'s"):
+            word = word[:-2]
+        words.extend(WORD_PATTERN.findall(word))
+    return [word for word in words if word not in FILLER_WORDS] or words
+
+
+def context_hash(context):
+    """Hash of the conversation before a message; 0 for a first message"""
+    context = normalize_prompt(context)
+    return zlib.crc32(context.encode("utf-8")) if context else 0
+
+
+class HashedNgramEmbedder:
+    """Signed feature hashing of words, word pairs and character trigrams into a unit vector"""
+
+    name = "hashed"
+
+    def __init__(self, dimensions=4096):
+        self.dimensions = dimensions
+
+    def features(self, text):
+        words = content_words(text)
+        # Words weigh most; character trigrams catch typos and inflections ("ricks" / "rick's")
+        features = [(f"w:{word}", 1.0) for word in words]
+        features += [(f"p:{first} {second}", 0.5) for first, second in zip(words, words[1:])]
+        for word in words:
+            padded = f"<{word}>"
+            features += [(f"c:{padded[i:i + 3]}", 0.25) for i in range(len(padded) - 2)]
+        return features
+
+    def embed(self, text):
+        import torch
+
+        totals = {}
+        for feature, weight in self.features(text):
+            hashed = zlib.crc32(feature.encode("utf-8"))
+            slot = hashed % self.dimensions
+            # The top bit picks the sign, so collisions cancel out instead of adding up
+            totals[slot] = totals.get(slot, 0.0) + (weight if hashed & 0x80000000 else -weight)
+        vector = torch.zeros(self.dimensions)
+        if totals:
+            vector[list(totals)] = torch.tensor(list(totals.values()))
+        norm = vector.norm()
+        return vector / norm if norm > 0 else vector
+
+
+class TransformerEmbedder:
+    """Mean-pooled sentence embeddings from a small local transformer encoder"""
+
+    def __init__(self, model_name, model_dir):
+        from transformers import AutoModel, AutoTokenizer
+
+        self.name = model_name
+        if not os.path.exists(os.path.join(model_dir, "config.json")):
+            logger.info("Downloading sentence encoder %s to %s...", model_name, model_dir)
+            os.makedirs(model_dir, exist_ok=True)
+            AutoTokenizer.from_pretrained(model_name).save_pretrained(model_dir)
+            AutoModel.from_pretrained(model_name).save_pretrained(model_dir, safe_serialization=True)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.model = AutoModel.from_pretrained(model_dir).eval()
+        self.dimensions = self.model.config.hidden_size
+        self._lock = threading.Lock()
+
+    def embed(self, text):
+        import torch
+
+        inputs = self.tokenizer(" ".join(content_words(text)) or text, return_tensors="pt", truncation=True,
+                                max_length=64)
+        with self._lock, torch.no_grad():
+            states = self.model(**inputs).last_hidden_state[0]
+        mask = inputs["attention_mask"][0].unsqueeze(-1).to(states.dtype)
+        vector = (states * mask).sum(dim=0) / mask.sum()
+        return torch.nn.functional.normalize(vector.float(), dim=0)
+
+
+def create_embedder(encoder, dimensions=4096, model_dir=None):
+    """The configured embedder; falls back to hashed n-grams if the sentence encoder can't load"""
+    if encoder == "hashed":
+        return HashedNgramEmbedder(dimensions)
+    try:
+        return TransformerEmbedder(encoder, model_dir)
+    except Exception as e:
+        logger.warning("Could not load sentence encoder %s, using hashed n-grams: %s", encoder, e)
+        return HashedNgramEmbedder(dimensions)
+
+
+class BucketIndex:
+    """Fixed-capacity cosine-similarity index: one unit vector per row, free rows are zero"""
+
+    def __init__(self, dimensions, capacity):
+        import torch
+
+        self.vectors = torch.zeros((capacity, dimensions))
+        # Hash of the conversation before each entry's message
+        self.contexts = torch.zeros(capacity, dtype=torch.long)
+        self.responses = [None] * capacity
+        self.stored_at = [0.0] * capacity
+        self.last_used = [0.0] * capacity
+        # Rows [0, used) have been handed out at some point; free ones below it are reused first
+        self.used = 0
+        self.free = []
+
+    def __len__(self):
+        return self.used - len(self.free)
+
+    def search(self, vector, context=0):
+        """(row, similarity) of the closest entry with the same context, or (None, 0.0) if there is none"""
+        if len(self) == 0:
+            return None, 0.0
+        similarities = self.vectors[:self.used] @ vector
+        similarities.masked_fill_(self.contexts[:self.used] != context, -1.0)
+        row = int(similarities.argmax())
+        return row, float(similarities[row])
+
+    def remove(self, row):
+        self.vectors[row].zero_()
+        self.responses[row] = None
+        self.free.append(row)
+
+    def add(self, vector, context, response, now):
+        """Store an entry; returns True if the least recently used entry was evicted for it"""
+        evicted = False
+        if self.free:
+            row = self.free.pop()
+        elif self.used < len(self.responses):
+            row = self.used
+            self.used += 1
+        else:
+            row = min(range(self.used), key=self.last_used.__getitem__)
+            evicted = True
+        self.vectors[row] = vector
+        self.contexts[row] = context
+        self.responses[row] = response
+        self.stored_at[row] = now
+        self.last_used[row] = now
+        return evicted
+
+
+class SemanticCache:
+    """Per-bucket nearest-neighbour cache of raw model outputs, with hit and lookup-time stats"""
+
+    def __init__(self, embedder, threshold=0.85, max_entries_per_bucket=1024, ttl=86400):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.max_entries_per_bucket = max_entries_per_bucket
+        self.ttl = ttl
+
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lookup_seconds = 0.0
+
+    def get(self, text, bucket, context=""):
+        """
+        The raw output cached for the closest message in `bucket` that followed the same
+        `context` (the conversation before `text`), if it's similar enough
+        """
+        started = time.perf_counter()
+        vector = self.embedder.embed(text)
+        context = context_hash(context)
+        now = time.time()
+        with self._lock:
+            index = self._buckets.get(bucket)
+            row, similarity = index.search(vector, context) if index is not None else (None, 0.0)
+            if row is not None and index.responses[row] is None:
+                row = None
+            if row is not None and self.ttl and now - index.stored_at[row] > self.ttl:
+                index.remove(row)
+                row = None
+            if row is None or similarity < self.threshold:
+                self.misses += 1
+                response = None
+            else:
+                index.last_used[row] = now
+                self.hits += 1
+                response = index.responses[row]
+            self.lookup_seconds += time.perf_counter() - started
+        if response is not None:
+            logger.debug("Semantic cache hit in %s (similarity %.2f)", bucket, similarity)
+        return response
+
+    def put(self, text, bucket, response, context=""):
+        """Cache a raw output for a message after `context`; a near-identical message's entry is replaced"""
+        vector = self.embedder.embed(text)
+        context = context_hash(context)
+        now = time.time()
+        with self._lock:
+            index = self._buckets.get(bucket)
+            if index is None:
+                index = self._buckets[bucket] = BucketIndex(vector.shape[0], self.max_entries_per_bucket)
+            row, similarity = index.search(vector, context)
+            if row is not None and similarity >= 0.99:
+                index.remove(row)
+            if index.add(vector, context, response, now):
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def stats(self):
+        """Hit/miss counters, hit rate, entries and mean lookup time"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "encoder": self.embedder.name,
+                "entries": sum(len(index) for index in self._buckets.values()),
+                "buckets": len(self._buckets),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "avg_lookup_ms": self.lookup_seconds * 1000 / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,311 @@
+"""
+Conversation session storage.
+
+Sessions are kept in an LRU with an idle TTL, so the random session ids the
+browser creates on every page load don't pile up forever. History is a
+bounded deque per session. The SQLite backend also persists history so it
+survives restarts, and can be shared by several worker processes.
+"""
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+
+# Rough fixed cost of a session object, its deque and bookkeeping
+SESSION_OVERHEAD_BYTES = 1024
+
+
+class Session:
+    """A single conversation: bounded history plus per-session Rick state"""
+
+    def __init__(self, session_id, max_turns, personality=None, history=()):
+        self.session_id = session_id
+        self.history = deque(maxlen=max_turns)
+        self.personality = personality
+        self.created_at = time.time()
+        self.last_access = self.created_at
+        self.history_bytes = 0
+        # Token ids per turn text, filled in by context_builder.ContextBuilder
+        self.token_cache = {}
+        # Id of the newest persisted turn this copy has seen (SQLite backend)
+        self.version = None
+        for text in history:
+            self.add_turn(text)
+
+    def add_turn(self, text):
+        """Append a turn, dropping the oldest one once the history is full"""
+        if len(self.history) == self.history.maxlen:
+            self.history_bytes -= sys.getsizeof(self.history[0])
+        self.history.append(text)
+        self.history_bytes += sys.getsizeof(text)
+
+    def clear(self):
+        self.history.clear()
+        self.token_cache.clear()
+        self.history_bytes = 0
+        self.version = None
+
+    def memory_bytes(self):
+        return SESSION_OVERHEAD_BYTES + self.history_bytes
+
+
+class MemorySessionStore:
+    """
+    In-process session store with an LRU cap and idle TTL.
+
+    `personality_factory(session_id)` is called to create each new session's
+    personality state.
+    """
+
+    def __init__(self, max_turns=5, max_sessions=1000, idle_ttl=3600, personality_factory=None):
+        self.max_turns = max_turns
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.personality_factory = personality_factory
+        self._sessions = OrderedDict()
+        self._lock = threading.RLock()
+        self._evicted_lru = 0
+        self._evicted_ttl = 0
+
+    def get(self, session_id):
+        """Return the session, creating it if needed, and mark it as recently used"""
+        with self._lock:
+            now = time.time()
+            self._evict_expired(now)
+
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._create(session_id)
+                self._sessions[session_id] = session
+                self._evict_lru()
+            else:
+                self._sessions.move_to_end(session_id)
+
+            session.last_access = now
+            return session
+
+    def add_turn(self, session_id, text):
+        """Add a turn to a session's history"""
+        with self._lock:
+            self.get(session_id).add_turn(text)
+
+    def get_history(self, session_id):
+        """Return a copy of a session's history, oldest turn first"""
+        with self._lock:
+            return list(self.get(session_id).history)
+
+    def snapshot(self, session_id):
+        """Return the session and a copy of its history, taken together under the lock"""
+        with self._lock:
+            session = self.get(session_id)
+            return session, list(session.history)
+
+    def clear(self, session_id):
+        """Forget a session's history (its personality is kept)"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.clear()
+
+    def evict_expired(self):
+        """Drop sessions that have been idle longer than the TTL"""
+        with self._lock:
+            return self._evict_expired(time.time())
+
+    def __contains__(self, session_id):
+        with self._lock:
+            return session_id in self._sessions
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def stats(self):
+        """Session counts, eviction counters and approximate memory use"""
+        with self._lock:
+            return {
+                "backend": "memory",
+                "sessions": len(self._sessions),
+                "memory_bytes": sum(session.memory_bytes() for session in self._sessions.values()),
+                "evicted_lru": self._evicted_lru,
+                "evicted_ttl": self._evicted_ttl,
+            }
+
+    def _create(self, session_id, history=()):
+        personality = self.personality_factory(session_id) if self.personality_factory else None
+        return Session(session_id, self.max_turns, personality, history)
+
+    def _evict_lru(self):
+        while self.max_sessions and len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self._evicted_lru += 1
+
+    def _evict_expired(self, now):
+        if not self.idle_ttl:
+            return 0
+        cutoff = now - self.idle_ttl
+        evicted = 0
+        # Sessions are ordered by last access, so expired ones are at the front
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.last_access >= cutoff:
+                break
+            self._sessions.popitem(last=False)
+            evicted += 1
+        self._evicted_ttl += evicted
+        return evicted
+
+
+class SQLiteSessionStore(MemorySessionStore):
+    """
+    Session store that persists history to SQLite.
+
+    Recently used sessions stay cached in memory with the same LRU/TTL rules;
+    history is read back from the database when an evicted or pre-restart
+    session comes back. Sessions idle past the TTL are deleted from the
+    database as well.
+
+    With `shared=True` several processes use the same database file: each
+    cached session is checked against the newest turn id in the database on
+    access and reloaded if another process added turns or cleared it. Sticky
+    routing keeps that rare, so the check is usually one indexed lookup.
+    """
+
+    # Minimum seconds between expired-session sweeps of the database
+    SWEEP_INTERVAL = 60
+
+    def __init__(self, path, max_turns=5, max_sessions=1000, idle_ttl=3600, personality_factory=None,
+                 shared=False):
+        super().__init__(max_turns, max_sessions, idle_ttl, personality_factory)
+        self.path = path
+        self.shared = shared
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        # Other processes may hold the write lock briefly
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS turns ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "session_id TEXT NOT NULL, "
+            "text TEXT NOT NULL, "
+            "created_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS turns_session ON turns (session_id, id)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, "
+            "last_access REAL NOT NULL)"
+        )
+        self._last_sweep = 0.0
+
+    def get(self, session_id):
+        with self._lock:
+            cached = session_id in self._sessions
+            session = super().get(session_id)
+            if self.shared and cached:
+                self._sync(session)
+            return session
+
+    def add_turn(self, session_id, text):
+        with self._lock:
+            now = time.time()
+            session = self.get(session_id)
+            session.add_turn(text)
+            with self._db:
+                self._db.execute("BEGIN")
+                cursor = self._db.execute("INSERT INTO turns (session_id, text, created_at) VALUES (?, ?, ?)",
+                                          (session_id, text, now))
+                session.version = cursor.lastrowid
+                # Only keep the last max_turns rows for this session
+                self._db.execute(
+                    "DELETE FROM turns WHERE session_id = ? AND id NOT IN "
+                    "(SELECT id FROM turns WHERE session_id = ? ORDER BY id DESC LIMIT ?)",
+                    (session_id, session_id, self.max_turns)
+                )
+                self._db.execute("INSERT OR REPLACE INTO sessions (session_id, last_access) VALUES (?, ?)",
+                                 (session_id, now))
+
+    def clear(self, session_id):
+        with self._lock:
+            super().clear(session_id)
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+                self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats["backend"] = "sqlite"
+            stats["persisted_sessions"] = self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _load_turns(self, session_id):
+        """(newest turn id, history oldest first) from the database"""
+        rows = self._db.execute(
+            "SELECT id, text FROM turns WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+            (session_id, self.max_turns)
+        ).fetchall()
+        return (rows[0][0] if rows else None), [text for _, text in reversed(rows)]
+
+    def _create(self, session_id, history=()):
+        version, history = self._load_turns(session_id)
+        session = super()._create(session_id, history)
+        session.version = version
+        return session
+
+    def _sync(self, session):
+        """Reload a cached session's history if another process changed it"""
+        newest = self._db.execute("SELECT MAX(id) FROM turns WHERE session_id = ?",
+                                  (session.session_id,)).fetchone()[0]
+        if newest == session.version:
+            return
+        version, history = self._load_turns(session.session_id)
+        session.clear()
+        for text in history:
+            session.add_turn(text)
+        session.version = version
+
+    def _evict_expired(self, now):
+        evicted = super()._evict_expired(now)
+        if self.idle_ttl and now - self._last_sweep >= self.SWEEP_INTERVAL:
+            self._last_sweep = now
+            cutoff = now - self.idle_ttl
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.execute(
+                    "DELETE FROM turns WHERE session_id IN (SELECT session_id FROM sessions WHERE last_access < ?)",
+                    (cutoff,)
+                )
+                self._db.execute("DELETE FROM sessions WHERE last_access < ?", (cutoff,))
+        return evicted
+
+
+def create_session_store(config, max_turns=5, personality_factory=None, base_dir="."):
+    """Build the session store described by CONFIG["sessions"]"""
+    backend = config.get("backend", "memory")
+    # Shared sessions need a database every process can see
+    if config.get("shared") and backend != "sqlite":
+        raise ValueError("Shared sessions need the sqlite backend")
+    options = {
+        "max_turns": max_turns,
+        "max_sessions": config.get("max_sessions", 1000),
+        "idle_ttl": config.get("idle_ttl", 3600),
+        "personality_factory": personality_factory,
+    }
+    if backend == "memory":
+        return MemorySessionStore(**options)
+    if backend == "sqlite":
+        return SQLiteSessionStore(os.path.join(base_dir, config.get("sqlite_path", "sessions.db")),
+                                  shared=config.get("shared", False), **options)
+    raise ValueError(f"Unknown session store backend: {backend}")
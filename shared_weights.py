@@ -0,0 +1,223 @@
+"""
+Zero-copy, memory-mapped model weights.
+
+from_pretrained copies every tensor into private process memory, so each
+worker process (cluster.py) holds its own multi-GB copy of the weights. Here
+each safetensors file in MODEL_DIR is mapped copy-on-write with
+torch.UntypedStorage.from_file, and every tensor is a view into that mapping
+at the offset its header gives. Nothing is read until a page is touched,
+and the pages are the kernel's page cache, so N processes on one host share
+one physical copy of the read-only weights.
+
+A view needs its tensor to start at a multiple of its element size inside
+the file. ensure_mmap_layout() checks that once and rewrites the weights
+(including a legacy pytorch_model.bin) to an aligned model.safetensors when
+needed.
+
+Only fp32 CPU inference keeps the sharing: casting to bf16 or quantizing to
+int8 makes private copies.
+"""
+import ctypes
+import json
+import logging
+import os
+import struct
+
+from file_lock import file_lock, temp_path
+
+logger = logging.getLogger(__name__)
+
+SAFETENSORS_FILE = "model.safetensors"
+SAFETENSORS_INDEX_FILE = "model.safetensors.index.json"
+PYTORCH_FILE = "pytorch_model.bin"
+
+# safetensors dtype name -> (torch dtype name, bytes per element)
+DTYPES = {
+    "F64": ("float64", 8),
+    "F32": ("float32", 4),
+    "F16": ("float16", 2),
+    "BF16": ("bfloat16", 2),
+    "I64": ("int64", 8),
+    "I32": ("int32", 4),
+    "I16": ("int16", 2),
+    "I8": ("int8", 1),
+    "U8": ("uint8", 1),
+    "BOOL": ("bool", 1),
+}
+DTYPE_NAMES = {torch_name: name for name, (torch_name, _) in DTYPES.items()}
+
+
+def read_header(path):
+    """
+    Parse a safetensors header. Returns (tensors, data_start): tensors maps each name to
+    its dtype, shape and [begin, end) byte offsets relative to data_start.
+    """
+    with open(path, "rb") as f:
+        (header_size,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_size))
+    header.pop("__metadata__", None)
+    return header, 8 + header_size
+
+
+def safetensors_files(model_dir):
+    """The model's safetensors files (one, or the shards of an index), or [] if there are none"""
+    index_path = os.path.join(model_dir, SAFETENSORS_INDEX_FILE)
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            shards = sorted(set(json.load(f)["weight_map"].values()))
+        return [os.path.join(model_dir, shard) for shard in shards]
+    path = os.path.join(model_dir, SAFETENSORS_FILE)
+    return [path] if os.path.exists(path) else []
+
+
+def is_aligned(path):
+    """True if every tensor in the file can be viewed in place"""
+    tensors, data_start = read_header(path)
+    for info in tensors.values():
+        _, itemsize = DTYPES.get(info["dtype"], (None, 0))
+        if not itemsize or (data_start + info["data_offsets"][0]) % itemsize:
+            return False
+    return True
+
+
+def _write_aligned(state_dict, path):
+    """
+    Save tensors as safetensors with every tensor aligned to its element size: the header
+    is padded to 8 bytes and tensors go in order of decreasing element size. Tensors that
+    share storage (tied weights) are saved once.
+    """
+    seen = set()
+    unique = {}
+    for name, tensor in state_dict.items():
+        key = (tensor.untyped_storage().data_ptr(), tensor.storage_offset(), tuple(tensor.shape))
+        if key not in seen:
+            seen.add(key)
+            unique[name] = tensor.contiguous()
+
+    names = sorted(unique, key=lambda name: (-unique[name].element_size(), name))
+    header = {"__metadata__": {"format": "pt"}}
+    offset = 0
+    for name in names:
+        tensor = unique[name]
+        nbytes = tensor.numel() * tensor.element_size()
+        header[name] = {"dtype": DTYPE_NAMES[str(tensor.dtype).replace("torch.", "")],
+                        "shape": list(tensor.shape), "data_offsets": [offset, offset + nbytes]}
+        offset += nbytes
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    # Trailing spaces are valid JSON, so the padding needs no special handling by readers
+    header_bytes += b" " * (-(8 + len(header_bytes)) % 8)
+
+    temp = temp_path(path)
+    with open(temp, "wb") as f:
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for name in names:
+            tensor = unique[name]
+            nbytes = tensor.numel() * tensor.element_size()
+            if nbytes:
+                f.write(ctypes.string_at(tensor.data_ptr(), nbytes))
+    os.replace(temp, path)
+
+
+def ensure_mmap_layout(model_dir):
+    """
+    Make sure model_dir has aligned safetensors weights, converting them once if needed.
+    Returns the safetensors files.
+    """
+    import torch
+
+    files = safetensors_files(model_dir)
+    if files and all(is_aligned(path) for path in files):
+        return files
+
+    # Workers starting together all get here on first boot; one converts, the rest wait and re-check
+    with file_lock(os.path.join(model_dir, SAFETENSORS_FILE)):
+        files = safetensors_files(model_dir)
+        if files:
+            for path in files:
+                if not is_aligned(path):
+                    from safetensors.torch import load_file
+
+                    logger.info("Rewriting %s with aligned tensors for memory mapping", path)
+                    _write_aligned(load_file(path), path)
+            return files
+
+        legacy = os.path.join(model_dir, PYTORCH_FILE)
+        if not os.path.exists(legacy):
+            raise FileNotFoundError(f"No model weights in {model_dir}")
+        logger.info("Converting %s to %s for memory mapping", PYTORCH_FILE, SAFETENSORS_FILE)
+        path = os.path.join(model_dir, SAFETENSORS_FILE)
+        _write_aligned(torch.load(legacy, map_location="cpu"), path)
+        return [path]
+
+
+def mmap_state_dict(path):
+    """Tensors of one safetensors file as views into a copy-on-write mapping of the file"""
+    import torch
+
+    tensors, data_start = read_header(path)
+    storage = torch.UntypedStorage.from_file(path, False, os.path.getsize(path))
+    state_dict = {}
+    for name, info in tensors.items():
+        dtype_name, itemsize = DTYPES[info["dtype"]]
+        dtype = getattr(torch, dtype_name)
+        begin = data_start + info["data_offsets"][0]
+        if begin % itemsize:
+            raise ValueError(f"{name} in {path} isn't aligned for memory mapping")
+        tensor = torch.empty(0, dtype=dtype)
+        if info["shape"]:
+            strides = torch.empty(info["shape"], device="meta").stride()
+            tensor.set_(storage, begin // itemsize, info["shape"], strides)
+        else:
+            tensor.set_(storage, begin // itemsize, (), ())
+        state_dict[name] = tensor
+    return state_dict
+
+
+def _assign(model, name, tensor):
+    """Put a tensor into the model in place of the parameter or buffer called `name`"""
+    import torch
+
+    module_path, _, attr = name.rpartition(".")
+    try:
+        module = model.get_submodule(module_path) if module_path else model
+    except AttributeError:
+        return False
+    if attr in module._parameters:
+        module._parameters[attr] = torch.nn.Parameter(tensor, requires_grad=False)
+    elif attr in module._buffers:
+        module._buffers[attr] = tensor
+    else:
+        return False
+    return True
+
+
+def load_mmap_model(model_class, model_dir):
+    """
+    Build the model without allocating weights and point every parameter at the
+    memory-mapped safetensors data. The weights must stay read-only (inference only).
+    """
+    from accelerate import init_empty_weights
+    from transformers import AutoConfig
+
+    files = ensure_mmap_layout(model_dir)
+    config = AutoConfig.from_pretrained(model_dir)
+    with init_empty_weights():
+        model = model_class.from_config(config)
+
+    unexpected = []
+    for path in files:
+        for name, tensor in mmap_state_dict(path).items():
+            if not _assign(model, name, tensor):
+                unexpected.append(name)
+    if unexpected:
+        logger.debug("Ignored %d unexpected weights: %s", len(unexpected), unexpected[:5])
+
+    # Tied weights (shared embeddings, lm_head) are saved once; point the others at them
+    model.tie_weights()
+    missing = [name for name, tensor in list(model.named_parameters()) + list(model.named_buffers())
+               if tensor.is_meta]
+    if missing:
+        raise ValueError(f"Weights missing from {model_dir}: {missing[:5]}")
+    logger.info("Memory-mapped %d weight file(s) from %s", len(files), model_dir)
+    return model.eval()
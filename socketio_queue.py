@@ -0,0 +1,96 @@
+"""
+SQLite message queue for Socket.IO across worker processes.
+
+With several worker processes (cluster.py) an emit has to reach the process
+that holds the client's connection. python-socketio does that with a pub/sub
+client manager: every emit is published to a queue, and every process
+delivers the messages meant for its own clients. SQLiteManager keeps that
+queue in a table in a file all workers on the host share, so one machine
+needs no Redis: publishing appends a row, and each process polls for rows
+newer than the last one it saw. Rows older than the retention window are
+pruned.
+
+For workers spread over several hosts use a real broker instead; a
+"redis://" or other Kombu URL is passed straight to Flask-SocketIO.
+"""
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+import socketio
+
+logger = logging.getLogger(__name__)
+
+SQLITE_SCHEME = "sqlite:///"
+
+
+class SQLiteManager(socketio.PubSubManager):
+    """Socket.IO client manager that fans out through a SQLite table"""
+
+    name = "sqlite"
+
+    def __init__(self, path, channel="socketio", write_only=False, logger=None, poll_interval=0.02,
+                 retention=60):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "channel TEXT NOT NULL, "
+            "payload BLOB NOT NULL, "
+            "created_at REAL NOT NULL)"
+        )
+
+    def _publish(self, data):
+        with self._lock:
+            self._db.execute("INSERT INTO messages (channel, payload, created_at) VALUES (?, ?, ?)",
+                             (self.channel, pickle.dumps(data), time.time()))
+
+    def _listen(self):
+        # Only messages published after this process started listening
+        with self._lock:
+            last_id = self._db.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0]
+        next_prune = time.monotonic() + self.retention
+        while True:
+            try:
+                with self._lock:
+                    rows = self._db.execute(
+                        "SELECT id, payload FROM messages WHERE id > ? AND channel = ? ORDER BY id",
+                        (last_id, self.channel)
+                    ).fetchall()
+                    if time.monotonic() >= next_prune:
+                        next_prune = time.monotonic() + self.retention
+                        self._db.execute("DELETE FROM messages WHERE created_at < ?", (time.time() - self.retention,))
+            except sqlite3.Error as e:
+                logger.warning("Socket.IO queue read failed: %s", e)
+                rows = []
+            for message_id, payload in rows:
+                last_id = message_id
+                yield bytes(payload)
+            self.server.sleep(self.poll_interval)
+
+
+def socketio_queue_options(url, base_dir=".", poll_interval=0.02):
+    """
+    SocketIO(...) keyword arguments for a message queue URL: a SQLiteManager for
+    "sqlite:///path" (relative to base_dir), Flask-SocketIO's own support for anything
+    else, and nothing if `url` is empty.
+    """
+    if not url:
+        return {}
+    if url.startswith(SQLITE_SCHEME):
+        path = os.path.join(base_dir, url[len(SQLITE_SCHEME):])
+        return {"client_manager": SQLiteManager(path, poll_interval=poll_interval)}
+    return {"message_queue": url}
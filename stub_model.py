@@ -0,0 +1,138 @@
+"""
+Deterministic stand-in for the chat model, for load tests and CI.
+
+StubEngine is a RickEngine whose "model" needs no torch, no transformers
+and no download: replies are picked from a fixed list by hashing the
+prompt's token ids, and each generation sleeps for a configurable time per
+batch and per token, so latency, batching and streaming behave roughly like
+the real thing. Everything else (sessions, context building, caching,
+batching, rickification, metrics) is the real engine code.
+
+Start the server with it using RICK_STUB_MODEL=1.
+"""
+import os
+import queue
+import threading
+import time
+import zlib
+
+from context_builder import ContextBuilder
+from rick_engine import GENERATED_TOKENS, PROMPT_TOKENS, STAGE_SECONDS, RickEngine
+
+STUB_REPLIES = [
+    "The portal gun folds space so two points touch. It is not complicated.",
+    "Jerry is a walking example of what happens when evolution gives up.",
+    "Life has no meaning. That is the good news, because now you can stop looking.",
+    "I built a quantum battery out of a car and some spare time. You would not understand it.",
+    "Morty, we do not have time for this. Grab the bag and get in the ship.",
+    "Every dimension has a version of this question, and every one of them is boring.",
+    "Science is about taking things apart until they stop arguing with you.",
+    "I drink because I can see all of reality at once. What is your excuse?",
+]
+
+
+class StubTokenizer:
+    """Whitespace tokenizer with a growing vocabulary; id 2 is end of sequence"""
+
+    eos_token_id = 2
+    pad_token_id = 0
+
+    def __init__(self):
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def num_special_tokens_to_add(self):
+        return 1
+
+    def encode(self, text, add_special_tokens=False):
+        ids = []
+        with self._lock:
+            for word in text.split():
+                token_id = self._ids.get(word)
+                if token_id is None:
+                    token_id = self._ids[word] = len(self._ids) + 3
+                ids.append(token_id)
+        if add_special_tokens:
+            ids = self.build_inputs_with_special_tokens(ids)
+        return ids
+
+    def build_inputs_with_special_tokens(self, ids):
+        return list(ids) + [self.eos_token_id]
+
+
+class StubStreamer:
+    """Queue of text pieces from the stub model, iterated like transformers' TextIteratorStreamer"""
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self._queue = queue.Queue()
+
+    def put(self, text):
+        self._queue.put(text)
+
+    def end(self):
+        self._queue.put(None)
+
+    def __iter__(self):
+        while True:
+            text = self._queue.get(timeout=self.timeout)
+            if text is None:
+                return
+            yield text
+
+
+class StubEngine(RickEngine):
+    """RickEngine with the deterministic stub model instead of BlenderBot"""
+
+    def __init__(self, *args, batch_latency=None, token_latency=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Seconds per generate call and per generated token
+        self.batch_latency = batch_latency if batch_latency is not None else \
+            float(os.environ.get("RICK_STUB_BATCH_MS", 50)) / 1000.0
+        self.token_latency = token_latency if token_latency is not None else \
+            float(os.environ.get("RICK_STUB_TOKEN_MS", 5)) / 1000.0
+        self.model_name = "stub"
+
+    def load(self):
+        self.status["started_at"] = time.time()
+        self.set_status("starting", 0.0)
+        self.tokenizer = StubTokenizer()
+        self.status["backend"] = "stub"
+        self.context_builder = ContextBuilder(self.tokenizer, self.preamble, max_tokens=self.max_context_tokens,
+                                              separator=self.turn_separator)
+        if self.batch_scheduler is not None:
+            self.batch_scheduler.start()
+        self.set_status("ready", 1.0)
+        return True
+
+    def stub_reply(self, prompt):
+        """The reply the stub model gives for a prompt (a string or a list of token ids)"""
+        key = prompt.encode("utf-8") if isinstance(prompt, str) else repr(list(prompt)).encode("ascii")
+        return STUB_REPLIES[zlib.crc32(key) % len(STUB_REPLIES)]
+
+    def generate_batch(self, prompts, key=None, deadlines=None, streamers=None):
+        replies = [self.stub_reply(prompt) for prompt in prompts]
+        words = [reply.split() for reply in replies]
+        streamers = streamers or [None] * len(prompts)
+        # A batch costs one fixed step plus the longest reply's decode, like a padded batch would
+        longest = max(len(reply_words) for reply_words in words)
+        with STAGE_SECONDS.time(stage="generate"):
+            time.sleep(self.batch_latency)
+            for step in range(longest):
+                # Stop early like the deadline stopping criterion does
+                if deadlines and all(deadline is not None and deadline.expired() for deadline in deadlines):
+                    break
+                time.sleep(self.token_latency)
+                for reply_words, streamer in zip(words, streamers):
+                    if streamer is not None and step < len(reply_words):
+                        streamer.put(reply_words[step] + " ")
+        for streamer in streamers:
+            if streamer is not None:
+                streamer.end()
+        PROMPT_TOKENS.inc(sum(len(prompt) if not isinstance(prompt, str) else len(prompt.split())
+                              for prompt in prompts))
+        GENERATED_TOKENS.inc(sum(len(reply.split()) for reply in replies))
+        return replies
+
+    def create_streamer(self):
+        return StubStreamer(timeout=self.stream_chunk_timeout)
@@ -0,0 +1,49 @@
+import importlib
+import time
+
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("flask_socketio")
+eventlet = pytest.importorskip("eventlet")
+
+from rick_config import CONFIG  # noqa: E402
+from stub_model import StubEngine  # noqa: E402
+
+GENERATION_SECONDS = 1.0
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv("RICK_STUB_MODEL", "1")
+    app = importlib.import_module("app")
+    config = dict(CONFIG,
+                  batching=dict(CONFIG["batching"], enabled=False),
+                  cache=dict(CONFIG["cache"], enabled=False),
+                  sessions=dict(CONFIG["sessions"], backend="memory"),
+                  degraded_mode=dict(CONFIG["degraded_mode"], enabled=False))
+    engine = StubEngine(config, base_dir=str(tmp_path), batch_latency=GENERATION_SECONDS)
+    engine.load()
+    monkeypatch.setattr(app, "engine", engine)
+    monkeypatch.setattr(app, "USE_WORKER_THREADS", True)
+    yield app
+    engine.close()
+
+
+def test_clear_history_is_served_while_a_generation_runs(app):
+    client = app.app.test_client()
+    started = time.monotonic()
+    chat = eventlet.spawn(client.post, "/chat", json={"message": "How does the portal gun work?",
+                                                      "session_id": "busy"})
+    # Let the /chat request reach the worker pool
+    eventlet.sleep(0.1)
+
+    cleared_at = time.monotonic()
+    response = client.post("/clear_history", json={"session_id": "other"})
+    elapsed = time.monotonic() - cleared_at
+
+    assert response.status_code == 200
+    assert elapsed < GENERATION_SECONDS / 4
+    assert not chat.dead
+    assert chat.wait().status_code == 200
+    assert time.monotonic() - started >= GENERATION_SECONDS
@@ -0,0 +1,124 @@
+import threading
+
+import pytest
+
+from backpressure import FULL, OWNER, QUEUED, InflightLimit, MessageCoalescer, RateLimiter
+
+
+def test_rate_limiter_allows_a_burst_then_asks_to_wait():
+    limiter = RateLimiter(rate=0.5, burst=5)
+    assert [limiter.allow("a", now=0.0) for _ in range(5)] == [0.0] * 5
+    assert limiter.allow("a", now=0.0) == 2.0
+
+
+def test_rate_limiter_refills_at_rate():
+    limiter = RateLimiter(rate=0.5, burst=5)
+    for _ in range(5):
+        limiter.allow("a", now=0.0)
+    assert limiter.allow("a", now=2.0) == 0.0
+    assert limiter.allow("a", now=2.1) == pytest.approx(1.9)
+
+
+def test_rate_limiter_refill_is_capped_at_burst():
+    limiter = RateLimiter(rate=1.0, burst=2)
+    limiter.allow("a", now=0.0)
+    results = [limiter.allow("a", now=1000.0) for _ in range(3)]
+    assert results[:2] == [0.0, 0.0]
+    assert results[2] > 0.0
+
+
+def test_rate_limiter_keys_are_independent():
+    limiter = RateLimiter(rate=1.0, burst=1)
+    assert limiter.allow("a", now=0.0) == 0.0
+    assert limiter.allow("a", now=0.0) > 0.0
+    assert limiter.allow("b", now=0.0) == 0.0
+
+
+def test_rate_limiter_forgets_least_recently_seen_keys():
+    limiter = RateLimiter(rate=1.0, burst=1, max_keys=2)
+    limiter.allow("a", now=0.0)
+    limiter.allow("b", now=0.0)
+    limiter.allow("a", now=0.0)
+    limiter.allow("c", now=0.0)
+    assert len(limiter) == 2
+    # "b" was dropped, so it starts with a full bucket again; "a" is still empty
+    assert limiter.allow("b", now=0.0) == 0.0
+    assert limiter.allow("c", now=0.0) > 0.0
+
+
+def test_rate_limiter_disabled_with_zero_rate():
+    limiter = RateLimiter(rate=0, burst=0)
+    assert all(limiter.allow("a", now=0.0) == 0.0 for _ in range(100))
+
+
+def test_coalescer_merges_messages_sent_while_owner_generates():
+    coalescer = MessageCoalescer(max_messages=5)
+    assert coalescer.add("s", "one") == OWNER
+    assert coalescer.take("s") == ["one"]
+    # The owner is generating a reply to "one"; these wait for its next round
+    assert coalescer.add("s", "two") == QUEUED
+    assert coalescer.add("s", "three") == QUEUED
+    assert coalescer.pending() == 2
+    assert coalescer.take("s") == ["two", "three"]
+    assert coalescer.take("s") is None
+    # Ownership was given up, so the next message starts a new owner
+    assert coalescer.add("s", "four") == OWNER
+
+
+def test_coalescer_refuses_past_max_messages():
+    coalescer = MessageCoalescer(max_messages=2)
+    assert coalescer.add("s", "one") == OWNER
+    assert coalescer.add("s", "two") == QUEUED
+    assert coalescer.add("s", "three") == FULL
+    assert coalescer.add("other", "hello") == OWNER
+
+
+def test_coalescer_waits_out_the_window_before_each_round():
+    slept = []
+    coalescer = MessageCoalescer(window=0.25, sleep=slept.append)
+    coalescer.add("s", "one")
+    coalescer.take("s")
+    assert slept == [0.25]
+
+
+def test_coalescer_release_drops_waiting_messages():
+    coalescer = MessageCoalescer()
+    coalescer.add("s", "one")
+    coalescer.add("s", "two")
+    assert coalescer.release("s") == ["one", "two"]
+    assert coalescer.pending() == 0
+    assert coalescer.add("s", "three") == OWNER
+
+
+def test_inflight_limit_refuses_past_limit_until_released():
+    limit = InflightLimit(2)
+    assert limit.acquire()
+    assert limit.acquire()
+    assert not limit.acquire()
+    limit.release()
+    assert limit.acquire()
+    assert limit.count == 2
+
+
+def test_inflight_limit_zero_is_unbounded():
+    limit = InflightLimit(0)
+    assert all(limit.acquire() for _ in range(1000))
+
+
+def test_inflight_limit_is_released_across_threads():
+    limit = InflightLimit(4)
+    admitted = []
+
+    def worker():
+        for _ in range(1000):
+            if limit.acquire():
+                admitted.append(1)
+                limit.release()
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert limit.count == 0
+    assert admitted
@@ -0,0 +1,159 @@
+import threading
+import time
+
+import pytest
+
+from batching import BatchScheduler, RowStreamers
+from deadlines import Deadline, DeadlineExceeded
+
+
+class FakeModel:
+    """process_batch stand-in: upper-cases prompts and records every batch it runs"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, prompts, key, deadlines, streamers):
+        self.release.wait()
+        self.batches.append((key, list(prompts)))
+        time.sleep(self.delay)
+        return [f"{key}:{prompt.upper()}" for prompt in prompts]
+
+
+@pytest.fixture
+def model():
+    return FakeModel()
+
+
+def start(model, **options):
+    options.setdefault("batch_window", 0.05)
+    return BatchScheduler(model, **options).start()
+
+
+def test_each_future_gets_its_own_result(model):
+    scheduler = start(model)
+    futures = [scheduler.submit(f"p{i}", key="a") for i in range(6)]
+    assert [future.result(timeout=5) for future in futures] == [f"a:P{i}" for i in range(6)]
+    scheduler.stop(timeout=5)
+    assert sum(len(prompts) for _, prompts in model.batches) == 6
+
+
+def test_concurrent_prompts_share_a_batch(model):
+    scheduler = start(model, max_batch_size=4, batch_window=0.2)
+    futures = [scheduler.submit(f"p{i}", key="a") for i in range(4)]
+    for future in futures:
+        future.result(timeout=5)
+    scheduler.stop(timeout=5)
+    assert model.batches == [("a", ["p0", "p1", "p2", "p3"])]
+
+
+def test_batches_are_capped_at_max_batch_size(model):
+    model.release.clear()
+    scheduler = start(model, max_batch_size=3)
+    futures = [scheduler.submit(f"p{i}", key="a") for i in range(7)]
+    model.release.set()
+    for future in futures:
+        future.result(timeout=5)
+    scheduler.stop(timeout=5)
+    assert all(len(prompts) <= 3 for _, prompts in model.batches)
+
+
+def test_batches_group_prompts_by_key(model):
+    model.release.clear()
+    scheduler = start(model, max_batch_size=8, batch_window=0.1)
+    futures = [scheduler.submit(f"p{i}", key="ab"[i % 2]) for i in range(6)]
+    model.release.set()
+    results = [future.result(timeout=5) for future in futures]
+    scheduler.stop(timeout=5)
+    assert results == [f"{'ab'[i % 2]}:P{i}" for i in range(6)]
+    for key, prompts in model.batches:
+        assert all(int(prompt[1:]) % 2 == (key == "b") for prompt in prompts)
+    # Prompts for the other key were carried over, not lost or reordered
+    assert [prompt for key, prompts in model.batches if key == "b" for prompt in prompts] == ["p1", "p3", "p5"]
+
+
+def test_expired_requests_are_dropped_before_their_batch(model):
+    scheduler = start(model)
+    expired = Deadline(10)
+    expired.cancel()
+    dropped = scheduler.submit("late", key="a", deadline=expired)
+    kept = scheduler.submit("on time", key="a", deadline=Deadline(10))
+    assert kept.result(timeout=5) == "a:ON TIME"
+    with pytest.raises(DeadlineExceeded):
+        dropped.result(timeout=5)
+    scheduler.stop(timeout=5)
+    assert all("late" not in prompts for _, prompts in model.batches)
+
+
+def test_a_failed_batch_fails_its_requests_and_ends_their_streams():
+    class Streamer:
+        ended = False
+
+        def end(self):
+            self.ended = True
+
+    def broken(prompts, key, deadlines, streamers):
+        raise RuntimeError("out of memory")
+
+    scheduler = BatchScheduler(broken).start()
+    streamer = Streamer()
+    future = scheduler.submit("p", streamer=streamer)
+    with pytest.raises(RuntimeError):
+        future.result(timeout=5)
+    scheduler.stop(timeout=5)
+    assert streamer.ended
+
+
+def test_wrong_result_count_fails_the_batch():
+    scheduler = BatchScheduler(lambda prompts, key, deadlines, streamers: []).start()
+    with pytest.raises(RuntimeError):
+        scheduler.submit("p").result(timeout=5)
+    scheduler.stop(timeout=5)
+
+
+def test_stats_count_batches_and_requests(model):
+    scheduler = start(model, batch_window=0.2)
+    for future in [scheduler.submit(f"p{i}", key="a") for i in range(3)]:
+        future.result(timeout=5)
+    scheduler.stop(timeout=5)
+    stats = scheduler.stats()
+    assert stats["requests"] == 3
+    assert stats["batches"] == len(model.batches)
+    assert stats["queue_depth"] == 0
+
+
+class Rows:
+    """A (batch,) or (batch, length) token array like the ones model.generate streams"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.shape = (len(rows), len(rows[0])) if isinstance(rows[0], list) else (len(rows),)
+
+    def __getitem__(self, index):
+        return self.rows[index]
+
+
+def test_row_streamers_split_batched_tokens_by_row():
+    class Streamer:
+        def __init__(self):
+            self.tokens = []
+            self.ended = False
+
+        def put(self, value):
+            self.tokens.extend(value)
+
+        def end(self):
+            self.ended = True
+
+    first, second = Streamer(), Streamer()
+    streamers = RowStreamers([first, None, second])
+    streamers.put(Rows([[1], [1], [1]]))
+    streamers.put(Rows([5, 6, 7]))
+    streamers.put(Rows([8, 9, 2]))
+    streamers.end()
+    assert first.tokens == [1, 5, 8]
+    assert second.tokens == [1, 7, 2]
+    assert first.ended and second.ended
@@ -0,0 +1,90 @@
+from collections import deque
+from types import SimpleNamespace
+
+from context_builder import ContextBuilder
+
+EOS = 0
+
+
+class CharTokenizer:
+    """One token per character, with </s> (0) appended like BlenderBot's tokenizer"""
+
+    def num_special_tokens_to_add(self):
+        return 1
+
+    def encode(self, text, add_special_tokens=False):
+        ids = [ord(char) for char in text]
+        return self.build_inputs_with_special_tokens(ids) if add_special_tokens else ids
+
+    def build_inputs_with_special_tokens(self, ids):
+        return list(ids) + [EOS]
+
+
+def make_session(*turns):
+    return SimpleNamespace(history=deque(turns), token_cache={})
+
+
+def text(ids):
+    assert ids[-1] == EOS
+    return "".join(chr(token) for token in ids[:-1])
+
+
+def test_turns_are_joined_with_the_separator():
+    builder = ContextBuilder(CharTokenizer(), "You are Rick.", max_tokens=100)
+    input_ids, used = builder.build(make_session("Hi", "What's up", "Tell me about portals"))
+    assert used == 3
+    assert text(input_ids) == " You are Rick.\n Hi\n What's up\n Tell me about portals"
+
+
+def test_ids_match_tokenizing_the_joined_prompt():
+    tokenizer = CharTokenizer()
+    builder = ContextBuilder(tokenizer, "You are Rick.", max_tokens=100, separator=" </s> <s>")
+    turns = ["Hi", "What's up"]
+    input_ids, _ = builder.build(make_session(*turns))
+    assert input_ids == tokenizer.encode(" </s> <s>".join(" " + turn for turn in ["You are Rick."] + turns),
+                                         add_special_tokens=True)
+
+
+def test_a_single_turn_without_a_preamble_has_no_separator():
+    builder = ContextBuilder(CharTokenizer(), "", max_tokens=100)
+    assert text(builder.build(make_session("Hi"))[0]) == " Hi"
+
+
+def test_budget_keeps_the_newest_turns_and_counts_separators():
+    # " P\n" + " efgh" + "\n" + " ab" + "\n" + " cd" + </s> is exactly 17 tokens
+    builder = ContextBuilder(CharTokenizer(), "P", max_tokens=17)
+    input_ids, used = builder.build(make_session("efgh", "ab", "cd"))
+    assert text(input_ids) == " P\n efgh\n ab\n cd"
+    assert used == 3
+    assert len(input_ids) == 17
+
+    # One token less: " efgh" alone would fit, but not with its separator
+    builder = ContextBuilder(CharTokenizer(), "P", max_tokens=16)
+    input_ids, used = builder.build(make_session("efgh", "ab", "cd"))
+    assert text(input_ids) == " P\n ab\n cd"
+    assert used == 2
+
+
+def test_a_newest_turn_over_budget_keeps_its_last_tokens():
+    builder = ContextBuilder(CharTokenizer(), "P", max_tokens=10)
+    input_ids, used = builder.build(make_session("old", "abcdefghijklmnop"))
+    assert used == 1
+    assert text(input_ids) == " P\nklmnop"
+    assert len(input_ids) == 10
+
+
+def test_preamble_takes_at_most_half_the_budget_with_its_separator():
+    builder = ContextBuilder(CharTokenizer(), "x" * 50, max_tokens=21)
+    assert len(builder.preamble_ids) == 10
+    assert builder.preamble_ids[-1] == ord("\n")
+
+
+def test_turn_ids_are_cached_and_pruned_with_the_history():
+    builder = ContextBuilder(CharTokenizer(), "P", max_tokens=100)
+    session = make_session("one", "two")
+    builder.build(session)
+    assert set(session.token_cache) == {"one", "two"}
+    session.history.popleft()
+    session.history.append("three")
+    builder.build(session)
+    assert set(session.token_cache) == {"two", "three"}
@@ -0,0 +1,84 @@
+from degraded_mode import DegradedMode
+
+
+def make_mode(backlog, cpu=None, **settings):
+    options = dict(enter_queue_depth=32, exit_queue_depth=8, enter_cpu=0.95, exit_cpu=0.8, min_seconds=10,
+                   check_interval=1.0)
+    options.update(settings)
+    cpu = cpu if cpu is not None else [0.5]
+    return DegradedMode(cpu_usage=lambda: cpu[0], **options).watch(lambda: backlog[0])
+
+
+def run(mode, backlog, profile):
+    """Feed one backlog sample per second; returns whether the mode was on after each"""
+    states = []
+    for step, depth in enumerate(profile):
+        backlog[0] = depth
+        states.append(mode.active(now=float(step)))
+    return states
+
+
+def test_switches_in_at_the_enter_depth():
+    backlog = [0]
+    states = run(make_mode(backlog), backlog, [0, 16, 31, 32])
+    assert states == [False, False, False, True]
+
+
+def test_stays_on_until_the_backlog_drains_below_the_exit_depth():
+    backlog = [0]
+    # Well past min_seconds, but the backlog is between the thresholds
+    states = run(make_mode(backlog), backlog, [40] + [20] * 15 + [8])
+    assert all(states[:-1])
+    assert states[-1] is False
+
+
+def test_stays_on_for_min_seconds():
+    backlog = [0]
+    states = run(make_mode(backlog), backlog, [40] + [0] * 12)
+    assert states[:10] == [True] * 10
+    assert states[10] is False
+
+
+def test_does_not_flap_around_the_enter_depth():
+    backlog = [0]
+    states = run(make_mode(backlog), backlog, [32, 31, 33, 30, 32, 29] * 4)
+    assert all(states)
+
+
+def test_busy_cpu_needs_a_backlog():
+    backlog, cpu = [0], [1.0]
+    mode = make_mode(backlog, cpu)
+    assert run(mode, backlog, [0, 8]) == [False, False]
+    backlog[0] = 9
+    assert mode.active(now=2.0)
+
+
+def test_busy_cpu_keeps_it_on():
+    backlog, cpu = [0], [0.9]
+    mode = make_mode(backlog, cpu)
+    assert run(mode, backlog, [40] + [0] * 15)[-1] is True
+    cpu[0] = 0.5
+    assert not mode.active(now=16.0)
+
+
+def test_samples_at_most_once_per_check_interval():
+    calls = []
+    mode = DegradedMode(enter_queue_depth=1, check_interval=1.0, cpu_usage=lambda: 0.0)
+    mode.watch(lambda: calls.append(1) or 5)
+    for now in (0.0, 0.2, 0.9, 1.0, 1.5):
+        mode.active(now=now)
+    assert len(calls) == 2
+
+
+def test_reports_each_switch():
+    backlog, changes = [0], []
+    mode = make_mode(backlog, min_seconds=1)
+    mode.on_change = lambda engaged, reason: changes.append(engaged)
+    run(mode, backlog, [40, 40, 0, 0, 40])
+    assert changes == [True, False, True]
+
+
+def test_sums_all_watched_queues():
+    mode = DegradedMode(enter_queue_depth=10, cpu_usage=lambda: 0.0)
+    mode.watch(lambda: 6).watch(lambda: 4)
+    assert mode.active(now=0.0)
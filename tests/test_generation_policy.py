@@ -0,0 +1,46 @@
+import pytest
+
+from generation_policy import GenerationPolicy
+from intent import classify
+from rick_config import CONFIG
+
+
+@pytest.fixture
+def policy():
+    return GenerationPolicy(CONFIG["generation"])
+
+
+@pytest.mark.parametrize("message, tier", [
+    ("How does the portal gun work?", "quality"),
+    ("What do you think of Jerry?", "fast"),
+    ("What is the meaning of life?", "standard"),
+    ("Tell me a story about the garage", "quality"),
+])
+def test_tier_for_message(policy, message, tier):
+    assert policy.select(classify(message)) == tier
+
+
+def test_unclassified_messages_keep_the_original_beam_sampling(policy):
+    params = policy.params(policy.select(classify("Tell me a story")))
+    assert params["num_beams"] == 4
+    assert params["do_sample"] is True
+
+
+def test_unknown_tier_is_rejected():
+    config = dict(CONFIG["generation"], default_tier="turbo")
+    with pytest.raises(ValueError):
+        GenerationPolicy(config)
+
+
+def test_streaming_never_uses_beams(policy):
+    assert all(policy.stream_params(tier)["num_beams"] == 1 for tier in policy.tiers)
+
+
+def test_streaming_drops_beam_only_settings_and_keeps_sampling(policy):
+    assert "early_stopping" not in policy.stream_params("standard")
+    quality = policy.stream_params("quality")
+    assert quality["do_sample"] is True
+    assert quality["top_p"] == policy.params("quality")["top_p"]
+    # The tier's own parameters are left alone for /chat
+    assert policy.params("standard")["early_stopping"] is True
+    assert policy.params("quality")["num_beams"] == 4
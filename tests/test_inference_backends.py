@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+import inference_backends
+import inference_profile
+from inference_backends import ONNX_DIR, ONNX_GRAPHS, export_onnx
+
+
+@pytest.fixture
+def fake_export(monkeypatch):
+    """export_onnx without torch: a fixed weights signature and an _export that writes placeholder graphs"""
+    signature = {"weights": "model.safetensors", "size": 1}
+    exports = []
+
+    def write_graphs(model, paths):
+        exports.append(model)
+        for path in paths.values():
+            with open(path, "w") as f:
+                f.write(model)
+
+    monkeypatch.setattr(inference_profile, "weights_signature", lambda model_dir: dict(signature))
+    monkeypatch.setattr(inference_backends, "_export", write_graphs)
+    return signature, exports
+
+
+def test_export_onnx_exports_once_and_reuses_it(tmp_path, fake_export):
+    _, exports = fake_export
+    paths = export_onnx(str(tmp_path), lambda: "v1")
+    assert set(paths) == set(ONNX_GRAPHS)
+    assert all(open(path).read() == "v1" for path in paths.values())
+    assert export_onnx(str(tmp_path), lambda: "v2") == paths
+    assert exports == ["v1"]
+    # The export was built in a temp directory and renamed into place
+    assert sorted(os.listdir(tmp_path)) == [ONNX_DIR, ONNX_DIR + ".lock"]
+
+
+def test_export_onnx_rebuilds_when_the_weights_change(tmp_path, fake_export):
+    signature, exports = fake_export
+    export_onnx(str(tmp_path), lambda: "v1")
+    signature["size"] = 2
+    paths = export_onnx(str(tmp_path), lambda: "v2")
+    assert exports == ["v1", "v2"]
+    assert all(open(path).read() == "v2" for path in paths.values())
+
+
+def test_export_onnx_redoes_an_interrupted_export(tmp_path, fake_export):
+    _, exports = fake_export
+    paths = export_onnx(str(tmp_path), lambda: "v1")
+    os.remove(paths["decoder_init"])
+    export_onnx(str(tmp_path), lambda: "v2")
+    assert exports == ["v1", "v2"]
@@ -0,0 +1,54 @@
+import pytest
+
+from intent import FEATURE_KEYWORDS, IntentIndex, classify, classify_batch
+
+# (text, features that must be present, features that must be absent)
+CASES = [
+    ("Are you young?", set(), {"question"}),
+    ("That's a good point", set(), {"mood_question"}),
+    ("Why is the sky blue?", {"question", "asks_explanation", "mood_question"}, set()),
+    ("what's up", {"question"}, set()),
+    ("whatever", set(), {"question", "asks_explanation"}),
+    ("How come you're so drunk?", {"mood_question", "mood_drunk"}, set()),
+    ("come how", set(), {"mood_question"}),
+    ("It's basic stuff, everyone knows that", {"mood_frustrated"}, set()),
+    ("I invented a new portal gun", {"mood_excited", "topic_multiverse", "mentions_science"}, set()),
+    ("Tell me about Morty's family", {"topic_family"}, set()),
+    ("Dimensions and space", {"topic_multiverse", "mentions_science"}, set()),
+    ("Mathematics is hard", {"topic_science"}, set()),
+    ("My feelings are normal", {"mood_dismissive"}, set()),
+    ("Sometimes I think", set(), {"topic_multiverse"}),
+    ("How does the portal gun work?", {"topic_technical"}, {"topic_personal"}),
+    ("What do you think of Jerry?", {"topic_personal"}, {"topic_technical"}),
+    ("Is there a god?", {"topic_philosophical"}, {"topic_personal"}),
+    ("That's a good idea", set(), {"topic_philosophical"}),
+    ("", set(), set(FEATURE_KEYWORDS)),
+]
+
+
+@pytest.mark.parametrize("text, present, absent", CASES)
+def test_classify(text, present, absent):
+    names = set(classify(text).names())
+    assert present <= names
+    assert not absent & names
+
+
+def test_whole_words_prefixes_and_phrases():
+    index = IntentIndex({"word": ["god"], "prefix": ["invent*"], "phrase": ["how come"]})
+    assert "word" in index.classify("Oh god")
+    assert "word" not in index.classify("good godlike goods")
+    assert "prefix" in index.classify("Inventions!")
+    assert "prefix" not in index.classify("reinvent")
+    assert "phrase" in index.classify("HOW, come?")
+    assert "phrase" not in index.classify("come how")
+
+
+def test_batch_matches_single():
+    texts = [text for text, _, _ in CASES] * 2
+    assert [intents.mask for intents in classify_batch(texts)] == [classify(text).mask for text in texts]
+
+
+def test_memo_does_not_change_results():
+    index = IntentIndex(FEATURE_KEYWORDS)
+    first = [index.classify(text).mask for text, _, _ in CASES]
+    assert [index.classify(text).mask for text, _, _ in CASES] == first
@@ -0,0 +1,70 @@
+import json
+import logging
+import sys
+
+import pytest
+
+from log_format import JsonFormatter, KeyValueFormatter, configure_logging, record_fields
+from intent import classify
+from rick_config import CONFIG
+from stub_model import StubEngine
+
+QUESTION = "How does the portal gun work?"
+
+
+def make_record(**extra):
+    logger = logging.getLogger("rick.test")
+    return logger.makeRecord(logger.name, logging.DEBUG, __file__, 1, "Reply %s", ("ready",), None, extra=extra)
+
+
+def test_only_extra_attributes_are_fields():
+    assert record_fields(make_record()) == {}
+    assert record_fields(make_record(session="s1", tier="quality")) == {"session": "s1", "tier": "quality"}
+
+
+def test_key_value_lines_end_with_the_fields():
+    line = KeyValueFormatter().format(make_record(session="s 1", prompt_tokens=12, stages_ms={"context": 1.5}))
+    assert line.endswith('DEBUG rick.test: Reply ready session="s 1" prompt_tokens=12 stages_ms={"context": 1.5}')
+
+
+def test_json_records_carry_message_and_fields():
+    entry = json.loads(JsonFormatter().format(make_record(session="s1", stages_ms={"rickify": 0.2})))
+    assert entry["level"] == "DEBUG"
+    assert entry["logger"] == "rick.test"
+    assert entry["message"] == "Reply ready"
+    assert entry["session"] == "s1"
+    assert entry["stages_ms"] == {"rickify": 0.2}
+
+
+def test_json_records_include_the_exception():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = logging.getLogger("rick.test").makeRecord("rick.test", logging.ERROR, __file__, 1, "failed", (),
+                                                          sys.exc_info())
+    entry = json.loads(JsonFormatter().format(record))
+    assert "ValueError: boom" in entry["exception"]
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        configure_logging("INFO", "xml")
+
+
+def test_each_reply_logs_its_session_tier_tokens_and_stages(tmp_path, caplog):
+    config = dict(CONFIG,
+                  batching=dict(CONFIG["batching"], enabled=False),
+                  cache=dict(CONFIG["cache"], enabled=False),
+                  sessions=dict(CONFIG["sessions"], backend="memory"),
+                  degraded_mode=dict(CONFIG["degraded_mode"], enabled=False))
+    engine = StubEngine(config, base_dir=str(tmp_path), batch_latency=0, token_latency=0)
+    engine.load()
+    with caplog.at_level(logging.DEBUG, logger="rick_engine"):
+        engine.generate("s1", QUESTION)
+    engine.close()
+    [record] = [record for record in caplog.records if record.getMessage() == "Reply ready"]
+    assert record.session == "s1"
+    assert record.tier == engine.policy.select(classify(QUESTION))
+    assert record.outcome == "model"
+    assert record.prompt_tokens > 0
+    assert set(record.stages_ms) == {"context", "model", "improve", "rickify"}
@@ -0,0 +1,43 @@
+from metrics import MetricsRegistry, REGISTRY
+from rick_config import CONFIG
+from stub_model import StubEngine
+
+
+def test_callback_reads_when_scraped():
+    registry = MetricsRegistry()
+    values = [1]
+    registry.callback("rick_test_value", "A value", lambda: values[-1])
+    values.append(5)
+    assert "rick_test_value 5.0" in registry.render()
+
+
+def test_registering_a_callback_again_replaces_it():
+    registry = MetricsRegistry()
+    first = registry.callback("rick_test_value", "A value", lambda: 1)
+    second = registry.callback("rick_test_value", "A value", lambda: 2)
+    assert first is second
+    assert "rick_test_value 2.0" in registry.render()
+    assert "rick_test_value 1.0" not in registry.render()
+
+
+def test_other_metrics_are_shared_by_name():
+    registry = MetricsRegistry()
+    registry.counter("rick_test_total", "A counter").inc()
+    registry.counter("rick_test_total", "A counter").inc()
+    assert registry.counter("rick_test_total", "A counter").value() == 2
+
+
+def test_engine_metrics_follow_the_newest_engine(tmp_path):
+    config = dict(CONFIG,
+                  batching=dict(CONFIG["batching"], enabled=False),
+                  sessions=dict(CONFIG["sessions"], backend="memory"))
+    old = StubEngine(config, base_dir=str(tmp_path / "old"))
+    new = StubEngine(config, base_dir=str(tmp_path / "new"))
+    new.load()
+    new.remember_turn("s1", "Hello")
+    new.remember_turn("s2", "Hi")
+    rendered = REGISTRY.render()
+    assert "rick_active_sessions 2.0" in rendered
+    assert "rick_model_ready 1.0" in rendered
+    old.close()
+    new.close()
@@ -0,0 +1,92 @@
+import json
+import time
+
+import pytest
+
+import response_cache
+from response_cache import ResponseCache, cache_fingerprint
+
+PARAMS = {"do_sample": False, "max_length": 60}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_hit_after_put_with_the_same_normalized_prompt():
+    cache = ResponseCache()
+    cache.put("How does the portal gun work?", PARAMS, "It folds space.")
+    assert cache.get("  how does the PORTAL gun   work", PARAMS) == "It folds space."
+    assert cache.stats()["hits"] == 1
+
+
+def test_miss_for_another_prompt_or_other_parameters():
+    cache = ResponseCache()
+    cache.put("How does the portal gun work?", PARAMS, "It folds space.")
+    assert cache.get("Who is Jerry?", PARAMS) is None
+    assert cache.get("How does the portal gun work?", dict(PARAMS, do_sample=True)) is None
+    assert cache.stats()["misses"] == 2
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = ResponseCache(ttl=60)
+    cache.put("hello there", PARAMS, "What's up")
+    clock[0] += 59
+    assert cache.get("hello there", PARAMS) == "What's up"
+    clock[0] += 2
+    assert cache.get("hello there", PARAMS) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted_at_the_entry_cap():
+    cache = ResponseCache(max_entries=2)
+    cache.put("first", PARAMS, "1")
+    cache.put("second", PARAMS, "2")
+    cache.get("first", PARAMS)
+    cache.put("third", PARAMS, "3")
+    assert cache.get("second", PARAMS) is None
+    assert cache.get("first", PARAMS) == "1"
+    assert cache.get("third", PARAMS) == "3"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_byte_cap_evicts_and_skips_oversized_entries():
+    cache = ResponseCache(max_entries=100, max_bytes=200)
+    for i in range(5):
+        cache.put(f"prompt {i}", PARAMS, "x" * 40)
+    assert cache.stats()["bytes"] <= 200
+    assert cache.get("prompt 0", PARAMS) is None
+    assert cache.get("prompt 4", PARAMS) == "x" * 40
+    cache.put("huge", PARAMS, "x" * 500)
+    assert cache.get("huge", PARAMS) is None
+
+
+def test_persisted_entries_load_under_the_same_fingerprint(tmp_path):
+    path = str(tmp_path / "cache.json")
+    fingerprint = cache_fingerprint(model="blenderbot", backend="eager", preamble="You are Rick.")
+    cache = ResponseCache(persist_path=path, fingerprint=fingerprint)
+    cache.put("hello there", PARAMS, "What's up")
+    cache.save()
+    assert ResponseCache(persist_path=path, fingerprint=fingerprint).get("hello there", PARAMS) == "What's up"
+
+
+@pytest.mark.parametrize("setting", ["model", "backend", "preamble"])
+def test_persisted_entries_are_dropped_when_the_model_setup_changes(tmp_path, setting):
+    path = str(tmp_path / "cache.json")
+    settings = {"model": "blenderbot", "backend": "eager", "preamble": "You are Rick."}
+    cache = ResponseCache(persist_path=path, fingerprint=cache_fingerprint(**settings))
+    cache.put("hello there", PARAMS, "What's up")
+    cache.save()
+    changed = cache_fingerprint(**dict(settings, **{setting: "something else"}))
+    reloaded = ResponseCache(persist_path=path, fingerprint=changed)
+    assert reloaded.get("hello there", PARAMS) is None
+    assert reloaded.stats()["entries"] == 0
+
+
+def test_files_without_a_fingerprint_are_dropped(tmp_path):
+    path = tmp_path / "cache.json"
+    path.write_text(json.dumps({"hello there\x00{}": ["What's up", time.time()]}))
+    assert ResponseCache(persist_path=str(path), fingerprint="abc").stats()["entries"] == 0
@@ -0,0 +1,81 @@
+import random
+
+import pytest
+
+from intent import IntentIndex
+from rick_config import RESPONSE_TABLES
+from rick_processor import REPLY_TABLES
+from response_tables import AliasTable, ResponseTable
+
+PICKS = 100000
+TOLERANCE = 0.02
+
+
+def frequencies(picker, rng, picks=PICKS):
+    counts = {}
+    for _ in range(picks):
+        reply = picker.pick(rng)
+        counts[reply] = counts.get(reply, 0) + 1
+    return {reply: count / picks for reply, count in counts.items()}
+
+
+def test_alias_table_follows_weights():
+    table = AliasTable(["a", "b", "c", "d"], [1, 2, 3, 10])
+    seen = frequencies(table, random.Random(0))
+    for item, weight in zip("abcd", [1, 2, 3, 10]):
+        assert seen[item] == pytest.approx(weight / 16, abs=TOLERANCE)
+
+
+def test_alias_table_single_item():
+    assert AliasTable(["only"], [5]).pick(random.Random(0)) == "only"
+
+
+@pytest.mark.parametrize("items, weights", [([], []), (["a", "b"], [1, 0]), (["a"], [-1])])
+def test_alias_table_rejects_bad_weights(items, weights):
+    with pytest.raises(ValueError):
+        AliasTable(items, weights)
+
+
+@pytest.mark.parametrize("name, index", [(name, index) for name, categories in RESPONSE_TABLES.items()
+                                         for index in range(len(categories))])
+def test_configured_replies_follow_their_weights(name, index):
+    category = RESPONSE_TABLES[name][index]
+    responses = [(item, 1) if isinstance(item, str) else tuple(item) for item in category["responses"]]
+    total = sum(weight for _, weight in responses)
+    seen = frequencies(REPLY_TABLES[name].pickers[index], random.Random(index))
+    for text, weight in responses:
+        assert seen.get(text, 0.0) == pytest.approx(weight / total, abs=TOLERANCE)
+
+
+@pytest.mark.parametrize("message, category", [
+    ("How do portals work across dimensions?", "multiverse"),
+    ("Explain the physics behind that", "science"),
+    ("What do you think about Jerry and the family?", "family"),
+    ("Tell me something interesting about your garage", "general"),
+])
+def test_themed_categories(message, category):
+    themed = REPLY_TABLES["themed"]
+    assert themed.names[themed.category(message)] == category
+
+
+def test_categories_match_in_priority_order():
+    table = ResponseTable("test", [
+        {"name": "first", "keywords": ["portal*"], "responses": ["1"]},
+        {"name": "second", "keywords": ["portal gun"], "responses": ["2"]},
+        {"name": "rest", "responses": ["3"]},
+    ], intent_index=IntentIndex({"unused": ["x"]}))
+    assert table.pick("where is my portal gun") == "1"
+    assert table.pick("nothing to see here") == "3"
+
+
+def test_last_category_is_the_default_without_a_catch_all():
+    table = ResponseTable("test", [
+        {"name": "science", "intents": ["topic_science"], "responses": ["science"]},
+        {"name": "other", "keywords": ["garage"], "responses": ["other"]},
+    ])
+    assert table.pick("hello there") == "other"
+
+
+def test_unknown_intent_features_are_rejected():
+    with pytest.raises(ValueError):
+        ResponseTable("test", [{"name": "bad", "intents": ["topic_nope"], "responses": ["x"]}])
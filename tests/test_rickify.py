@@ -0,0 +1,51 @@
+import random
+import re
+
+import pytest
+
+import rick_processor
+from benchmarks.bench_rickify import legacy_replace_phrases, make_text
+from rick_processor import RICK_REPLACEMENTS, RickPersonality, replace_phrases, rickify_response
+
+
+def legacy_add_stutters(text, stutter_probability, rng=random):
+    """add_stutters before its letter set and "I" pattern were precompiled"""
+    words = text.split()
+    for i, word in enumerate(words):
+        if len(word) > 2 and word[0].lower() in "abcdefgw" and rng.random() < stutter_probability:
+            words[i] = f"{word[0]}-{word[0]}-{word}"
+    text = " ".join(words)
+    return re.sub(r'\bI\b', lambda x: "I-I-I" if rng.random() < stutter_probability else "I", text)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_replace_phrases_matches_the_per_phrase_loop(seed):
+    text = make_text(200, seed)
+    assert replace_phrases(text) == legacy_replace_phrases(text)
+
+
+@pytest.mark.parametrize("transform", [str.upper, str.lower, str.title])
+def test_replace_phrases_ignores_case(transform):
+    text = transform(make_text(200, 0))
+    assert replace_phrases(text) == legacy_replace_phrases(text)
+
+
+@pytest.mark.parametrize("phrase", list(RICK_REPLACEMENTS))
+def test_each_phrase_is_replaced_as_a_whole_word_only(phrase):
+    text = f"{phrase}, said x{phrase}x."
+    assert replace_phrases(text) == legacy_replace_phrases(text)
+
+
+def rickify_replies(seed):
+    personality = RickPersonality(seed=seed)
+    texts = [make_text(words, seed) for words in (5, 40, 300)]
+    return [rickify_response(transform(text), personality)
+            for text in texts for transform in (str, str.upper, str.title)]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_seeded_rickify_response_matches_the_uncompiled_stages(seed, monkeypatch):
+    replies = rickify_replies(seed)
+    monkeypatch.setattr(rick_processor, "replace_phrases", legacy_replace_phrases)
+    monkeypatch.setattr(rick_processor, "add_stutters", legacy_add_stutters)
+    assert replies == rickify_replies(seed)
@@ -0,0 +1,44 @@
+import zlib
+
+import pytest
+
+from semantic_cache import HashedNgramEmbedder, SemanticCache, context_hash
+
+torch = pytest.importorskip("torch")
+
+
+def test_embedding_matches_per_feature_accumulation():
+    embedder = HashedNgramEmbedder(dimensions=64)
+    text = "What's the meaning of life, Rick? Life's meaning, what is it?"
+    expected = torch.zeros(64)
+    for feature, weight in embedder.features(text):
+        hashed = zlib.crc32(feature.encode("utf-8"))
+        expected[hashed % 64] += weight if hashed & 0x80000000 else -weight
+    expected /= expected.norm()
+    assert torch.allclose(embedder.embed(text), expected)
+
+
+def test_empty_message_embeds_to_zeros():
+    assert not HashedNgramEmbedder(dimensions=16).embed("").any()
+
+
+def test_paraphrase_hits_after_the_same_turns_only():
+    cache = SemanticCache(HashedNgramEmbedder(), threshold=0.8)
+    cache.put("whats the meaning of life", "standard", "42")
+    assert cache.get("what is the meaning of life?", "standard") == "42"
+    assert cache.get("what is the meaning of life?", "standard", context="Tell me about Jerry\nJerry is a loser") \
+        is None
+
+
+def test_entries_in_different_conversations_are_kept_apart():
+    cache = SemanticCache(HashedNgramEmbedder(), threshold=0.8)
+    cache.put("why?", "standard", "first", context="Portals\nThey bend space")
+    cache.put("why?", "standard", "second", context="Jerry\nHe's an idiot")
+    assert cache.get("why?", "standard", context="portals\nthey bend space.") == "first"
+    assert cache.get("why?", "standard", context="Jerry\nHe's an idiot") == "second"
+    assert cache.get("why?", "standard") is None
+
+
+def test_first_messages_share_a_context():
+    assert context_hash("") == context_hash("  ") == 0
+    assert context_hash("Hello\nHi") != 0
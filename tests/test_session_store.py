@@ -0,0 +1,129 @@
+import threading
+
+import pytest
+
+import session_store
+from session_store import MemorySessionStore, SQLiteSessionStore, create_session_store
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(session_store.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "sessions.db")
+
+
+def test_history_keeps_the_newest_turns():
+    store = MemorySessionStore(max_turns=3)
+    for turn in ["one", "two", "three", "four"]:
+        store.add_turn("s1", turn)
+    assert store.get_history("s1") == ["two", "three", "four"]
+
+
+def test_least_recently_used_session_is_evicted():
+    store = MemorySessionStore(max_sessions=2)
+    store.add_turn("a", "hi")
+    store.add_turn("b", "hi")
+    store.get("a")
+    store.add_turn("c", "hi")
+    assert "a" in store and "c" in store
+    assert "b" not in store
+    assert store.stats()["evicted_lru"] == 1
+
+
+def test_idle_sessions_expire(clock):
+    store = MemorySessionStore(idle_ttl=60)
+    store.add_turn("old", "hi")
+    clock[0] += 30
+    store.add_turn("recent", "hi")
+    clock[0] += 31
+    assert store.evict_expired() == 1
+    assert "old" not in store and "recent" in store
+    assert store.stats()["evicted_ttl"] == 1
+
+
+def test_clear_keeps_the_personality():
+    store = MemorySessionStore(personality_factory=lambda session_id: object())
+    personality = store.get("s1").personality
+    store.add_turn("s1", "hi")
+    store.clear("s1")
+    assert store.get_history("s1") == []
+    assert store.get("s1").personality is personality
+
+
+def test_snapshot_is_a_copy_taken_under_the_lock():
+    store = MemorySessionStore(max_turns=10)
+    store.add_turn("s1", "hi")
+    session, history = store.snapshot("s1")
+    store.add_turn("s1", "again")
+    assert history == ["hi"]
+    assert list(session.history) == ["hi", "again"]
+
+
+def test_snapshots_stay_whole_while_turns_are_added():
+    store = MemorySessionStore(max_turns=4)
+    done = threading.Event()
+
+    def writer():
+        for i in range(5000):
+            store.add_turn("s1", f"turn {i}")
+        done.set()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    while not done.is_set():
+        _, history = store.snapshot("s1")
+        # Copying a deque while another thread appends to it raises RuntimeError
+        numbers = [int(turn.split()[1]) for turn in history]
+        assert numbers == list(range(numbers[0], numbers[0] + len(numbers)))
+    thread.join()
+
+
+def test_sqlite_history_survives_a_restart(db_path):
+    store = SQLiteSessionStore(db_path, max_turns=2)
+    for turn in ["one", "two", "three"]:
+        store.add_turn("s1", turn)
+    store.close()
+    reopened = SQLiteSessionStore(db_path, max_turns=2)
+    assert reopened.get_history("s1") == ["two", "three"]
+    reopened.close()
+
+
+def test_shared_sqlite_stores_see_each_others_turns(db_path):
+    first = SQLiteSessionStore(db_path, max_turns=5, shared=True)
+    second = SQLiteSessionStore(db_path, max_turns=5, shared=True)
+    first.add_turn("s1", "hello")
+    # Cache the session in the second store, then change it through the first
+    assert second.get_history("s1") == ["hello"]
+    first.add_turn("s1", "what's up")
+    assert second.get_history("s1") == ["hello", "what's up"]
+    second.add_turn("s1", "portals")
+    assert first.get_history("s1") == ["hello", "what's up", "portals"]
+    first.clear("s1")
+    assert second.get_history("s1") == []
+    first.close()
+    second.close()
+
+
+def test_unshared_sqlite_stores_keep_their_cached_copy(db_path):
+    first = SQLiteSessionStore(db_path, max_turns=5)
+    second = SQLiteSessionStore(db_path, max_turns=5)
+    first.add_turn("s1", "hello")
+    assert second.get_history("s1") == ["hello"]
+    first.add_turn("s1", "again")
+    assert second.get_history("s1") == ["hello"]
+    first.close()
+    second.close()
+
+
+def test_shared_sessions_need_sqlite(tmp_path):
+    with pytest.raises(ValueError):
+        create_session_store({"backend": "memory", "shared": True}, base_dir=str(tmp_path))
+    store = create_session_store({"backend": "sqlite", "shared": True}, base_dir=str(tmp_path))
+    assert isinstance(store, SQLiteSessionStore) and store.shared
+    store.close()
@@ -0,0 +1,82 @@
+import threading
+
+import pytest
+
+from deadlines import Deadline
+from intent import classify
+from rick_config import CONFIG
+from stub_model import StubEngine
+
+QUESTION = "How does the portal gun work?"
+
+
+def make_engine(tmp_path, batching=True):
+    config = dict(CONFIG,
+                  batching=dict(CONFIG["batching"], enabled=batching, mode="static"),
+                  cache=dict(CONFIG["cache"], enabled=False),
+                  sessions=dict(CONFIG["sessions"], backend="memory"),
+                  degraded_mode=dict(CONFIG["degraded_mode"], enabled=False),
+                  streaming=dict(CONFIG["streaming"], enabled=True))
+    engine = StubEngine(config, base_dir=str(tmp_path), batch_latency=0.01, token_latency=0.001)
+    engine.load()
+    return engine
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = make_engine(tmp_path)
+    yield engine
+    engine.close()
+
+
+def test_streamed_replies_go_through_the_batch_scheduler(engine):
+    replies = {}
+
+    def stream(session_id):
+        replies[session_id] = list(engine.stream(session_id, QUESTION, Deadline(10)))
+
+    threads = [threading.Thread(target=stream, args=(f"s{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(replies[f"s{i}"] for i in range(4))
+    assert engine.batch_scheduler.stats()["requests"] == 4
+
+
+def test_stream_keeps_the_tier_in_its_scheduler_key(engine):
+    keys = []
+    generate_batch = engine.generate_batch
+
+    def record(prompts, key=None, deadlines=None, streamers=None):
+        keys.append(key)
+        return generate_batch(prompts, key, deadlines, streamers)
+
+    engine.batch_scheduler.process_batch = record
+    list(engine.stream("s", QUESTION))
+    assert keys == [engine.policy.select(classify(QUESTION)) + ":stream"]
+
+
+def test_stream_is_shed_by_admission_control(engine):
+    for tier in engine.policy.tiers:
+        engine.batch_seconds[f"{tier}:stream"] = 100.0
+    pieces = list(engine.stream("s", QUESTION, Deadline(5)))
+    # A themed reply instead of the model's, and nothing was queued
+    assert len(pieces) == 1
+    assert engine.batch_scheduler.stats()["requests"] == 0
+
+
+def test_stream_without_batching(tmp_path):
+    engine = make_engine(tmp_path, batching=False)
+    pieces = list(engine.stream("s", QUESTION, Deadline(10)))
+    reply = " ".join(pieces)
+    assert reply
+    assert engine.session_store.get("s").history[-1]
+
+
+def test_expired_stream_is_dropped_from_the_queue(engine):
+    deadline = Deadline(10)
+    deadline.cancel()
+    pieces = list(engine.stream("s", QUESTION, deadline))
+    assert len(pieces) == 1
+    assert engine.batch_scheduler.stats()["requests"] == 0